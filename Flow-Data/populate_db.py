@@ -29,6 +29,7 @@ def seed_database():
     db.sponsors.delete_many({})
     db.scanevents.delete_many({})
     db.rewards.delete_many({})
+    db.counters.delete_many({})  # homepage totals; rebuilt from the new scans
 
     # 2. Generate 15 Sponsors (Stalls)
     print("Seeding Sponsors...")
@@ -218,11 +219,8 @@ def seed_database():
     ]
     db.rewards.insert_many(rewards)
 
-    # 7. Create indexes for performance
-    print("Creating indexes...")
-    db.scanevents.create_index([("sponsor_id", 1), ("timestamp", -1)])
-    db.scanevents.create_index([("student_id", 1)])
-    db.scanevents.create_index([("is_flash_sale", 1)])
+    # 7. Indexes are declared in backend/utils/indexes.py and applied when the
+    #    backend starts (or now: cd backend && python -m utils.indexes apply)
 
     print("✅ Database successfully seeded! Your Atlas cluster is locked and loaded.")
     print(f"   - {len(sponsors)} Sponsors")
@@ -2,9 +2,15 @@
 EventFlow – Centralized Mock Auth
 Accepts any token and returns a fixed user_id for testing.
 In production, decode a real JWT here.
+Admin endpoints are gated by a shared ADMIN_TOKEN and disabled without one.
 """
 
-from fastapi import Header
+import os
+import secrets
+
+from fastapi import Header, HTTPException
+
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
 
 
 async def get_current_user(
@@ -30,3 +36,16 @@ async def get_current_user_id(
     Returns the id string or None if not provided.
     """
     return x_user_id if x_user_id else None
+
+
+def is_admin(token: str | None) -> bool:
+    """Whether `token` is the configured admin token (always False when unset)."""
+    return bool(ADMIN_TOKEN) and bool(token) and secrets.compare_digest(token, ADMIN_TOKEN)
+
+
+async def require_admin(x_admin_token: str = Header(default="")) -> None:
+    """Admin-only dependency: 404 while admin access is disabled, 403 on a bad token."""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not is_admin(x_admin_token):
+        raise HTTPException(status_code=403, detail="Admin token required")
@@ -0,0 +1,90 @@
+"""
+EventFlow – Heatmap Payload Benchmark
+Bytes per tick on the /api/game/heatmap socket: the full JSON frame versus
+the delta protocol (binary count deltas, amortising the periodic keyframe),
+for a range of stall counts and per-tick churn. Every delta is decoded with
+the reference decoder and checked against the true counts.
+
+Run with: cd backend && python -m benchmarks.heatmap_payload
+"""
+
+from __future__ import annotations
+
+import json
+import random
+from datetime import datetime, timedelta, timezone
+
+from bson import ObjectId
+
+from utils.catalog import SponsorRecord
+from utils.heatmap import (
+    HEATMAP_WINDOW_MINUTES,
+    KEYFRAME_EVERY_TICKS,
+    HeatmapHub,
+    apply_delta,
+    build_heatmap,
+)
+from utils.serialization import dumps
+
+STALLS = (50, 200)
+CHANGED_PER_TICK = (2, 10, 50)
+TICKS = KEYFRAME_EVERY_TICKS * 5
+
+
+def _sponsors(n: int) -> list[SponsorRecord]:
+    return [
+        SponsorRecord(
+            {
+                "_id": ObjectId(),
+                "company_name": f"Sponsor Company {i}",
+                "map_location": {"x_coord": i % 20, "y_coord": i // 20},
+            }
+        )
+        for i in range(n)
+    ]
+
+
+def _run(n_stalls: int, changed: int) -> tuple[float, float]:
+    sponsors = _sponsors(n_stalls)
+    counts = {sp.id: random.randint(0, 40) for sp in sponsors}
+    hub = HeatmapHub()
+    now = datetime(2026, 3, 1, 9, tzinfo=timezone.utc)
+    client: list[int] = []
+    json_bytes = delta_bytes = 0
+
+    for _ in range(TICKS):
+        for sp in random.sample(sponsors, min(changed, n_stalls)):
+            counts[sp.id] = max(0, counts[sp.id] + random.choice((-3, -1, 1, 2, 5)))
+        snapshot = [
+            {"sponsor": sp, "counts": {HEATMAP_WINDOW_MINUTES: counts[sp.id]}} for sp in sponsors
+        ]
+        heatmap = build_heatmap(snapshot)
+        now += timedelta(seconds=30)
+
+        json_bytes += len(dumps({"heatmap": heatmap, "timestamp": now.isoformat()}))
+        frame = hub._encode_delta(snapshot, heatmap, now)
+        if isinstance(frame, str):
+            delta_bytes += len(frame.encode())
+            client = json.loads(frame)["counts"]
+        else:
+            delta_bytes += len(frame)
+            apply_delta(client, frame)
+        assert client == [counts[sp.id] for sp in sponsors], "delta decode mismatch"
+
+    return json_bytes / TICKS, delta_bytes / TICKS
+
+
+def main() -> None:
+    random.seed(7)
+    print(f"{'stalls':>6}  {'changed/tick':>12}  {'json B/tick':>11}  {'delta B/tick':>12}  {'ratio':>6}")
+    for n_stalls in STALLS:
+        for changed in CHANGED_PER_TICK:
+            json_avg, delta_avg = _run(n_stalls, changed)
+            print(
+                f"{n_stalls:>6}  {changed:>12}  {json_avg:>11,.0f}  {delta_avg:>12,.0f}  "
+                f"{json_avg / delta_avg:>5.1f}×"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,416 @@
+"""
+EventFlow – Load Harness
+Drives a running backend over HTTP/WebSocket with the traffic of a busy
+event, all scenarios at once for --duration seconds:
+
+  scan bursts     – workers firing bursts of /api/game/scan, mostly at a few
+                    hot stalls (the crowding the scan path has to absorb)
+  polling         – clients refreshing /api/game/leaderboard and /api/game/stalls
+  redeem storms   – periodic waves of concurrent /api/store/redeem for the
+                    same reward (idempotency keys, some retried)
+  heatmap         – hundreds of /api/game/heatmap subscribers held open
+                    (half on the delta protocol)
+
+and writes throughput, p50/p95/p99 latency and error rates per endpoint,
+plus the server's own /metrics, to a JSON report.
+
+Against a running server (stalls, users and rewards are discovered via the API):
+    cd backend && python -m benchmarks.load --base-url http://localhost:8000
+
+Against a local mongod – seeds a scratch database, starts its own uvicorn
+on it and drops the database afterwards:
+    cd backend && python -m benchmarks.load --spawn [--mongodb-uri mongodb://localhost:27017]
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+import httpx
+import websockets
+from bson import ObjectId
+from pymongo import MongoClient
+
+from utils.heatmap import DELTA_SUBPROTOCOL
+from utils.serialization import dumps
+
+SCRATCH_DB = "eventflow_load"
+HOT_STALL_SHARE = 0.8  # share of scans aimed at the hot stalls
+RETRY_SHARE = 0.1  # share of redeems re-sent with the same idempotency key
+
+
+# ──────────────────────── Recording ───────────────────────────────────
+
+
+class EndpointStats:
+    __slots__ = ("latencies_ms", "errors", "statuses")
+
+    def __init__(self):
+        self.latencies_ms: list[float] = []
+        self.errors = 0
+        self.statuses: Counter[str] = Counter()
+
+    def summary(self, elapsed: float) -> dict:
+        n = len(self.latencies_ms)
+        ordered = sorted(self.latencies_ms)
+
+        def pct(p: float):
+            return round(ordered[min(n - 1, int(p * n))], 2) if n else None
+
+        return {
+            "requests": n,
+            "errors": self.errors,
+            "error_rate": round(self.errors / n, 4) if n else 0.0,
+            "throughput_rps": round(n / elapsed, 1),
+            "p50_ms": pct(0.50),
+            "p95_ms": pct(0.95),
+            "p99_ms": pct(0.99),
+            "max_ms": round(ordered[-1], 2) if n else None,
+            "statuses": dict(sorted(self.statuses.items())),
+        }
+
+
+class Recorder:
+    def __init__(self):
+        self.endpoints: dict[str, EndpointStats] = {}
+        self.redeem_outcomes: Counter[str] = Counter()
+        self.ws = {"subscribers": 0, "connected": 0, "failed": 0, "dropped": 0, "frames": 0, "bytes": 0}
+        self.ws_connect_ms: list[float] = []
+
+    async def request(self, client: httpx.AsyncClient, method: str, path: str, label: str, **kwargs):
+        stats = self.endpoints.get(label)
+        if stats is None:
+            stats = self.endpoints[label] = EndpointStats()
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, path, **kwargs)
+        except httpx.HTTPError as exc:
+            stats.latencies_ms.append((time.perf_counter() - started) * 1000)
+            stats.errors += 1
+            stats.statuses[type(exc).__name__] += 1
+            return None
+        stats.latencies_ms.append((time.perf_counter() - started) * 1000)
+        stats.statuses[str(response.status_code)] += 1
+        if response.status_code >= 400:
+            stats.errors += 1
+        return response
+
+
+# ──────────────────────── Scenarios ───────────────────────────────────
+
+
+async def scan_bursts(client, rec: Recorder, ctx: dict, args, stop_at: float) -> None:
+    hot = ctx["stalls"][: args.hot_stalls]
+
+    async def worker() -> None:
+        while time.monotonic() < stop_at:
+            user = random.choice(ctx["users"])
+            await asyncio.gather(
+                *(
+                    rec.request(
+                        client, "POST", "/api/game/scan", "POST /api/game/scan",
+                        json={
+                            "sponsor_id": random.choice(hot)
+                            if random.random() < HOT_STALL_SHARE
+                            else random.choice(ctx["stalls"])
+                        },
+                        headers={"X-User-Id": user},
+                    )
+                    for _ in range(args.burst)
+                )
+            )
+            await asyncio.sleep(random.uniform(0.5, 1.5) * args.burst_pause)
+
+    await asyncio.gather(*(worker() for _ in range(args.scan_workers)))
+
+
+async def pollers(client, rec: Recorder, ctx: dict, args, stop_at: float) -> None:
+    async def poller() -> None:
+        await asyncio.sleep(random.uniform(0, args.poll_interval))  # spread the clients out
+        while time.monotonic() < stop_at:
+            await asyncio.gather(
+                rec.request(client, "GET", "/api/game/leaderboard", "GET /api/game/leaderboard"),
+                rec.request(client, "GET", "/api/game/stalls", "GET /api/game/stalls"),
+            )
+            await asyncio.sleep(args.poll_interval)
+
+    await asyncio.gather(*(poller() for _ in range(args.pollers)))
+
+
+async def redeem_storms(client, rec: Recorder, ctx: dict, args, stop_at: float) -> None:
+    async def redeem(user: str, reward: str) -> None:
+        key = uuid.uuid4().hex
+        attempts = 2 if random.random() < RETRY_SHARE else 1
+        for _ in range(attempts):
+            response = await rec.request(
+                client, "POST", "/api/store/redeem", "POST /api/store/redeem",
+                json={"reward_id": reward, "idempotency_key": key},
+                headers={"X-User-Id": user},
+            )
+        if response is None or response.status_code != 200:
+            rec.redeem_outcomes["error"] += 1
+        else:
+            rec.redeem_outcomes["redeemed" if response.json()["success"] else "refused"] += 1
+
+    while time.monotonic() + args.storm_every < stop_at:
+        await asyncio.sleep(args.storm_every)
+        reward = random.choice(ctx["rewards"])
+        await asyncio.gather(
+            *(redeem(random.choice(ctx["users"]), reward) for _ in range(args.storm_size))
+        )
+
+
+async def heatmap_subscribers(rec: Recorder, ws_url: str, args, stop_at: float) -> None:
+    connecting = asyncio.Semaphore(50)  # ramp up instead of one SYN flood
+
+    async def subscriber(i: int) -> None:
+        delta = i % 2 == 1
+        started = time.perf_counter()
+        try:
+            async with connecting:
+                ws = await websockets.connect(
+                    f"{ws_url}/api/game/heatmap",
+                    subprotocols=[DELTA_SUBPROTOCOL] if delta else None,
+                    open_timeout=10,
+                    max_size=None,
+                )
+        except Exception:
+            rec.ws["failed"] += 1
+            return
+        rec.ws_connect_ms.append((time.perf_counter() - started) * 1000)
+        rec.ws["connected"] += 1
+        try:
+            while True:
+                remaining = stop_at - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    frame = await asyncio.wait_for(ws.recv(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    break
+                rec.ws["frames"] += 1
+                rec.ws["bytes"] += len(frame)
+        except websockets.ConnectionClosed:
+            rec.ws["dropped"] += 1
+        finally:
+            await ws.close()
+
+    rec.ws["subscribers"] = args.ws_subscribers
+    await asyncio.gather(*(subscriber(i) for i in range(args.ws_subscribers)))
+
+
+# ──────────────────────── Setup ───────────────────────────────────────
+
+
+async def discover(client: httpx.AsyncClient) -> dict:
+    """Stall, user and reward ids to aim at, from the public API."""
+    stalls = (await client.get("/api/game/stalls")).json()
+    users = (await client.get("/api/game/leaderboard", params={"limit": 100})).json()
+    rewards = (await client.get("/api/store/rewards")).json()
+    ctx = {
+        "stalls": [s["stall_id"] for s in sorted(stalls, key=lambda s: -s["scan_count_10m"])],
+        "users": [u["user_id"] for u in users],
+        "rewards": [r["id"] for r in rewards if not r["requires_legendary"]] or [r["id"] for r in rewards],
+    }
+    missing = [name for name, ids in ctx.items() if not ids]
+    if missing:
+        raise SystemExit(f"❌ Nothing to load: no {', '.join(missing)} found – seed the database or use --spawn")
+    return ctx
+
+
+def seed_scratch(uri: str, n_stalls: int, n_users: int) -> None:
+    db = MongoClient(uri).get_database(SCRATCH_DB)
+    db.client.drop_database(SCRATCH_DB)
+    now = datetime.now(timezone.utc)
+    sponsors = [
+        {
+            "_id": ObjectId(),
+            "company_name": f"Load Stall {i}",
+            "category": random.choice(["Software", "Hardware", "Food"]),
+            "map_location": {"x_coord": i % 10, "y_coord": i // 10},
+            "sponsorship_package_cost": 50_000,
+            "current_pokemon_spawn": {"name": "Pikachu", "type": "Electric", "rarity": "Normal"},
+        }
+        for i in range(n_stalls)
+    ]
+    users = [
+        {
+            "_id": ObjectId(),
+            "name": f"Load User {i}",
+            "email": f"load{i}@example.com",
+            "demographics": {"major": random.choice(["Design", "CS", "Business"])},
+            "wallet": {"total_points": random.randint(0, 600), "legendaries_caught": int(i % 4 == 0)},
+            "pokedex": [],
+        }
+        for i in range(n_users)
+    ]
+    rewards = [
+        {"_id": ObjectId(), "item_name": "Sticker", "category": "Merch", "cost_in_points": 20,
+         "requires_legendary": False, "stock_remaining": n_users},
+        {"_id": ObjectId(), "item_name": "Coffee", "category": "Food", "cost_in_points": 80,
+         "requires_legendary": False, "stock_remaining": n_users // 10},
+        {"_id": ObjectId(), "item_name": "Hoodie", "category": "Merch", "cost_in_points": 300,
+         "requires_legendary": False, "stock_remaining": 25},
+    ]
+    scans = [
+        {
+            "_id": ObjectId(),
+            "student_id": random.choice(users)["_id"],
+            "sponsor_id": random.choice(sponsors)["_id"],
+            "timestamp": now - timedelta(minutes=random.randint(0, 240)),
+            "pokemon_caught": {"name": "Pikachu", "type": "Electric", "rarity": "Normal"},
+            "points_awarded": 10,
+            "is_flash_sale": False,
+            "sync_status": True,
+        }
+        for _ in range(n_users * 5)
+    ]
+    db.sponsors.insert_many(sponsors)
+    db.users.insert_many(users)
+    db.rewards.insert_many(rewards)
+    db.scanevents.insert_many(scans)
+    db.client.close()
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def spawn_server(uri: str) -> tuple[subprocess.Popen, str]:
+    port = _free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        env={**os.environ, "MONGODB_URI": uri, "DB_NAME": SCRATCH_DB},
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        for _ in range(60):
+            await asyncio.sleep(0.5)
+            try:
+                await client.get("/")
+                return server, base_url
+            except httpx.HTTPError:
+                if server.poll() is not None:
+                    break
+    server.terminate()
+    raise SystemExit("❌ Spawned server did not come up")
+
+
+# ──────────────────────── Main ────────────────────────────────────────
+
+
+async def run(args, base_url: str) -> dict:
+    rec = Recorder()
+    limits = httpx.Limits(max_connections=args.max_connections, max_keepalive_connections=args.max_connections)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=args.timeout) as client:
+        ctx = await discover(client)
+        print(
+            f"🚀 {args.duration}s against {base_url}: {len(ctx['stalls'])} stalls, "
+            f"{len(ctx['users'])} users, {len(ctx['rewards'])} rewards"
+        )
+        started_at = datetime.now(timezone.utc)
+        started = time.monotonic()
+        stop_at = started + args.duration
+        ws_url = "ws" + base_url[len("http"):]
+        await asyncio.gather(
+            scan_bursts(client, rec, ctx, args, stop_at),
+            pollers(client, rec, ctx, args, stop_at),
+            redeem_storms(client, rec, ctx, args, stop_at),
+            heatmap_subscribers(rec, ws_url, args, stop_at),
+        )
+        elapsed = time.monotonic() - started
+
+        try:
+            server_metrics = (await client.get("/metrics")).json()
+        except (httpx.HTTPError, ValueError):
+            server_metrics = None
+
+    connect = sorted(rec.ws_connect_ms)
+    return {
+        "base_url": base_url,
+        "started_at": started_at,
+        "duration_s": round(elapsed, 2),
+        "config": {k: v for k, v in vars(args).items() if k not in ("out",)},
+        "endpoints": {label: s.summary(elapsed) for label, s in sorted(rec.endpoints.items())},
+        "redemptions": dict(rec.redeem_outcomes),
+        "websockets": {
+            **rec.ws,
+            "connect_p50_ms": round(connect[len(connect) // 2], 2) if connect else None,
+            "connect_p99_ms": round(connect[min(len(connect) - 1, int(0.99 * len(connect)))], 2) if connect else None,
+        },
+        "server_metrics": server_metrics,
+    }
+
+
+def print_summary(report: dict) -> None:
+    print(f"{'endpoint':<28} {'req':>7} {'rps':>7} {'p50':>8} {'p95':>8} {'p99':>8} {'err%':>6}")
+    for label, s in report["endpoints"].items():
+        print(
+            f"{label:<28} {s['requests']:>7,} {s['throughput_rps']:>7.1f} "
+            f"{s['p50_ms'] or 0:>8.1f} {s['p95_ms'] or 0:>8.1f} {s['p99_ms'] or 0:>8.1f} "
+            f"{s['error_rate'] * 100:>6.2f}"
+        )
+    ws = report["websockets"]
+    print(
+        f"heatmap ws: {ws['connected']}/{ws['subscribers']} connected, {ws['failed']} failed, "
+        f"{ws['dropped']} dropped, {ws['frames']:,} frames"
+    )
+    print(f"redemptions: {report['redemptions']}")
+
+
+async def main(args) -> None:
+    server = None
+    base_url = args.base_url
+    if args.spawn:
+        print(f"🌱 Seeding {SCRATCH_DB} on {args.mongodb_uri}...")
+        seed_scratch(args.mongodb_uri, args.stalls, args.users)
+        server, base_url = await spawn_server(args.mongodb_uri)
+    try:
+        report = await run(args, base_url)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=10)
+            if not args.keep_db:
+                MongoClient(args.mongodb_uri).drop_database(SCRATCH_DB)
+
+    with open(args.out, "wb") as f:
+        f.write(dumps(report))
+    print_summary(report)
+    print(f"✅ Report written to {args.out}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--out", default="load_report.json")
+    parser.add_argument("--timeout", type=float, default=10, help="per-request timeout (s)")
+    parser.add_argument("--max-connections", type=int, default=200)
+    parser.add_argument("--scan-workers", type=int, default=50)
+    parser.add_argument("--burst", type=int, default=5, help="scans per burst")
+    parser.add_argument("--burst-pause", type=float, default=1.0, help="mean seconds between bursts")
+    parser.add_argument("--hot-stalls", type=int, default=3)
+    parser.add_argument("--pollers", type=int, default=100)
+    parser.add_argument("--poll-interval", type=float, default=2.0)
+    parser.add_argument("--storm-size", type=int, default=200)
+    parser.add_argument("--storm-every", type=float, default=10.0)
+    parser.add_argument("--ws-subscribers", type=int, default=300)
+    parser.add_argument("--spawn", action="store_true", help="seed a scratch DB and start a server on it")
+    parser.add_argument("--mongodb-uri", default=os.getenv("MONGODB_URI") or "mongodb://localhost:27017")
+    parser.add_argument("--stalls", type=int, default=40, help="stalls to seed with --spawn")
+    parser.add_argument("--users", type=int, default=2000, help="users to seed with --spawn")
+    parser.add_argument("--keep-db", action="store_true", help="keep the scratch DB after --spawn")
+    asyncio.run(main(parser.parse_args()))
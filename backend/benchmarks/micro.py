@@ -0,0 +1,415 @@
+"""
+EventFlow – Micro-Benchmarks with Regression Thresholds
+Times the analytics helpers and serialize_doc on synthetic inputs at
+1K / 100K / 1M items, plus router handlers called directly against an
+in-memory MongoDB stand-in (mongomock-motor), so handler cost is measured
+without network or server time. Each case records the median wall time
+per call over REPEAT samples (taken round-robin across cases, each at
+least MIN_SAMPLE_SECONDS long), their spread (interquartile range /
+median) and the peak traced memory (tracemalloc) of one more call.
+
+Results are compared with a baseline recorded on the same machine; the
+run fails if a case's median is slower than its baseline by more than
+TIME_THRESHOLD, or twice the spread seen when either was measured if that
+is larger (a busy machine varies more between runs), or if it uses more
+than MEM_THRESHOLD extra peak memory. Baselines are per machine and not
+committed – record one from a clean checkout before changing code:
+
+    cd backend && python -m benchmarks.micro --update-baseline
+    cd backend && python -m benchmarks.micro [--time-threshold 0.5] [--only serialize_doc]
+
+Handler cases need `pip install mongomock-motor` and are skipped without
+it. They run at 1K and 10K users/scans only: the stand-in answers queries
+by scanning in Python (no indexes), which would swamp the handler cost
+at larger sizes. Stall analytics runs at 1K only: the stand-in's $lookup
+is a nested loop, quadratic in users × students.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import gc
+import inspect
+import json
+import math
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Optional, Union
+
+from bson import ObjectId
+
+import database
+from models import serialize_doc
+from utils.analytics import calculate_avg_wait_time, calculate_cpi, calculate_flash_sale_lift
+
+try:
+    from mongomock_motor import AsyncMongoMockClient
+except ImportError:  # optional: only the handler cases need it
+    AsyncMongoMockClient = None
+
+SCALES = (1_000, 100_000, 1_000_000)
+HANDLER_SCALES = (1_000, 10_000)
+ANALYTICS_MAX_SCALE = 1_000  # see the module docstring
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "micro_baseline.json")
+REPEAT = 7  # timed samples per case; the median is compared
+MIN_SAMPLE_SECONDS = 0.05  # short cases loop within a sample to at least this
+TIME_THRESHOLD = 0.5  # fail when the median is >50% slower than baseline…
+SPREAD_FACTOR = 2  # …or than twice the measured spread, if that is wider
+MEM_THRESHOLD = 0.25  # …or with >25% more peak memory
+MEM_SLACK_KIB = 64
+
+Timed = Callable[[], Union[None, Awaitable[Any]]]
+
+
+# ──────────────────────── Synthetic inputs ────────────────────────────
+
+
+def bench_cpi(n: int) -> Timed:
+    rng = random.Random(n)
+    pairs = [(rng.choice((25_000, 50_000, 100_000)) * 1.0, rng.randint(0, 5_000)) for _ in range(n)]
+
+    def run() -> None:
+        for cost, scans in pairs:
+            calculate_cpi(cost, scans)
+
+    return run
+
+
+def bench_flash_sale_lift(n: int) -> Timed:
+    rng = random.Random(n)
+    pairs = []
+    for _ in range(n):
+        total = rng.randint(0, 5_000)
+        pairs.append((rng.randint(0, total), total))
+
+    def run() -> None:
+        for flash, total in pairs:
+            calculate_flash_sale_lift(flash, total)
+
+    return run
+
+
+def bench_avg_wait_time(n: int) -> Timed:
+    rng = random.Random(n)
+    start = datetime(2026, 3, 1, 9, tzinfo=timezone.utc)
+    timestamps = [start + timedelta(seconds=rng.uniform(0, 8 * 3600)) for _ in range(n)]
+
+    def run() -> None:
+        calculate_avg_wait_time(timestamps)
+
+    return run
+
+
+def _scan_doc(i: int, start: datetime) -> dict:
+    return {
+        "_id": ObjectId(),
+        "student_id": ObjectId(),
+        "sponsor_id": ObjectId(),
+        "timestamp": start + timedelta(seconds=37 * i),
+        "pokemon_caught": {"name": "Pikachu", "type": "Electric", "rarity": "Normal"},
+        "points_awarded": 10,
+        "is_flash_sale": i % 5 == 0,
+        "sync_status": True,
+    }
+
+
+def bench_serialize_doc(n: int) -> Timed:
+    start = datetime(2026, 3, 1, 9, tzinfo=timezone.utc)
+    pool = [_scan_doc(i, start) for i in range(1_000)]  # cycled, so input memory stays flat
+
+    def run() -> None:
+        for i in range(n):
+            serialize_doc(pool[i % 1_000])
+
+    return run
+
+
+# ──────────────────────── Handlers on the stand-in ────────────────────
+
+
+async def _seed_standin(n: int) -> dict:
+    """n users and n scans over 20 stalls in a fresh in-memory database."""
+    from utils.catalog import reward_cache, sponsor_cache
+    from utils.counters import event_counters
+    from utils.crowd import crowd_counter
+    from utils.leaderboard import ranking
+
+    db = AsyncMongoMockClient().get_database("eventflow_micro")
+    database._store.db = db
+    rng = random.Random(n)
+    now = datetime.now(timezone.utc).replace(tzinfo=None)  # mongomock stores naive UTC
+
+    sponsors = [
+        {
+            "_id": ObjectId(),
+            "company_name": f"Stall {i}",
+            "category": "Software",
+            "map_location": {"x_coord": i % 5, "y_coord": i // 5},
+            "sponsorship_package_cost": 50_000,
+            "current_pokemon_spawn": {"name": "Pikachu", "type": "Electric", "rarity": "Normal"},
+        }
+        for i in range(20)
+    ]
+    users = [
+        {
+            "_id": ObjectId(),
+            "name": f"User {i}",
+            "demographics": {"major": rng.choice(("Design", "CS", "Business"))},
+            "wallet": {"total_points": rng.randint(0, 2_000), "legendaries_caught": rng.randint(0, 2)},
+            "pokedex": [],
+        }
+        for i in range(n)
+    ]
+    scans = [
+        {
+            "_id": ObjectId(),
+            "student_id": rng.choice(users)["_id"],
+            "sponsor_id": sponsors[min(int(rng.expovariate(0.3)), 19)]["_id"],  # a few hot stalls
+            "timestamp": now - timedelta(seconds=rng.randint(0, 8 * 3600)),
+            "pokemon_caught": {"name": "Pikachu", "type": "Electric", "rarity": "Normal"},
+            "points_awarded": 10,
+            "is_flash_sale": rng.random() < 0.1,
+            "sync_status": True,
+        }
+        for _ in range(n)
+    ]
+    rewards = [
+        {"_id": ObjectId(), "item_name": f"Reward {i}", "category": "Food", "cost_in_points": 50 * (i + 1),
+         "requires_legendary": i == 3, "stock_remaining": 100}
+        for i in range(4)
+    ]
+    await db.sponsors.insert_many(sponsors)
+    await db.users.insert_many(users)
+    await db.scanevents.insert_many(scans)
+    await db.rewards.insert_many(rewards)
+
+    await sponsor_cache.refresh(db)
+    await reward_cache.refresh(db)
+    await crowd_counter.rebuild(db)
+    await ranking.load(db)
+    await event_counters.ensure(db)
+    return {
+        "db": db,
+        "user": str(users[n // 2]["_id"]),
+        "stall": await sponsor_cache.get(db, sponsors[0]["_id"]),
+    }
+
+
+def _uncached(handler):
+    """The handler without its response-cache decorator."""
+    return getattr(handler, "__wrapped__", handler)
+
+
+def handler_cases(standin: dict, n: int) -> dict[str, tuple[int, Timed]]:
+    """Handler name → (calls per run, timed closure)."""
+    from routers.game import leaderboard, list_stalls, my_rank
+    from routers.general import get_stats
+    from routers.sponsor import _compute_stall_analytics
+    from routers.store import list_rewards
+
+    user, stall, db = standin["user"], standin["stall"], standin["db"]
+
+    def repeated(calls: int, make: Callable[[], Awaitable[Any]]) -> tuple[int, Timed]:
+        async def run() -> None:
+            for _ in range(calls):
+                await make()
+
+        return calls, run
+
+    cases = {
+        "handler:leaderboard": repeated(
+            200, lambda: _uncached(leaderboard)(filter=None, offset=0, limit=50, x_user_id="")
+        ),
+        "handler:my_rank": repeated(200, lambda: my_rank(x_user_id=user)),
+        "handler:list_stalls": repeated(50, lambda: _uncached(list_stalls)(window=10)),
+        "handler:get_stats": repeated(50, lambda: _uncached(get_stats)()),
+        "handler:list_rewards": repeated(20, lambda: list_rewards(x_user_id=user)),
+    }
+    if n <= ANALYTICS_MAX_SCALE:
+        cases["handler:stall_analytics"] = repeated(1, lambda: _compute_stall_analytics(db, stall))
+    return cases
+
+
+# ──────────────────────── Measurement ─────────────────────────────────
+
+
+class Case:
+    """One timed closure and the samples collected for it."""
+
+    __slots__ = ("name", "n", "items", "fn", "loops", "times")
+
+    def __init__(self, name: str, n: int, items: int, fn: Timed):
+        self.name = name
+        self.n = n
+        self.items = items
+        self.fn = fn
+        self.loops = 1
+        self.times: list[float] = []
+
+
+async def _call(fn: Timed) -> None:
+    result = fn()
+    if inspect.isawaitable(result):
+        await result
+
+
+async def _time(case: Case) -> float:
+    """Wall seconds per call of the closure, over `case.loops` calls."""
+    gc.collect()
+    started = time.perf_counter()
+    for _ in range(case.loops):
+        await _call(case.fn)
+    return (time.perf_counter() - started) / case.loops
+
+
+async def measure(cases: list[Case], repeat: int) -> list[dict]:
+    """
+    Median seconds per call and spread (interquartile range / median) over
+    `repeat` samples, plus the peak traced KiB of one more call, per case.
+    Samples are taken round-robin across the cases, so a stretch of machine
+    noise lands on a few samples of every case rather than on all of one.
+    """
+    for case in cases:  # warm-up, sizing each sample to MIN_SAMPLE_SECONDS
+        case.loops = max(1, math.ceil(MIN_SAMPLE_SECONDS / max(await _time(case), 1e-9)))
+    for _ in range(repeat):
+        for case in cases:
+            case.times.append(await _time(case))
+
+    results = []
+    for case in cases:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            await _call(case.fn)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        median = statistics.median(case.times)
+        spread = 0.0
+        if len(case.times) > 1:
+            q1, _, q3 = statistics.quantiles(case.times, n=4)
+            spread = (q3 - q1) / median
+        results.append({"seconds": median, "spread": round(spread, 3), "peak_kib": round(peak / 1024, 1)})
+    return results
+
+
+def compare(result: dict, baseline: Optional[dict], time_threshold: float, mem_threshold: float) -> str:
+    """'ok', 'new' or a description of the regression."""
+    if baseline is None:
+        return "new"
+    problems = []
+    allowed = max(time_threshold, SPREAD_FACTOR * max(result["spread"], baseline.get("spread", 0)))
+    time_limit = baseline["seconds"] * (1 + allowed)
+    if result["seconds"] > time_limit:
+        problems.append(f"time +{(result['seconds'] / baseline['seconds'] - 1) * 100:.0f}% (allowed {allowed:.0%})")
+    mem_limit = baseline["peak_kib"] * (1 + mem_threshold) + MEM_SLACK_KIB
+    if result["peak_kib"] > mem_limit:
+        problems.append(f"memory +{(result['peak_kib'] / max(baseline['peak_kib'], 1e-9) - 1) * 100:.0f}%")
+    return "REGRESSION " + ", ".join(problems) if problems else "ok"
+
+
+async def main(args) -> int:
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)["cases"]
+    elif not args.update_baseline:
+        print(f"⚠️  No baseline at {args.baseline} – record one with --update-baseline")
+
+    results: dict[str, dict[str, dict]] = {}
+    failures = 0
+    print(
+        f"{'case':<26} {'n':>10} {'median (ms)':>12} {'µs/item':>9} {'spread':>7} {'peak KiB':>10}  vs baseline"
+    )
+
+    async def run(cases: list[Case]) -> None:
+        nonlocal failures
+        for case, result in zip(cases, await measure(cases, args.repeat)):
+            results.setdefault(case.name, {})[str(case.n)] = result
+            status = compare(
+                result, baseline.get(case.name, {}).get(str(case.n)), args.time_threshold, args.mem_threshold
+            )
+            failures += status.startswith("REGRESSION")
+            print(
+                f"{case.name:<26} {case.n:>10,} {result['seconds'] * 1000:>12.2f} "
+                f"{result['seconds'] / case.items * 1e6:>9.3f} {result['spread']:>7.0%} "
+                f"{result['peak_kib']:>10.1f}  {status}"
+            )
+
+    await run(
+        [
+            Case(name, n, n, make(n))
+            for name, make in (
+                ("calculate_cpi", bench_cpi),
+                ("calculate_flash_sale_lift", bench_flash_sale_lift),
+                ("calculate_avg_wait_time", bench_avg_wait_time),
+                ("serialize_doc", bench_serialize_doc),
+            )
+            if not args.only or name in args.only
+            for n in args.scales
+        ]
+    )
+
+    wants_handlers = not args.only or any(o.startswith("handler:") for o in args.only)
+    if wants_handlers and AsyncMongoMockClient is None:
+        print("⚠️  Handler cases skipped – pip install mongomock-motor")
+    elif wants_handlers:
+        for n in args.handler_scales:  # one stand-in at a time: handlers share the app's globals
+            standin = await _seed_standin(n)
+            await run(
+                [
+                    Case(name, n, calls, fn)
+                    for name, (calls, fn) in handler_cases(standin, n).items()
+                    if not args.only or name in args.only
+                ]
+            )
+
+    if args.update_baseline:
+        merged = dict(baseline)
+        for name, by_n in results.items():
+            merged[name] = {**baseline.get(name, {}), **by_n}
+        with open(args.baseline, "w") as f:
+            json.dump(
+                {
+                    "machine": f"{platform.machine()} {platform.processor() or platform.system()}",
+                    "python": platform.python_version(),
+                    "recorded_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                    "cases": {name: merged[name] for name in sorted(merged)},
+                },
+                f,
+                indent=2,
+            )
+            f.write("\n")
+        print(f"✅ Baseline written to {args.baseline}")
+        return 0
+
+    if failures:
+        print(f"❌ {failures} case(s) regressed beyond the thresholds")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--scales", type=lambda s: tuple(int(x) for x in s.split(",")), default=SCALES,
+        help="comma-separated input sizes (default 1000,100000,1000000)",
+    )
+    parser.add_argument(
+        "--handler-scales", type=lambda s: tuple(int(x) for x in s.split(",")), default=HANDLER_SCALES,
+        help="users/scans in the in-memory stand-in for handler cases (default 1000,10000)",
+    )
+    parser.add_argument("--only", nargs="*", help="case names to run (e.g. serialize_doc handler:my_rank)")
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="timed samples per case (median compared)")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true", help="record these results as the baseline")
+    parser.add_argument("--time-threshold", type=float, default=TIME_THRESHOLD)
+    parser.add_argument("--mem-threshold", type=float, default=MEM_THRESHOLD)
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,130 @@
+"""
+EventFlow – Redemption Concurrency Benchmark
+Fires thousands of simultaneous redeem_reward calls at a scratch database
+(many users with just enough points for a few rewards, rewards with less
+stock than demand) and then audits the result:
+
+  * no wallet below zero and no stock below zero,
+  * points deducted == cost × successful redemptions, per user,
+  * stock taken == successful redemptions, per reward.
+
+Needs a reachable MongoDB (MONGODB_URI, e.g. a local mongod). The scratch
+database is dropped afterwards.
+
+Run with: cd backend && python -m benchmarks.redeem [--requests 5000] [--users 200]
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import random
+import time
+from collections import Counter
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorClient
+
+import database
+from models import RedeemRequest
+from routers.store import redeem_reward
+from utils.catalog import reward_cache
+from utils.leaderboard import ranking
+
+SCRATCH_DB = "eventflow_bench_redeem"
+
+
+async def _seed(db, n_users: int) -> tuple[list[dict], list[dict]]:
+    users = [
+        {
+            "_id": ObjectId(),
+            "name": f"Bench {i}",
+            "wallet": {"total_points": random.choice([0, 40, 100, 250]), "legendaries_caught": i % 3},
+            "pokedex": [],
+        }
+        for i in range(n_users)
+    ]
+    rewards = [
+        {"_id": ObjectId(), "item_name": "Sticker", "category": "Merch", "cost_in_points": 20,
+         "requires_legendary": False, "stock_remaining": n_users},
+        {"_id": ObjectId(), "item_name": "Coffee", "category": "Food", "cost_in_points": 50,
+         "requires_legendary": False, "stock_remaining": n_users // 4},
+        {"_id": ObjectId(), "item_name": "Plush", "category": "Merch", "cost_in_points": 0,
+         "requires_legendary": True, "stock_remaining": n_users // 10},
+    ]
+    await db.users.insert_many(users)
+    await db.rewards.insert_many(rewards)
+    return users, rewards
+
+
+async def main(n_requests: int, n_users: int) -> None:
+    client = AsyncIOMotorClient(database.MONGODB_URI)
+    await client.drop_database(SCRATCH_DB)
+    db = database._store.db = client.get_database(SCRATCH_DB)
+    try:
+        users, rewards = await _seed(db, n_users)
+        await reward_cache.refresh(db)
+        await ranking.load(db)
+
+        calls = [
+            (random.choice(users)["_id"], random.choice(rewards)["_id"])
+            for _ in range(n_requests)
+        ]
+        started = time.perf_counter()
+        results = await asyncio.gather(
+            *(
+                redeem_reward(RedeemRequest(reward_id=str(reward_oid)), x_user_id=str(user_oid))
+                for user_oid, reward_oid in calls
+            )
+        )
+        elapsed = time.perf_counter() - started
+
+        # ── Audit ──
+        by_id = {r["_id"]: r for r in rewards}
+        won_points: Counter = Counter()
+        won_legendaries: Counter = Counter()
+        won_stock: Counter = Counter()
+        for (user_oid, reward_oid), res in zip(calls, results):
+            if res.success:
+                won_stock[reward_oid] += 1
+                if by_id[reward_oid]["requires_legendary"]:
+                    won_legendaries[user_oid] += 1
+                else:
+                    won_points[user_oid] += by_id[reward_oid]["cost_in_points"]
+
+        errors = []
+        for u in users:
+            after = (await db.users.find_one({"_id": u["_id"]}))["wallet"]
+            expect_pts = u["wallet"]["total_points"] - won_points[u["_id"]]
+            expect_leg = u["wallet"]["legendaries_caught"] - won_legendaries[u["_id"]]
+            if after["total_points"] < 0 or after["legendaries_caught"] < 0:
+                errors.append(f"overdraft: user {u['_id']} → {after}")
+            if (after["total_points"], after["legendaries_caught"]) != (expect_pts, expect_leg):
+                errors.append(f"wallet mismatch: user {u['_id']} {after} != {expect_pts}/{expect_leg}")
+        for r in rewards:
+            stock = (await db.rewards.find_one({"_id": r["_id"]}))["stock_remaining"]
+            if stock < 0 or stock != r["stock_remaining"] - won_stock[r["_id"]]:
+                errors.append(f"stock mismatch: {r['item_name']} {stock}")
+
+        succeeded = sum(res.success for res in results)
+        print(f"requests      {n_requests:>8,}")
+        print(f"succeeded     {succeeded:>8,}")
+        print(f"rejected      {n_requests - succeeded:>8,}")
+        print(f"elapsed (s)   {elapsed:>8.2f}")
+        print(f"throughput    {n_requests / elapsed:>8,.0f} req/s")
+        print(f"audit         {'OK – no overdrafts, stock and wallets balance' if not errors else 'FAILED'}")
+        for err in errors[:20]:
+            print(f"  ❌ {err}")
+        if errors:
+            raise SystemExit(1)
+    finally:
+        await client.drop_database(SCRATCH_DB)
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--users", type=int, default=200)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.users))
@@ -0,0 +1,127 @@
+"""
+EventFlow – Serialisation Micro-Benchmark
+Per-item cost of turning scan documents into JSON bytes:
+
+  legacy     – the old recursive serialize_doc + json.dumps
+  jsonable   – HistoryResponse + FastAPI's jsonable_encoder (old my-history path)
+  validated  – pydantic response_model validation + dump_json (list endpoints)
+  fast       – utils.serialization.dumps on the raw documents (new path)
+
+Run with: cd backend && python -m benchmarks.serialization
+"""
+
+from __future__ import annotations
+
+import json
+import time
+from datetime import datetime, timedelta, timezone
+
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+from models import HistoryResponse, StallInfo
+from utils.serialization import dumps
+
+SIZES = (100, 10_000)
+REPEAT = 5
+
+
+def _legacy_serialize_doc(doc: dict) -> dict:
+    """serialize_doc as it was before the orjson encoder."""
+    doc = dict(doc)
+    for key, val in doc.items():
+        if hasattr(val, "__str__") and type(val).__name__ == "ObjectId":
+            doc[key] = str(val)
+        elif hasattr(val, "isoformat"):
+            doc[key] = val.isoformat()
+        elif isinstance(val, dict):
+            doc[key] = _legacy_serialize_doc(val)
+        elif isinstance(val, list):
+            doc[key] = [
+                _legacy_serialize_doc(v) if isinstance(v, dict)
+                else (str(v) if type(v).__name__ == "ObjectId" else v)
+                for v in val
+            ]
+    return doc
+
+
+def _scans(n: int) -> list[dict]:
+    start = datetime(2026, 3, 1, 9, tzinfo=timezone.utc)
+    student = ObjectId()
+    return [
+        {
+            "_id": ObjectId(),
+            "student_id": student,
+            "sponsor_id": ObjectId(),
+            "timestamp": start + timedelta(seconds=37 * i),
+            "pokemon_caught": {"name": "Pikachu", "type": "Electric", "rarity": "Normal"},
+            "points_awarded": 10,
+            "is_flash_sale": False,
+            "sync_status": True,
+        }
+        for i in range(n)
+    ]
+
+
+def _stalls(n: int) -> list[dict]:
+    return [
+        {
+            "stall_id": ObjectId(),
+            "company_name": f"Company {i}",
+            "category": "Software",
+            "map_location": {"x_coord": i % 50, "y_coord": i // 50},
+            "current_pokemon_spawn": {"name": "Ditto", "rarity": "Normal"},
+            "crowd_level": "Low",
+            "scan_count_10m": i % 7,
+        }
+        for i in range(n)
+    ]
+
+
+def _best_us_per_item(fn, n: int) -> float:
+    best = float("inf")
+    for _ in range(REPEAT):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best / n * 1e6
+
+
+def main() -> None:
+    stalls_adapter = TypeAdapter(list[StallInfo])
+    print(f"{'items':>7}  {'payload':<8} {'legacy':>9} {'jsonable':>9} {'validated':>10} {'fast':>8}   µs/item")
+    for n in SIZES:
+        scans = _scans(n)
+        history = {
+            "user_id": str(ObjectId()), "name": "Ash", "total_points": 0,
+            "legendaries_caught": 0, "next_cursor": None,
+        }
+        legacy = _best_us_per_item(
+            lambda: json.dumps([_legacy_serialize_doc(s) for s in scans]).encode(), n
+        )
+        jsonable = _best_us_per_item(
+            lambda: json.dumps(
+                jsonable_encoder(
+                    HistoryResponse(**history, pokedex=[_legacy_serialize_doc(s) for s in scans])
+                )
+            ).encode(),
+            n,
+        )
+        fast = _best_us_per_item(lambda: dumps({**history, "pokedex": scans}), n)
+        print(f"{n:>7,}  {'scans':<8} {legacy:>9.2f} {jsonable:>9.2f} {'–':>10} {fast:>8.2f}")
+
+        stalls = _stalls(n)
+        as_strings = [{**s, "stall_id": str(s["stall_id"])} for s in stalls]
+        validated = _best_us_per_item(
+            lambda: stalls_adapter.dump_json(
+                stalls_adapter.validate_python([StallInfo(**s) for s in as_strings])
+            ),
+            n,
+        )
+        fast = _best_us_per_item(lambda: dumps(stalls), n)
+        print(f"{n:>7,}  {'stalls':<8} {'–':>9} {'–':>9} {validated:>10.2f} {fast:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""
+EventFlow – Wait-Time Memory Benchmark
+Streams synthetic sorted scan timestamps through stream_wait_time_stats
+and reports wall time and peak traced memory at each scale. Peak memory
+should stay flat as the number of scans per stall grows.
+
+Run with: cd backend && python -m benchmarks.wait_time
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+import tracemalloc
+
+from utils.analytics import stream_wait_time_stats
+
+SCALES = (1_000, 100_000, 1_000_000)
+START_MS = 1_771_000_000_000
+
+
+async def _rows(n: int):
+    """Sorted {"ms": ...} rows, like the analytics cursor – generated lazily."""
+    ms = START_MS
+    for i in range(n):
+        ms += 5_000 + (i * 7919) % 55_000  # 5–60 s gaps
+        yield {"ms": ms}
+
+
+async def main() -> None:
+    print(f"{'scans':>10}  {'time (s)':>9}  {'peak mem (KiB)':>15}  p50/p90/p99 (s)")
+    for n in SCALES:
+        tracemalloc.start()
+        started = time.perf_counter()
+        stats = await stream_wait_time_stats(_rows(n))
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(
+            f"{n:>10,}  {elapsed:>9.2f}  {peak / 1024:>15.1f}  "
+            f"{stats['p50_seconds']}/{stats['p90_seconds']}/{stats['p99_seconds']}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
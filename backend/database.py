@@ -10,8 +10,20 @@ from dotenv import load_dotenv
 from fastapi import FastAPI
 from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
 
+# Before the utils imports: their singletons (e.g. scan_buffer) read the env on import
 load_dotenv()
 
+from utils.catalog import catalog_refresher, reward_cache, scan_totals, sponsor_cache
+from utils.counters import event_counters
+from utils.covisit import covisit_engine
+from utils.crowd import crowd_counter
+from utils.db_metrics import db_metrics
+from utils.heatmap import heatmap_hub
+from utils.indexes import ensure_indexes
+from utils.leaderboard import ranking
+from utils.rollups import scan_rollups
+from utils.write_behind import scan_buffer
+
 MONGODB_URI = os.getenv("MONGODB_URI")
 DB_NAME = os.getenv("DB_NAME", "test")
 
@@ -29,10 +41,16 @@ _store = _Database()
 async def lifespan(app: FastAPI):
     """
     FastAPI lifespan context manager.
-    Opens the Motor connection pool on startup and closes it on shutdown.
+    Opens the Motor connection pool on startup, ensures the declared
+    indexes, seeds the in-process sponsor/reward catalog, scan totals,
+    crowd counter, leaderboard, co-visit matrix and rollup major lookup,
+    seeds the homepage counters document
+    if it is missing, and starts the catalog refresher, the shared heatmap
+    producer, the rollup compactor and (if enabled) the scan write-behind flusher.
+    Everything is torn down in reverse order on shutdown.
     """
     print("🚀 Starting up: Connecting to MongoDB Atlas...")
-    _store.client = AsyncIOMotorClient(MONGODB_URI)
+    _store.client = AsyncIOMotorClient(MONGODB_URI, event_listeners=[db_metrics])
     _store.db = _store.client.get_database(DB_NAME)
 
     # Quick connectivity test
@@ -42,8 +60,46 @@ async def lifespan(app: FastAPI):
     except Exception as exc:
         print(f"❌ MongoDB connection failed: {exc}")
 
+    # Declarative index spec (utils/indexes.py); a no-op when already in place.
+    # Runs before the warm-up so its queries on a fresh deployment use the indexes
+    failures = await ensure_indexes(_store.db)
+    for failure in failures:
+        print(f"❌ Index creation failed – {failure}")
+    if not failures:
+        print("✅ Indexes in place")
+
+    # Seed in-process state used by the scan hot path
+    try:
+        await sponsor_cache.refresh(_store.db)
+        await reward_cache.refresh(_store.db)
+        await scan_totals.rebuild(_store.db)
+        await crowd_counter.rebuild(_store.db)
+        await ranking.load(_store.db)
+        await covisit_engine.rebuild(_store.db)
+        await scan_rollups.load_majors(_store.db)
+        await event_counters.ensure(_store.db)
+        print("✅ Sponsor/reward catalog, scan counters, leaderboard and co-visits loaded")
+    except Exception as exc:
+        print(f"❌ Scan counter warm-up failed: {exc}")
+
+    catalog_refresher.start(_store.db)
+    heatmap_hub.start(_store.db)
+    scan_rollups.start(_store.db)
+    scan_buffer.start(_store.db)
+    if scan_buffer.active:
+        print("✅ Scan write-behind enabled")
+
     yield
 
+    print("🛑 Shutting down: Stopping heatmap broadcaster...")
+    await heatmap_hub.stop()
+    await scan_rollups.stop()
+    await catalog_refresher.stop()
+
+    if scan_buffer.active:
+        print("🛑 Shutting down: Flushing queued scan events...")
+        await scan_buffer.stop()
+
     print("🛑 Shutting down: Closing MongoDB connection...")
     if _store.client:
         _store.client.close()
@@ -3,11 +3,23 @@ EventFlow – FastAPI Backend
 Entry point. Run with: cd backend && python3 -m uvicorn main:app --reload
 """
 
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI, Request
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 
 from database import lifespan
-from routers import general, game, sponsor, store
+from routers import admin, general, game, sponsor, store
+from utils.db_metrics import DBMetricsMiddleware, db_metrics
+from utils.http_metrics import (
+    PROMETHEUS_CONTENT_TYPE,
+    RequestMetricsMiddleware,
+    render_prometheus,
+    request_metrics,
+    track_in_flight,
+)
+from utils.profiling import ProfilingMiddleware, profiling_enabled
+from utils.response_cache import response_cache
+from utils.serialization import FastJSONResponse
 
 # ──────────────────────────── App ──────────────────────────────────────
 
@@ -19,6 +31,8 @@ app = FastAPI(
     ),
     version="1.0.0",
     lifespan=lifespan,
+    default_response_class=FastJSONResponse,
+    dependencies=[Depends(track_in_flight)],
 )
 
 # ──────────────────────────── CORS ─────────────────────────────────────
@@ -29,14 +43,27 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-DB-Calls", "X-DB-Time-Ms", "X-Profile-Id"],
 )
 
+# Admin-only per-request profiling (X-Profile); not installed without ADMIN_TOKEN
+if profiling_enabled():
+    app.add_middleware(ProfilingMiddleware)
+
+# Per-route latency histograms, in-flight gauges, WebSocket counts, slow log.
+# Added first so it runs inside the DB tally, which the slow log reads.
+app.add_middleware(RequestMetricsMiddleware)
+
+# Per-route MongoDB command counts/time and the X-DB-* debug headers
+app.add_middleware(DBMetricsMiddleware)
+
 # ──────────────────────────── Routers ──────────────────────────────────
 
 app.include_router(general.router)
 app.include_router(game.router)
 app.include_router(sponsor.router)
 app.include_router(store.router)
+app.include_router(admin.router)
 
 
 # ──────────────────────────── Root ─────────────────────────────────────
@@ -52,10 +79,18 @@ async def root():
         "version": "1.0.0",
         "endpoints": {
             "homepage": "/api/general/stats",
+            "metrics": "/metrics",
+            "admin": [
+                "/api/admin/profile",
+                "/api/admin/profiles",
+                "/api/admin/profiles/{profile_id}",
+            ],
             "game": [
                 "/api/game/my-history",
                 "/api/game/scan",
+                "/api/game/scan/batch",
                 "/api/game/leaderboard",
+                "/api/game/my-rank",
                 "/api/game/stalls",
                 "/api/game/notifications",
             ],
@@ -63,7 +98,32 @@ async def root():
             "sponsor": [
                 "/api/sponsor/scan-candidate",
                 "/api/sponsor/analytics/{stall_id}",
+                "/api/sponsor/analytics/{stall_id}/co-visits",
+                "/api/sponsor/analytics/{stall_id}/hourly",
+            ],
+            "store": [
+                "/api/store/rewards",
+                "/api/store/redeem",
+                "/api/store/vouchers/{code}",
             ],
-            "store": ["/api/store/rewards", "/api/store/redeem"],
         },
     }
+
+
+# ──────────────────────────── Metrics ──────────────────────────────────
+
+@app.get("/metrics", tags=["Root"])
+async def metrics(request: Request, format: str = "json"):
+    """
+    Request latency/in-flight/WebSocket metrics, per-route MongoDB commands
+    (calls, time, docs returned) and response cache stats. Prometheus text
+    with ?format=prometheus or a scraper's Accept header.
+    """
+    accept = request.headers.get("accept", "")
+    if format == "prometheus" or "openmetrics" in accept or accept.startswith("text/plain"):
+        return PlainTextResponse(render_prometheus(), media_type=PROMETHEUS_CONTENT_TYPE)
+    return {
+        "requests": request_metrics.stats(),
+        "db": db_metrics.stats(),
+        "response_cache": response_cache.stats(),
+    }
@@ -14,28 +14,20 @@ from typing import Optional
 
 from pydantic import BaseModel, Field
 
+from utils.serialization import to_jsonable
+
 
 # ──────────────────────────── Serialisation Helpers ─────────────────────
 
 def serialize_doc(doc: dict) -> dict:
-    """Convert MongoDB document to JSON-safe dict (ObjectId → str, datetime → ISO)."""
+    """
+    Convert MongoDB document to JSON-safe dict (ObjectId → str, datetime → ISO).
+    Prefer returning documents through utils.serialization.FastJSONResponse,
+    which encodes them directly without building this intermediate copy.
+    """
     if doc is None:
         return {}
-    doc = dict(doc)
-    for key, val in doc.items():
-        if hasattr(val, '__str__') and type(val).__name__ == 'ObjectId':
-            doc[key] = str(val)
-        elif hasattr(val, 'isoformat'):  # datetime
-            doc[key] = val.isoformat()
-        elif isinstance(val, dict):
-            doc[key] = serialize_doc(val)
-        elif isinstance(val, list):
-            doc[key] = [
-                serialize_doc(v) if isinstance(v, dict)
-                else (str(v) if type(v).__name__ == 'ObjectId' else v)
-                for v in val
-            ]
-    return doc
+    return to_jsonable(doc)
 
 
 # ──────────────────────────── Request Schemas ──────────────────────────
@@ -45,12 +37,25 @@ class ScanRequest(BaseModel):
     sponsor_id: str  # MongoDB ObjectId as string
 
 
+class BatchScanItem(BaseModel):
+    """One scan replayed from a device's offline queue."""
+    sponsor_id: str
+    client_timestamp: datetime  # when the scan happened on the device
+    idempotency_key: str = Field(min_length=8, max_length=64)  # client-generated, e.g. a UUID
+
+
+class BatchScanRequest(BaseModel):
+    scans: list[BatchScanItem] = Field(max_length=500)
+
+
 class ScanCandidateRequest(BaseModel):
     user_id: str
 
 
 class RedeemRequest(BaseModel):
     reward_id: str
+    # Client-generated (e.g. a UUID), reused on retries so a timeout can't redeem twice
+    idempotency_key: Optional[str] = Field(default=None, min_length=8, max_length=64)
 
 
 # ──────────────────────────── Response Schemas ─────────────────────────
@@ -70,6 +75,21 @@ class ScanResponse(BaseModel):
     points_earned: int
 
 
+class BatchScanResult(BaseModel):
+    idempotency_key: str
+    status: str  # "accepted" | "duplicate" | "rejected"
+    pokemon: Optional[PokemonInfo] = None
+    points_earned: int = 0
+
+
+class BatchScanResponse(BaseModel):
+    accepted: int
+    duplicates: int
+    rejected: int
+    points_earned: int
+    results: list[BatchScanResult]
+
+
 class ScanCandidateResponse(BaseModel):
     user_id: str
     name: str
@@ -106,6 +126,22 @@ class NotificationItem(BaseModel):
     type: str  # "legendary_alert" | "flash_sale" | "info"
 
 
+class HourlyWait(BaseModel):
+    hour: int  # 0-23, UTC
+    samples: int
+    avg_seconds: float
+
+
+class WaitTimeStats(BaseModel):
+    """Scan-to-scan interval distribution over a stall's full history."""
+    samples: int
+    avg_seconds: float
+    p50_seconds: Optional[float] = None
+    p90_seconds: Optional[float] = None
+    p99_seconds: Optional[float] = None
+    hourly: list[HourlyWait] = Field(default_factory=list)
+
+
 class AnalyticsResponse(BaseModel):
     stall_id: str
     stall_name: str
@@ -114,10 +150,26 @@ class AnalyticsResponse(BaseModel):
     demographics: dict
     cost_per_interaction: Optional[float] = None
     avg_wait_time: Optional[str] = None
+    wait_time: Optional[WaitTimeStats] = None
     cross_pollination: Optional[float] = None
     flash_sale_lift: Optional[float] = None
 
 
+class HourlyTraffic(BaseModel):
+    """One Traffic Velocity bar, served from `scan_rollups`."""
+    hour: int  # 0-23, UTC
+    count: int
+    legendary: int
+    flash_sale: int
+
+
+class CoVisitItem(BaseModel):
+    """Another stall this stall's visitors also scanned."""
+    stall_id: str
+    stall_name: str
+    shared_visitors: int
+
+
 class RedeemResponse(BaseModel):
     success: bool
     message: str
@@ -126,6 +178,15 @@ class RedeemResponse(BaseModel):
     voucher_code: Optional[str] = None
 
 
+class VoucherResponse(BaseModel):
+    """A stored redemption, as shown to booth staff verifying a code."""
+    voucher_code: str
+    item_name: str
+    reward_id: str
+    user_id: str
+    redeemed_at: datetime
+
+
 class RewardItem(BaseModel):
     """For the rewards listing endpoint."""
     id: str
@@ -152,3 +213,4 @@ class HistoryResponse(BaseModel):
     total_points: int
     legendaries_caught: int
     pokedex: list[dict]
+    next_cursor: Optional[str] = None  # keyset cursor for the next (older) page
@@ -0,0 +1,53 @@
+"""
+EventFlow – Admin Router
+On-demand profiling (see utils/profiling.py). Every endpoint requires the
+X-Admin-Token header and the router answers 404 while ADMIN_TOKEN is unset.
+"""
+
+from __future__ import annotations
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+
+from auth import require_admin
+from utils.profiling import MAX_PROFILE_SECONDS, PROFILE_INTERVAL_MS, profile_store, sample_process
+
+router = APIRouter(prefix="/api/admin", tags=["Admin"], dependencies=[Depends(require_admin)])
+
+
+# ──────────────────────── POST /profile ───────────────────────────────
+
+
+@router.post("/profile")
+async def profile_process(
+    seconds: float = Query(default=10, gt=0, le=MAX_PROFILE_SECONDS),
+    interval_ms: float = Query(default=PROFILE_INTERVAL_MS, ge=1, le=100),
+):
+    """
+    Sample the whole event loop for `seconds` (every `interval_ms`) and
+    return the profile together with every asyncio task's current stack.
+    The profile is also stored under its id.
+    """
+    return await sample_process(seconds, interval_ms)
+
+
+# ──────────────────────── GET /profiles ───────────────────────────────
+
+
+@router.get("/profiles")
+async def list_profiles():
+    """Recently stored profiles (request and process-wide), newest first."""
+    return profile_store.list()
+
+
+@router.get("/profiles/{profile_id}")
+async def get_profile(profile_id: str, format: str = "json"):
+    """A stored profile; `?format=folded` returns sampled stacks for flame-graph tools."""
+    profile = profile_store.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if format == "folded":
+        if "folded" not in profile:
+            raise HTTPException(status_code=400, detail="Only sampled profiles have folded stacks")
+        return PlainTextResponse(profile["folded"])
+    return profile
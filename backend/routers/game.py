@@ -12,10 +12,16 @@ import random
 from datetime import datetime, timedelta, timezone
 
 from bson import ObjectId
-from fastapi import APIRouter, Header, Query, WebSocket, WebSocketDisconnect
+from fastapi import APIRouter, Header, HTTPException, Query, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from pymongo import InsertOne
+from pymongo.errors import BulkWriteError
 
 from database import get_db
 from models import (
+    BatchScanRequest,
+    BatchScanResponse,
+    BatchScanResult,
     HistoryResponse,
     LeaderboardEntry,
     NotificationItem,
@@ -23,8 +29,18 @@ from models import (
     ScanRequest,
     ScanResponse,
     StallInfo,
-    serialize_doc,
 )
+from utils.catalog import scan_totals, sponsor_cache
+from utils.counters import event_counters
+from utils.covisit import covisit_engine
+from utils.crowd import MAX_WINDOW_MINUTES, crowd_counter
+from utils.heatmap import DELTA_SUBPROTOCOL, heatmap_hub
+from utils.leaderboard import USER_PROJECTION, ranking
+from utils.response_cache import SCAN_AFFECTED_ROUTES, response_cache
+from utils.rollups import scan_rollups
+from utils.stalls import crowd_level, stall_snapshot
+from utils.serialization import FastJSONResponse, dumps_line
+from utils.write_behind import scan_buffer
 
 router = APIRouter(prefix="/api/game", tags=["Game"])
 
@@ -59,40 +75,121 @@ LEGENDARY_POKEMON = [
 LOW_TRAFFIC_THRESHOLD = 5  # < 5 scans in 10 min = Legendary
 LEGENDARY_POINTS = 50
 COMMON_POINTS = 10
+DUPLICATE_KEY_ERROR = 11000
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_PAGE_SIZE = 200
+STALLS_CACHE_TTL = 5  # seconds – map and alerts poll; scans expire them early
+LEADERBOARD_CACHE_TTL = 2
 
 
 # ──────────────────────── Helpers ──────────────────────────────────────
 
 
-async def _recent_scan_count(db, sponsor_oid: ObjectId, minutes: int = 10) -> int:
-    """Count scans at this sponsor in the last N minutes."""
-    threshold = datetime.now(timezone.utc) - timedelta(minutes=minutes)
-    return await db.scanevents.count_documents(
-        {"sponsor_id": sponsor_oid, "timestamp": {"$gte": threshold}}
-    )
+def _recent_scan_count(sponsor_oid: ObjectId, minutes: int = 10) -> int:
+    """Count scans at this sponsor in the last N minutes (in-process read)."""
+    return crowd_counter.count(sponsor_oid, minutes)
+
+
+def _encode_history_cursor(scan: dict) -> str:
+    """Opaque keyset cursor "<epoch_ms>_<scan _id>" for the last scan of a page."""
+    ts = scan["timestamp"]
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return f"{int(ts.timestamp() * 1000)}_{scan['_id']}"
+
+
+def _decode_history_cursor(cursor: str) -> tuple[datetime, ObjectId]:
+    try:
+        ms, oid = cursor.split("_", 1)
+        return datetime.fromtimestamp(int(ms) / 1000, tz=timezone.utc), ObjectId(oid)
+    except Exception as exc:
+        raise ValueError(cursor) from exc
+
+
+def _roll_encounter(sponsor_oid: ObjectId, pending: int = 0) -> tuple[dict, str, int, bool]:
+    """
+    Rarity algorithm: a quiet stall spawns a Legendary worth bonus points.
+    `pending` counts scans at this stall rolled but not yet recorded in the
+    crowd counter (earlier items of the same batch).
+    """
+    if _recent_scan_count(sponsor_oid) + pending < LOW_TRAFFIC_THRESHOLD:
+        return random.choice(LEGENDARY_POKEMON), "Legendary", LEGENDARY_POINTS, True
+    return random.choice(COMMON_POKEMON), "Normal", COMMON_POINTS, False
+
+
+def _spawn_update(poke: dict, active_until: datetime) -> dict:
+    """Spawn fields that make a caught Legendary the sponsor's current spawn."""
+    return {
+        "name": poke["name"],
+        "rarity": "Legendary",
+        "active_until": active_until,
+    }
+
+
+async def _credit_user(
+    db,
+    student_oid: ObjectId,
+    points: int,
+    legendaries: int,
+    scan_ids: list[ObjectId],
+) -> None:
+    """
+    Credit scans to a user's wallet & pokedex in one update, then mirror the
+    change into the in-memory leaderboard. A missing user is non-critical.
+    """
+    inc = {"wallet.total_points": points}
+    if legendaries:
+        inc["wallet.legendaries_caught"] = legendaries
+    try:
+        result = await db.users.update_one(
+            {"_id": student_oid},
+            {"$inc": inc, "$push": {"pokedex": {"$each": scan_ids}}},
+        )
+    except Exception:
+        return  # Non-critical: user might not exist yet
+    if result.matched_count:
+        await ranking.apply(
+            db, student_oid, points=points, legendaries=legendaries, pokemon=len(scan_ids)
+        )
 
 
 # ──────────────────────── GET /my-history ──────────────────────────────
 
 
 @router.get("/my-history")
-async def my_history(x_user_id: str = Header(default="")):
+async def my_history(
+    limit: int = Query(default=HISTORY_PAGE_SIZE, ge=1, le=HISTORY_MAX_PAGE_SIZE),
+    cursor: str | None = Query(default=None, description="next_cursor from the previous page"),
+    format: str = Query(default="json", pattern="^(json|ndjson)$"),
+    x_user_id: str = Header(default=""),
+):
     """
     Return the authenticated user's pokedex (scan events) and total points.
+    Scans are newest-first and keyset-paginated on (timestamp, _id) over the
+    (student_id, timestamp) index; pass `next_cursor` back as ?cursor=.
+    ?format=ndjson streams every scan from the cursor onwards, one per line.
+    Memory per request stays flat however many scans a user has.
     """
     db = get_db()
 
-    # If a user id is given, try to look them up
+    try:
+        after = _decode_history_cursor(cursor) if cursor else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    # The pokedex array is unbounded – never load it
     if x_user_id:
         try:
-            user = await db.users.find_one({"_id": ObjectId(x_user_id)})
+            user = await db.users.find_one({"_id": ObjectId(x_user_id)}, {"pokedex": 0})
         except Exception:
             user = None
     else:
         # Fallback: return the first user in the DB for demo purposes
-        user = await db.users.find_one()
+        user = await db.users.find_one({}, {"pokedex": 0}, sort=[("_id", 1)])
 
     if not user:
+        if format == "ndjson":
+            return StreamingResponse(iter(()), media_type="application/x-ndjson")
         return HistoryResponse(
             user_id="",
             name="Guest",
@@ -101,19 +198,39 @@ async def my_history(x_user_id: str = Header(default="")):
             pokedex=[],
         )
 
-    # Fetch the user's scan events (their pokedex)
-    pokedex_ids = user.get("pokedex", [])
-    scans = []
-    if pokedex_ids:
-        cursor = db.scanevents.find({"_id": {"$in": pokedex_ids}})
-        scans = await cursor.to_list(length=500)
-
-    return HistoryResponse(
-        user_id=str(user["_id"]),
-        name=user.get("name", "Unknown"),
-        total_points=user.get("wallet", {}).get("total_points", 0),
-        legendaries_caught=user.get("wallet", {}).get("legendaries_caught", 0),
-        pokedex=[serialize_doc(s) for s in scans],
+    query: dict = {"student_id": user["_id"]}
+    if after:
+        ts, oid = after
+        query["$or"] = [
+            {"timestamp": {"$lt": ts}},
+            {"timestamp": ts, "_id": {"$lt": oid}},
+        ]
+    scans_cursor = db.scanevents.find(query).sort([("timestamp", -1), ("_id", -1)])
+
+    if format == "ndjson":
+        async def stream():
+            async for scan in scans_cursor.batch_size(HISTORY_PAGE_SIZE):
+                yield dumps_line(scan)
+
+        return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+    # Fetch one extra row to know whether another page exists
+    scans = await scans_cursor.limit(limit + 1).to_list(length=limit + 1)
+    next_cursor = None
+    if len(scans) > limit:
+        scans = scans[:limit]
+        next_cursor = _encode_history_cursor(scans[-1])
+
+    # Raw scan documents go straight to the encoder (same shape as HistoryResponse)
+    return FastJSONResponse(
+        {
+            "user_id": user["_id"],
+            "name": user.get("name", "Unknown"),
+            "total_points": user.get("wallet", {}).get("total_points", 0),
+            "legendaries_caught": user.get("wallet", {}).get("legendaries_caught", 0),
+            "pokedex": scans,
+            "next_cursor": next_cursor,
+        }
     )
 
 
@@ -127,8 +244,14 @@ async def scan_stall(body: ScanRequest, x_user_id: str = Header(default="")):
       1. Count scans in last 10 min (Crowd Density).
       2. Rarity Algorithm: < LOW_TRAFFIC_THRESHOLD → Legendary + bonus pts.
       3. Flash Sale Trigger: low-traffic stall → is_flash_sale = True.
-      4. Insert scan event, update user wallet & pokedex.
+      4. Insert scan event, update user wallet & pokedex, the
+         per-minute scan rollup and the homepage counters.
       5. If low traffic, update sponsor's current_pokemon_spawn to Legendary.
+
+    The sponsor comes from the in-process cache, crowd density and the
+    visitor total from in-process counters, and the writes in steps 4–5 are
+    independent (the scan _id is generated client-side), so they run
+    concurrently: one awaited round trip on the hot path.
     """
     db = get_db()
 
@@ -143,7 +266,7 @@ async def scan_stall(body: ScanRequest, x_user_id: str = Header(default="")):
             points_earned=0,
         )
 
-    sponsor = await db.sponsors.find_one({"_id": sponsor_oid})
+    sponsor = await sponsor_cache.get(db, sponsor_oid)
     if not sponsor:
         return ScanResponse(
             stall_name="Unknown",
@@ -153,21 +276,10 @@ async def scan_stall(body: ScanRequest, x_user_id: str = Header(default="")):
             points_earned=0,
         )
 
-    # 1. Crowd density
-    recent_scans = await _recent_scan_count(db, sponsor_oid)
-    is_legendary = recent_scans < LOW_TRAFFIC_THRESHOLD
+    # 1–2. Crowd density → pick pokémon
+    poke, rarity, points_earned, is_legendary = _roll_encounter(sponsor_oid)
     is_flash_sale = is_legendary
 
-    # 2. Pick pokémon
-    if is_legendary:
-        poke = random.choice(LEGENDARY_POKEMON)
-        rarity = "Legendary"
-        points_earned = LEGENDARY_POINTS
-    else:
-        poke = random.choice(COMMON_POKEMON)
-        rarity = "Normal"
-        points_earned = COMMON_POINTS
-
     now = datetime.now(timezone.utc)
 
     # 3. Insert scan event
@@ -176,7 +288,9 @@ async def scan_stall(body: ScanRequest, x_user_id: str = Header(default="")):
     except Exception:
         student_oid = None
 
+    scan_event_id = ObjectId()
     scan_doc = {
+        "_id": scan_event_id,
         "student_id": student_oid,
         "sponsor_id": sponsor_oid,
         "timestamp": now,
@@ -189,43 +303,48 @@ async def scan_stall(body: ScanRequest, x_user_id: str = Header(default="")):
         "is_flash_sale": is_flash_sale,
         "sync_status": True,
     }
-    result = await db.scanevents.insert_one(scan_doc)
-    scan_event_id = result.inserted_id
+    writes = []
 
-    # 4. Update user wallet & pokedex
-    if student_oid:
-        try:
-            update_fields: dict = {
-                "$inc": {"wallet.total_points": points_earned},
-                "$push": {"pokedex": scan_event_id},
-            }
-            if is_legendary:
-                update_fields["$inc"]["wallet.legendaries_caught"] = 1
+    buffered = scan_buffer.active
+    if buffered:
+        # Write-behind mode: insert + wallet/pokedex credit happen at group commit
+        await scan_buffer.submit(scan_doc)
+    else:
+        writes.append(db.scanevents.insert_one(scan_doc))
+        writes.append(scan_rollups.record(db, [scan_doc]))
+        writes.append(event_counters.record(db, [scan_doc]))
 
-            await db.users.update_one(
-                {"_id": student_oid}, update_fields
-            )
-        except Exception:
-            pass  # Non-critical: user might not exist yet
+    # 4. Update user wallet & pokedex
+    if student_oid and not buffered:
+        writes.append(
+            _credit_user(db, student_oid, points_earned, int(is_legendary), [scan_event_id])
+        )
 
     # 5. If low traffic, update sponsor's pokemon spawn
     if is_legendary:
-        await db.sponsors.update_one(
-            {"_id": sponsor_oid},
-            {
-                "$set": {
-                    "current_pokemon_spawn.name": poke["name"],
-                    "current_pokemon_spawn.rarity": "Legendary",
-                    "current_pokemon_spawn.active_until": now + timedelta(hours=1),
-                }
-            },
+        spawn = _spawn_update(poke, now + timedelta(hours=1))
+        writes.append(
+            db.sponsors.update_one(
+                {"_id": sponsor_oid},
+                {"$set": {f"current_pokemon_spawn.{k}": v for k, v in spawn.items()}},
+            )
         )
+        sponsor_cache.set_spawn(sponsor_oid, spawn)
+
+    if writes:
+        await asyncio.gather(*writes)
+    crowd_counter.record(sponsor_oid, now)
+    covisit_engine.record(student_oid, sponsor_oid)
+    response_cache.invalidate(*SCAN_AFFECTED_ROUTES)
 
     # Total scans for this sponsor (for visitor_count)
-    total_scans = await db.scanevents.count_documents({"sponsor_id": sponsor_oid})
+    if scan_totals.ready:
+        total_scans = scan_totals.increment(sponsor_oid)
+    else:
+        total_scans = await db.scanevents.count_documents({"sponsor_id": sponsor_oid})
 
     return ScanResponse(
-        stall_name=sponsor.get("company_name", "Unknown"),
+        stall_name=sponsor.company_name,
         pokemon=PokemonInfo(name=poke["name"], type=poke["type"], rarity=rarity),
         visitor_count=total_scans,
         is_flash_sale=is_flash_sale,
@@ -233,117 +352,327 @@ async def scan_stall(body: ScanRequest, x_user_id: str = Header(default="")):
     )
 
 
+# ──────────────────────── POST /scan/batch ────────────────────────────
+
+
+@router.post("/scan/batch", response_model=BatchScanResponse)
+async def scan_batch(body: BatchScanRequest, x_user_id: str = Header(default="")):
+    """
+    Ingest scans replayed from a device's offline queue in one request:
+      1. Skip repeated idempotency keys in the batch; reject unknown stalls.
+      2. Roll each scan's Pokémon with the same rarity algorithm as /scan,
+         counting the batch's earlier scans at the stall towards its crowd.
+      3. Insert all scans with one unordered bulk_write. The unique index on
+         idempotency_key turns already-synced scans into duplicates.
+      4. Credit the accepted scans to the user's wallet & pokedex in one update.
+    """
+    db = get_db()
+
+    try:
+        student_oid = ObjectId(x_user_id) if x_user_id else None
+    except Exception:
+        student_oid = None
+
+    now = datetime.now(timezone.utc)
+    results: list[BatchScanResult] = []
+    docs: list[dict] = []
+    doc_results: list[BatchScanResult] = []  # parallel to docs
+    seen_keys: set[str] = set()
+    rolled: dict[ObjectId, int] = {}  # scans rolled per stall in this batch
+
+    # 1–2. Validate and roll every scan
+    for item in body.scans:
+        result = BatchScanResult(idempotency_key=item.idempotency_key, status="rejected")
+        results.append(result)
+
+        if item.idempotency_key in seen_keys:
+            result.status = "duplicate"
+            continue
+        seen_keys.add(item.idempotency_key)
+
+        try:
+            sponsor_oid = ObjectId(item.sponsor_id)
+        except Exception:
+            continue
+        if not await sponsor_cache.get(db, sponsor_oid):
+            continue
+
+        poke, rarity, points, is_legendary = _roll_encounter(sponsor_oid, rolled.get(sponsor_oid, 0))
+        rolled[sponsor_oid] = rolled.get(sponsor_oid, 0) + 1
+        scanned_at = item.client_timestamp
+        if scanned_at.tzinfo is None:
+            scanned_at = scanned_at.replace(tzinfo=timezone.utc)
+        scanned_at = min(scanned_at, now)  # never trust a clock from the future
+
+        docs.append(
+            {
+                "_id": ObjectId(),
+                "student_id": student_oid,
+                "sponsor_id": sponsor_oid,
+                "timestamp": scanned_at,
+                "pokemon_caught": {
+                    "name": poke["name"],
+                    "type": poke["type"],
+                    "rarity": rarity,
+                },
+                "points_awarded": points,
+                "is_flash_sale": is_legendary,
+                "sync_status": True,
+                "idempotency_key": item.idempotency_key,
+            }
+        )
+        result.status = "accepted"
+        result.pokemon = PokemonInfo(name=poke["name"], type=poke["type"], rarity=rarity)
+        result.points_earned = points
+        doc_results.append(result)
+
+    # 3. One bulk insert; duplicate keys are already-synced scans
+    if docs:
+        try:
+            await db.scanevents.bulk_write([InsertOne(d) for d in docs], ordered=False)
+        except BulkWriteError as exc:
+            for err in exc.details.get("writeErrors", []):
+                if err.get("code") != DUPLICATE_KEY_ERROR:
+                    raise
+                dup = doc_results[err["index"]]
+                dup.status = "duplicate"
+                dup.pokemon = None
+                dup.points_earned = 0
+
+    accepted = [d for d, r in zip(docs, doc_results) if r.status == "accepted"]
+
+    # 4. Aggregate wallet/pokedex credit + latest Legendary spawn per stall
+    writes = []
+    if student_oid and accepted:
+        writes.append(
+            _credit_user(
+                db,
+                student_oid,
+                sum(d["points_awarded"] for d in accepted),
+                sum(d["is_flash_sale"] for d in accepted),
+                [d["_id"] for d in accepted],
+            )
+        )
+    if accepted:
+        writes.append(scan_rollups.record(db, accepted))
+        writes.append(event_counters.record(db, accepted))
+
+    latest_legendary: dict[ObjectId, dict] = {}
+    for d in accepted:
+        crowd_counter.record(d["sponsor_id"], d["timestamp"])
+        covisit_engine.record(student_oid, d["sponsor_id"])
+        if scan_totals.ready:
+            scan_totals.increment(d["sponsor_id"])
+        if d["is_flash_sale"]:
+            latest = latest_legendary.get(d["sponsor_id"])
+            if latest is None or d["timestamp"] > latest["timestamp"]:
+                latest_legendary[d["sponsor_id"]] = d
+
+    for sponsor_oid, d in latest_legendary.items():
+        active_until = d["timestamp"] + timedelta(hours=1)
+        if active_until <= now:
+            continue  # that spawn would already have expired
+        spawn = _spawn_update(d["pokemon_caught"], active_until)
+        writes.append(
+            db.sponsors.update_one(
+                {"_id": sponsor_oid},
+                {"$set": {f"current_pokemon_spawn.{k}": v for k, v in spawn.items()}},
+            )
+        )
+        sponsor_cache.set_spawn(sponsor_oid, spawn)
+
+    if writes:
+        await asyncio.gather(*writes)
+    if accepted:
+        response_cache.invalidate(*SCAN_AFFECTED_ROUTES)
+
+    return BatchScanResponse(
+        accepted=len(accepted),
+        duplicates=sum(r.status == "duplicate" for r in results),
+        rejected=sum(r.status == "rejected" for r in results),
+        points_earned=sum(d["points_awarded"] for d in accepted),
+        results=results,
+    )
+
+
+# ──────────────────────── GET /scan/write-behind ──────────────────────
+
+
+@router.get("/scan/write-behind")
+async def write_behind_stats():
+    """Write-behind buffer metrics: queue depth, flush sizes and flush lag."""
+    return scan_buffer.stats()
+
+
 # ──────────────────────── GET /leaderboard ────────────────────────────
 
 
 @router.get("/leaderboard", response_model=list[LeaderboardEntry])
+@response_cache.cached(
+    "leaderboard",
+    ttl=LEADERBOARD_CACHE_TTL,
+    stale_ttl=LEADERBOARD_CACHE_TTL,
+    vary=("filter", "offset", "limit"),
+)
 async def leaderboard(
     filter: str | None = Query(default=None, description="Pass 'friends' to filter"),
+    offset: int = Query(default=0, ge=0),
+    limit: int = Query(default=50, ge=1, le=100),
     x_user_id: str = Header(default=""),
 ):
     """
-    Leaderboard ranked by total_points.
+    Leaderboard ranked by total_points, paginated with ?offset=&limit=.
     ?filter=friends → only friends + self (if friend model existed).
     For now, returns all users sorted by points.
+    Served from the in-memory ranking; falls back to MongoDB until it is seeded.
     """
+    if ranking.ready:
+        # Entries are already plain dicts – encode them without re-validation
+        return FastJSONResponse(ranking.page(offset, limit))
+
     db = get_db()
 
     pipeline = [
-        {"$sort": {"wallet.total_points": -1}},
-        {"$limit": 50},
-        {
-            "$project": {
-                "name": 1,
-                "wallet": 1,
-                "pokedex": 1,
-            }
-        },
+        {"$sort": {"wallet.total_points": -1, "_id": 1}},
+        {"$skip": offset},
+        {"$limit": limit},
+        {"$project": USER_PROJECTION},
     ]
 
     cursor = db.users.aggregate(pipeline)
-    users = await cursor.to_list(length=50)
-
-    entries = []
-    for i, u in enumerate(users):
-        entries.append(
-            LeaderboardEntry(
-                rank=i + 1,
-                user_id=str(u["_id"]),
-                name=u.get("name", "Unknown"),
-                points=u.get("wallet", {}).get("total_points", 0),
-                pokemon_count=len(u.get("pokedex", [])),
-                legendaries_caught=u.get("wallet", {}).get("legendaries_caught", 0),
-            )
+    users = await cursor.to_list(length=limit)
+
+    return [
+        LeaderboardEntry(
+            rank=offset + i + 1,
+            user_id=str(u["_id"]),
+            name=u.get("name", "Unknown"),
+            points=u.get("points", 0),
+            pokemon_count=u.get("pokemon_count", 0),
+            legendaries_caught=u.get("legendaries_caught", 0),
         )
+        for i, u in enumerate(users)
+    ]
+
+
+# ──────────────────────── GET /my-rank ────────────────────────────────
+
 
-    return entries
+@router.get("/my-rank", response_model=LeaderboardEntry)
+async def my_rank(x_user_id: str = Header(default="")):
+    """The authenticated user's leaderboard entry and rank (O(log n) lookup)."""
+    try:
+        user_oid = ObjectId(x_user_id) if x_user_id else None
+    except Exception:
+        user_oid = None
+
+    entry = ranking.rank_of(user_oid) if user_oid else None
+    if entry is None and user_oid and not ranking.ready:
+        # Not seeded yet: rank = 1 + users with more points
+        db = get_db()
+        rows = await db.users.aggregate(
+            [{"$match": {"_id": user_oid}}, {"$project": USER_PROJECTION}]
+        ).to_list(length=1)
+        if rows:
+            u = rows[0]
+            ahead = await db.users.count_documents(
+                {"wallet.total_points": {"$gt": u.get("points", 0)}}
+            )
+            entry = {
+                "rank": ahead + 1,
+                "user_id": str(u["_id"]),
+                "name": u.get("name", "Unknown"),
+                "points": u.get("points", 0),
+                "pokemon_count": u.get("pokemon_count", 0),
+                "legendaries_caught": u.get("legendaries_caught", 0),
+            }
+
+    if entry is None:
+        return LeaderboardEntry(
+            rank=0,
+            user_id="",
+            name="Guest",
+            points=0,
+            pokemon_count=0,
+            legendaries_caught=0,
+        )
+    return LeaderboardEntry(**entry)
 
 
 # ──────────────────────── GET /stalls ─────────────────────────────────
 
 
 @router.get("/stalls", response_model=list[StallInfo])
-async def list_stalls():
+@response_cache.cached("stalls", ttl=STALLS_CACHE_TTL, stale_ttl=STALLS_CACHE_TTL)
+async def list_stalls(
+    window: int = Query(
+        default=10,
+        ge=1,
+        le=MAX_WINDOW_MINUTES,
+        description="Crowd density window in minutes (e.g. 10 or 30)",
+    ),
+):
     """
     List all sponsors with live crowd level and current pokemon spawn.
-    Used for the event map view.
+    Used for the event map view. `scan_count_10m` holds the count for `?window=`.
     """
     db = get_db()
 
-    sponsors = await db.sponsors.find().to_list(length=100)
+    snapshot = await stall_snapshot(db, windows=(window,))
     result = []
 
-    for sp in sponsors:
-        sp_oid = sp["_id"]
-        scan_count = await _recent_scan_count(db, sp_oid)
-
-        if scan_count < 5:
-            crowd_level = "Low"
-        elif scan_count < 20:
-            crowd_level = "Medium"
-        else:
-            crowd_level = "High"
-
-        spawn = sp.get("current_pokemon_spawn", {})
+    for row in snapshot:
+        sp = row["sponsor"]
+        scan_count = row["counts"][window]
+        spawn = sp.current_pokemon_spawn
 
         result.append(
-            StallInfo(
-                stall_id=str(sp_oid),
-                company_name=sp.get("company_name", "Unknown"),
-                category=sp.get("category", ""),
-                map_location=sp.get("map_location", {"x_coord": 0, "y_coord": 0}),
-                current_pokemon_spawn={
+            {
+                "stall_id": sp.id,
+                "company_name": sp.company_name,
+                "category": sp.category,
+                "map_location": sp.map_location,
+                "current_pokemon_spawn": {
                     "name": spawn.get("name", "Ditto"),
                     "rarity": spawn.get("rarity", "Normal"),
                 },
-                crowd_level=crowd_level,
-                scan_count_10m=scan_count,
-            )
+                "crowd_level": crowd_level(scan_count),
+                "scan_count_10m": scan_count,
+            }
         )
 
-    return result
+    # Rows match StallInfo; encoded once per cache fill, no re-validation
+    return FastJSONResponse(result)
 
 
 # ──────────────────────── GET /notifications ──────────────────────────
 
 
 @router.get("/notifications", response_model=list[NotificationItem])
-async def notifications():
+@response_cache.cached("notifications", ttl=STALLS_CACHE_TTL, stale_ttl=STALLS_CACHE_TTL)
+async def notifications(
+    window: int = Query(
+        default=10,
+        ge=1,
+        le=MAX_WINDOW_MINUTES,
+        description="Crowd density window in minutes (e.g. 10 or 30)",
+    ),
+):
     """
     Return alerts for legendary Pokémon opportunities at low-crowd stalls.
     """
     db = get_db()
-    sponsors = await db.sponsors.find().to_list(length=100)
+    snapshot = await stall_snapshot(db, windows=(window,))
 
     alerts: list[NotificationItem] = []
-    for sp in sponsors:
-        scan_count = await _recent_scan_count(db, sp["_id"])
-        if scan_count < LOW_TRAFFIC_THRESHOLD:
+    for row in snapshot:
+        sp = row["sponsor"]
+        if row["counts"][window] < LOW_TRAFFIC_THRESHOLD:
             alerts.append(
                 NotificationItem(
-                    stall_id=str(sp["_id"]),
-                    stall_name=sp.get("company_name", "Unknown"),
-                    message=f"🔥 Legendary Pokémon spotted at {sp.get('company_name')}! Low crowd – head there now!",
+                    stall_id=str(sp.id),
+                    stall_name=sp.company_name,
+                    message=f"🔥 Legendary Pokémon spotted at {sp.company_name}! Low crowd – head there now!",
                     type="legendary_alert",
                 )
             )
@@ -366,43 +695,27 @@ async def notifications():
 
 @router.websocket("/heatmap")
 async def heatmap(websocket: WebSocket):
-    """Broadcast live crowd heatmap data for each sponsor every 30s."""
-    await websocket.accept()
+    """
+    Stream live crowd heatmap frames for each sponsor (every 30s).
+    Frames come pre-serialised from the shared broadcast hub, so connections
+    add no database work of their own.
+
+    Offer the `eventflow.heatmap.delta.v1` subprotocol (or pass
+    ?protocol=delta) to get a keyframe followed by binary count deltas
+    instead of the full JSON list each tick – see utils/heatmap.py.
+    """
+    offered = websocket.scope.get("subprotocols", [])
+    delta = DELTA_SUBPROTOCOL in offered or websocket.query_params.get("protocol") == "delta"
+    await websocket.accept(subprotocol=DELTA_SUBPROTOCOL if DELTA_SUBPROTOCOL in offered else None)
+    queue = heatmap_hub.subscribe(delta=delta)
     try:
         while True:
-            db = get_db()
-            sponsors = await db.sponsors.find().to_list(length=100)
-
-            data = []
-            for sp in sponsors:
-                scan_count = await _recent_scan_count(db, sp["_id"], minutes=30)
-                loc = sp.get("map_location", {})
-
-                if scan_count < 5:
-                    crowd = "Low"
-                elif scan_count < 20:
-                    crowd = "Medium"
-                else:
-                    crowd = "High"
-
-                data.append(
-                    {
-                        "stall_id": str(sp["_id"]),
-                        "stall_name": sp.get("company_name", ""),
-                        "x": loc.get("x_coord", 0),
-                        "y": loc.get("y_coord", 0),
-                        "scan_count": scan_count,
-                        "crowd_level": crowd,
-                        "legendary_available": crowd == "Low",
-                    }
-                )
-
-            await websocket.send_json(
-                {
-                    "heatmap": data,
-                    "timestamp": datetime.now(timezone.utc).isoformat(),
-                }
-            )
-            await asyncio.sleep(30)
+            frame = await queue.get()
+            if isinstance(frame, bytes):
+                await websocket.send_bytes(frame)
+            else:
+                await websocket.send_text(frame)
     except WebSocketDisconnect:
         pass
+    finally:
+        heatmap_hub.unsubscribe(queue)
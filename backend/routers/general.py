@@ -1,61 +1,51 @@
 """
 EventFlow – General Router
-Homepage: dynamic aggregate stats from MongoDB.
+Homepage: aggregate event stats from the `counters` document.
 """
 
+import asyncio
+
 from fastapi import APIRouter
 
 from database import get_db
 from models import StatsResponse
+from utils.catalog import sponsor_cache
+from utils.counters import event_counters
+from utils.response_cache import response_cache
 
 router = APIRouter(prefix="/api/general", tags=["General"])
 
+STATS_CACHE_TTL = 5  # seconds a snapshot is served as fresh
+STATS_STALE_TTL = 60  # further seconds it is served while refreshing in the background
+
 
 @router.get("/stats", response_model=StatsResponse)
+@response_cache.cached("stats", ttl=STATS_CACHE_TTL, stale_ttl=STATS_STALE_TTL, max_entries=1)
 async def get_stats():
-    """Return live aggregate event statistics from MongoDB."""
+    """
+    Return aggregate event statistics. Scan totals come from the counters
+    document kept by the scan path and collection sizes from metadata
+    counts, so the cost does not grow with `scanevents`; the result is
+    cached in process with stale-while-revalidate.
+    """
     db = get_db()
 
-    total_attendees = await db.users.count_documents({})
-    total_sponsors = await db.sponsors.count_documents({})
-    total_scans = await db.scanevents.count_documents({})
-
-    # Legendary count
-    legendary_count = await db.scanevents.count_documents(
-        {"pokemon_caught.rarity": "Legendary"}
+    total_attendees, total_sponsors, counters = await asyncio.gather(
+        db.users.estimated_document_count(),
+        db.sponsors.estimated_document_count(),
+        event_counters.read(db),
     )
 
-    # Top stall: sponsor with the most scans
-    top_pipeline = [
-        {"$group": {"_id": "$sponsor_id", "count": {"$sum": 1}}},
-        {"$sort": {"count": -1}},
-        {"$limit": 1},
-        {
-            "$lookup": {
-                "from": "sponsors",
-                "localField": "_id",
-                "foreignField": "_id",
-                "as": "sponsor",
-            }
-        },
-        {"$unwind": {"path": "$sponsor", "preserveNullAndEmptyArrays": True}},
-        {
-            "$project": {
-                "_id": 0,
-                "company_name": "$sponsor.company_name",
-                "count": 1,
-            }
-        },
-    ]
-    cursor = db.scanevents.aggregate(top_pipeline)
-    top_result = await cursor.to_list(length=1)
-    top_stall = top_result[0]["company_name"] if top_result else "N/A"
+    top_stall = "N/A"
+    if counters["top_sponsor_id"] is not None:
+        sponsor = await sponsor_cache.get(db, counters["top_sponsor_id"])
+        top_stall = sponsor.company_name if sponsor else None
 
     return StatsResponse(
         total_attendees=total_attendees,
         total_sponsors=total_sponsors,
-        total_scans=total_scans,
+        total_scans=counters["total_scans"],
         top_stall=top_stall,
-        legendary_count=legendary_count,
+        legendary_count=counters["legendary_count"],
         highlight="⚡ Legendary Pokémon spawning at low-crowd stalls – explore now!",
     )
@@ -6,20 +6,36 @@ All data sourced from MongoDB via async Motor.
 
 from __future__ import annotations
 
+import asyncio
+
 from bson import ObjectId
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query
 
 from database import get_db
-from models import AnalyticsResponse, ScanCandidateRequest, ScanCandidateResponse
+from models import (
+    AnalyticsResponse,
+    CoVisitItem,
+    HourlyTraffic,
+    ScanCandidateRequest,
+    ScanCandidateResponse,
+)
 from utils.analytics import (
-    calculate_avg_wait_time,
     calculate_cpi,
     calculate_cross_pollination,
     calculate_flash_sale_lift,
+    calculate_wait_time_stats,
+    format_wait_time,
 )
+from utils.cache import TTLCache
+from utils.catalog import SponsorRecord, sponsor_cache
+from utils.covisit import covisit_engine
+from utils.rollups import scan_rollups
 
 router = APIRouter(prefix="/api/sponsor", tags=["Sponsor"])
 
+ANALYTICS_CACHE_TTL = 15  # seconds – dashboards auto-refresh
+_analytics_cache = TTLCache(ttl=ANALYTICS_CACHE_TTL, max_entries=256)
+
 
 # ──────────────────── POST /scan-candidate ────────────────────────────
 
@@ -60,9 +76,13 @@ async def stall_analytics(stall_id: str):
       - Peak Traffic Hour (aggregation by hour)
       - Anonymous Demographics (major breakdown)
       - Cost per Interaction (sponsorship_cost / total_scans)
-      - Average Wait Time (mean scan-to-scan delta)
+      - Average Wait Time (mean scan-to-scan delta, p50/p90/p99, per hour)
       - Cross Pollination Rate
       - Flash Sale Lift
+
+    The scan metrics come from one `$facet` aggregation, and the result is
+    cached per stall for ANALYTICS_CACHE_TTL seconds; concurrent refreshes
+    of the same stall share a single computation.
     """
     db = get_db()
 
@@ -71,84 +91,153 @@ async def stall_analytics(stall_id: str):
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid stall_id format")
 
-    sponsor = await db.sponsors.find_one({"_id": sponsor_oid})
+    sponsor = await sponsor_cache.get(db, sponsor_oid)
     if not sponsor:
         raise HTTPException(status_code=404, detail="Stall not found")
 
-    scans_col = db.scanevents
+    return await _analytics_cache.get_or_compute(
+        sponsor_oid, lambda: _compute_stall_analytics(db, sponsor)
+    )
 
-    # ── Total footfall (unique students) ──
-    unique_students = await scans_col.distinct("student_id", {"sponsor_id": sponsor_oid})
-    total_footfall = len(unique_students)
-    total_scans = await scans_col.count_documents({"sponsor_id": sponsor_oid})
 
-    # ── Peak traffic hour ──
-    peak_pipeline = [
-        {"$match": {"sponsor_id": sponsor_oid}},
-        {"$group": {"_id": {"$hour": "$timestamp"}, "count": {"$sum": 1}}},
-        {"$sort": {"count": -1}},
-        {"$limit": 1},
-    ]
-    peak_result = await scans_col.aggregate(peak_pipeline).to_list(length=1)
-    peak_hour = peak_result[0]["_id"] if peak_result else None
+async def _compute_stall_analytics(db, sponsor: SponsorRecord) -> AnalyticsResponse:
+    sponsor_oid = sponsor.id
+    scans_col = db.scanevents
 
-    # ── Demographics (group by major) ──
-    demo_pipeline = [
+    pipeline = [
         {"$match": {"sponsor_id": sponsor_oid}},
-        {"$group": {"_id": "$student_id"}},
-        {
-            "$lookup": {
-                "from": "users",
-                "localField": "_id",
-                "foreignField": "_id",
-                "as": "user",
-            }
-        },
-        {"$unwind": "$user"},
         {
-            "$group": {
-                "_id": "$user.demographics.major",
-                "count": {"$sum": 1},
+            "$facet": {
+                # Scan totals and flash-sale scans
+                "totals": [
+                    {
+                        "$group": {
+                            "_id": None,
+                            "scans": {"$sum": 1},
+                            "flash_scans": {"$sum": {"$cond": ["$is_flash_sale", 1, 0]}},
+                        }
+                    }
+                ],
+                # Total footfall (unique students)
+                "footfall": [{"$group": {"_id": "$student_id"}}, {"$count": "students"}],
+                # Peak traffic hour
+                "peak": [
+                    {"$group": {"_id": {"$hour": "$timestamp"}, "count": {"$sum": 1}}},
+                    {"$sort": {"count": -1}},
+                    {"$limit": 1},
+                ],
+                # Demographics (group by major)
+                "demographics": [
+                    {"$group": {"_id": "$student_id"}},
+                    {
+                        "$lookup": {
+                            "from": "users",
+                            "localField": "_id",
+                            "foreignField": "_id",
+                            "as": "user",
+                        }
+                    },
+                    {"$unwind": "$user"},
+                    {
+                        "$group": {
+                            "_id": "$user.demographics.major",
+                            "count": {"$sum": 1},
+                        }
+                    },
+                ],
             }
         },
     ]
-    demo_result = await scans_col.aggregate(demo_pipeline).to_list(length=50)
+    # The facet pass, the wait-time stream and cross-pollination are independent
+    facet_rows, wait_stats, cross_poll = await asyncio.gather(
+        scans_col.aggregate(pipeline).to_list(length=1),
+        calculate_wait_time_stats(sponsor_oid, db),
+        calculate_cross_pollination(str(sponsor_oid), db),
+    )
+    facets = facet_rows[0]
+
+    totals = facets["totals"][0] if facets["totals"] else {}
+    total_scans = totals.get("scans", 0)
+    total_footfall = facets["footfall"][0]["students"] if facets["footfall"] else 0
+    peak_hour = facets["peak"][0]["_id"] if facets["peak"] else None
+
     demographics = {
         entry["_id"]: entry["count"]
-        for entry in demo_result
+        for entry in facets["demographics"]
         if entry["_id"] is not None
     }
     if not demographics:
         demographics = {"Unknown": total_footfall}
 
     # ── Cost per Interaction ──
-    sponsorship_cost = sponsor.get("sponsorship_package_cost", 0)
+    sponsorship_cost = sponsor.sponsorship_package_cost
     cpi = calculate_cpi(sponsorship_cost, total_scans)
 
-    # ── Average Wait Time ──
-    ts_cursor = scans_col.find(
-        {"sponsor_id": sponsor_oid}, {"timestamp": 1}
-    ).sort("timestamp", 1)
-    timestamps = [doc["timestamp"] for doc in await ts_cursor.to_list(length=5000)]
-    avg_wait = calculate_avg_wait_time(timestamps)
-
-    # ── Cross Pollination ──
-    cross_poll = await calculate_cross_pollination(stall_id, db)
+    # ── Average Wait Time (+ percentiles and hourly breakdown) ──
+    avg_wait = format_wait_time(wait_stats["avg_seconds"]) if wait_stats else None
 
     # ── Flash Sale Lift ──
-    flash_scans = await scans_col.count_documents(
-        {"sponsor_id": sponsor_oid, "is_flash_sale": True}
-    )
-    flash_lift = calculate_flash_sale_lift(flash_scans, total_scans)
+    flash_lift = calculate_flash_sale_lift(totals.get("flash_scans", 0), total_scans)
 
     return AnalyticsResponse(
-        stall_id=str(sponsor["_id"]),
-        stall_name=sponsor.get("company_name", "Unknown"),
+        stall_id=str(sponsor_oid),
+        stall_name=sponsor.company_name,
         total_footfall=total_footfall,
         peak_traffic_hour=peak_hour,
         demographics=demographics,
         cost_per_interaction=cpi,
         avg_wait_time=avg_wait,
+        wait_time=wait_stats,
         cross_pollination=cross_poll,
         flash_sale_lift=flash_lift,
     )
+
+
+# ──────────────────── GET /analytics/{stall_id}/co-visits ─────────────
+
+
+@router.get("/analytics/{stall_id}/co-visits", response_model=list[CoVisitItem])
+async def stall_co_visits(stall_id: str, limit: int = Query(default=10, ge=1, le=100)):
+    """Which other stalls did this stall's visitors go to? (co-visit matrix lookup)"""
+    db = get_db()
+
+    try:
+        sponsor_oid = ObjectId(stall_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid stall_id format")
+
+    if not await sponsor_cache.get(db, sponsor_oid):
+        raise HTTPException(status_code=404, detail="Stall not found")
+    if not covisit_engine.ready:
+        raise HTTPException(status_code=503, detail="Co-visit data is still loading")
+
+    items = []
+    for other_oid, shared in covisit_engine.co_visits(sponsor_oid, limit):
+        other = await sponsor_cache.get(db, other_oid)
+        items.append(
+            CoVisitItem(
+                stall_id=str(other_oid),
+                stall_name=other.company_name if other else "Unknown",
+                shared_visitors=shared,
+            )
+        )
+    return items
+
+
+# ──────────────────── GET /analytics/{stall_id}/hourly ────────────────
+
+
+@router.get("/analytics/{stall_id}/hourly", response_model=list[HourlyTraffic])
+async def stall_hourly_traffic(stall_id: str):
+    """24 hour-of-day traffic bars from the scan rollups (no raw scanevents scan)."""
+    db = get_db()
+
+    try:
+        sponsor_oid = ObjectId(stall_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid stall_id format")
+
+    if not await sponsor_cache.get(db, sponsor_oid):
+        raise HTTPException(status_code=404, detail="Stall not found")
+
+    return [HourlyTraffic(**bar) for bar in await scan_rollups.hourly(db, sponsor_oid)]
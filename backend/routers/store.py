@@ -1,75 +1,157 @@
 """
 EventFlow – Store Router
 Redemption store: browse rewards, spend points for Pokémon merch & food.
-Atomic MongoDB transactions for thread-safe redemptions.
+Guarded conditional updates for race-free redemptions; every voucher is
+stored in `redemptions` so retries are idempotent and booths can verify it.
 """
 
 from __future__ import annotations
 
+import asyncio
 import secrets
+from datetime import datetime, timedelta, timezone
+from typing import Optional
 
 from bson import ObjectId
 from fastapi import APIRouter, Header, HTTPException
 from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, PyMongoError
 
 from database import get_db
-from models import RedeemRequest, RedeemResponse, RewardItem
+from models import RedeemRequest, RedeemResponse, RewardItem, VoucherResponse
+from utils.cache import TTLCache
+from utils.catalog import RewardRecord, reward_cache
+from utils.leaderboard import ranking
+from utils.response_cache import REDEEM_AFFECTED_ROUTES, response_cache
+from utils.serialization import FastJSONResponse
 
 router = APIRouter(prefix="/api/store", tags=["Store"])
 
+VOUCHER_CACHE_TTL = 3600  # seconds – stored redemptions never change
+VOUCHER_CACHE_SIZE = 50_000
+ISSUE_ATTEMPTS = 3  # tries at storing an issued voucher before undoing the redemption
+ISSUE_RETRY_DELAY = 0.05  # seconds, times the attempt number
+PENDING_TIMEOUT = 30  # seconds before a retry may take over an unfinished reservation
+
+# Keyed redemptions tag the wallet and stock updates with their reservation id,
+# so an attempt that takes over a reservation never debits it a second time.
+# Only recent ids matter (takeovers happen within minutes), so the list is capped.
+APPLIED_FIELD = "redemptions_applied"
+APPLIED_KEPT = 100
+
+# Recently issued vouchers (by code) and redeem replies (by idempotency key),
+# so booth lookups and client retries are answered without MongoDB
+_vouchers = TTLCache(ttl=VOUCHER_CACHE_TTL, max_entries=VOUCHER_CACHE_SIZE)
+_replies = TTLCache(ttl=VOUCHER_CACHE_TTL, max_entries=VOUCHER_CACHE_SIZE)
+
+
+def _new_voucher_code() -> str:
+    return f"EF-{secrets.token_hex(4).upper()}"
+
+
+async def _insert_redemption(db, record: dict) -> None:
+    """Insert a redemption, drawing a new voucher code on the (rare) code collision."""
+    for _ in range(5):
+        try:
+            await db.redemptions.insert_one(record)
+            return
+        except DuplicateKeyError as exc:
+            if "voucher_code" not in (exc.details or {}).get("keyPattern", {}):
+                raise
+            record["voucher_code"] = _new_voucher_code()
+    raise HTTPException(status_code=503, detail="Could not allocate a voucher code")
+
+
+async def _store_issued(db, record: dict, key: Optional[str]) -> bool:
+    """
+    Mark the reservation issued (or insert the record), retrying transient
+    errors. False if the reservation is no longer pending (another attempt
+    issued or released it).
+    """
+    for attempt in range(1, ISSUE_ATTEMPTS + 1):
+        try:
+            if key:
+                result = await db.redemptions.update_one(
+                    {"_id": record["_id"], "status": "pending"},
+                    {"$set": {"status": "issued", "reply": record["reply"]}},
+                )
+                return result.matched_count == 1
+            await _insert_redemption(db, record)
+            return True
+        except PyMongoError:
+            if attempt == ISSUE_ATTEMPTS:
+                raise
+            await asyncio.sleep(ISSUE_RETRY_DELAY * attempt)
+
+
+def _reply_from(record: dict, user_oid: ObjectId, reward_oid: ObjectId) -> RedeemResponse:
+    """The stored reply for a retried request (same idempotency key)."""
+    if record["user_id"] != user_oid or record["reward_id"] != reward_oid:
+        raise HTTPException(status_code=409, detail="Idempotency key belongs to another request")
+    if record["status"] != "issued":
+        raise HTTPException(status_code=409, detail="This redemption is still in progress")
+    return RedeemResponse(**record["reply"])
+
 
 # ──────────────────── GET /rewards ────────────────────────────────────
 
 
 @router.get("/rewards", response_model=list[RewardItem])
 async def list_rewards(x_user_id: str = Header(default="")):
-    """List all available rewards with stock and whether the user can afford each."""
+    """
+    List all available rewards with stock and whether the user can afford each.
+    Reward details come from the in-process catalog; the wallet and the live
+    `stock_remaining` of every reward are read concurrently per request.
+    """
     db = get_db()
 
-    # Get user points
-    user_points = 0
-    user_legendaries = 0
     if x_user_id:
         try:
-            user = await db.users.find_one({"_id": ObjectId(x_user_id)})
-            if user:
-                user_points = user.get("wallet", {}).get("total_points", 0)
-                user_legendaries = user.get("wallet", {}).get("legendaries_caught", 0)
+            user_query = db.users.find_one({"_id": ObjectId(x_user_id)}, {"wallet": 1})
         except Exception:
-            pass
+            user_query = None
     else:
         # Fallback: first user
-        user = await db.users.find_one()
-        if user:
-            user_points = user.get("wallet", {}).get("total_points", 0)
-            user_legendaries = user.get("wallet", {}).get("legendaries_caught", 0)
-
-    rewards = await db.rewards.find().to_list(length=100)
-
-    return [
-        RewardItem(
-            id=str(r["_id"]),
-            item_name=r.get("item_name", "Unknown"),
-            category=r.get("category", ""),
-            cost_in_points=r.get("cost_in_points", 0),
-            requires_legendary=r.get("requires_legendary", False),
-            stock_remaining=r.get("stock_remaining", 0),
-            affordable=(
-                r.get("stock_remaining", 0) > 0
-                and (
-                    (
-                        r.get("requires_legendary", False)
-                        and user_legendaries > 0
-                    )
-                    or (
-                        not r.get("requires_legendary", False)
-                        and user_points >= r.get("cost_in_points", 0)
+        user_query = db.users.find_one({}, {"wallet": 1}, sort=[("_id", 1)])
+
+    async def no_user() -> None:
+        return None
+
+    user, stock_rows, rewards = await asyncio.gather(
+        user_query or no_user(),
+        db.rewards.find({}, {"stock_remaining": 1}).to_list(length=None),
+        reward_cache.all(db),
+    )
+    wallet = (user or {}).get("wallet", {})
+    user_points = wallet.get("total_points", 0)
+    user_legendaries = wallet.get("legendaries_caught", 0)
+
+    stock = {row["_id"]: row.get("stock_remaining", 0) for row in stock_rows}
+    for reward_oid, stock_remaining in stock.items():
+        reward_cache.set_stock(reward_oid, stock_remaining)
+
+    # Rows match RewardItem; encoded directly without re-validation
+    return FastJSONResponse(
+        [
+            {
+                "id": r.id,
+                "item_name": r.item_name,
+                "category": r.category,
+                "cost_in_points": r.cost_in_points,
+                "requires_legendary": r.requires_legendary,
+                "stock_remaining": stock.get(r.id, 0),
+                "affordable": (
+                    stock.get(r.id, 0) > 0
+                    and (
+                        (r.requires_legendary and user_legendaries > 0)
+                        or (not r.requires_legendary and user_points >= r.cost_in_points)
                     )
-                )
-            ),
-        )
-        for r in rewards
-    ]
+                ),
+            }
+            for r in rewards
+            if r.id in stock  # deleted since the last catalog refresh
+        ]
+    )
 
 
 # ──────────────────── POST /redeem ────────────────────────────────────
@@ -79,102 +161,310 @@ async def list_rewards(x_user_id: str = Header(default="")):
 async def redeem_reward(body: RedeemRequest, x_user_id: str = Header(default="")):
     """
     Redeem a reward:
-      1. Check user.wallet.total_points >= reward.cost_in_points
-      2. Check reward.stock_remaining > 0
-      3. Atomic: Deduct points, decrement stock, issue voucher code.
+      1. Deduct points (or one Legendary) only if the wallet still covers it.
+      2. Decrement stock only if it is still > 0; otherwise refund step 1.
+      3. Issue a voucher code, stored in `redemptions`.
+
+    With an `idempotency_key`, the key is reserved (unique index) before
+    anything is debited, and a retry gets the original reply back. A
+    reservation still pending after PENDING_TIMEOUT is taken over by the
+    next retry; the wallet and stock updates are tagged with the
+    reservation id, so the takeover completes the redemption without
+    debiting it again. If the voucher cannot be stored after ISSUE_ATTEMPTS,
+    the payment and stock are given back and the key is released.
+
+    Both guards live in the update filters, so concurrent redemptions can
+    neither overdraw a wallet nor take stock without paying. Stock is only
+    touched once payment is secured, so failed payments never hold stock.
+    Reward details come from the in-process catalog, stock from the guarded
+    update: two round trips on the happy path, plus one write to `redemptions`.
     """
     db = get_db()
 
     # Resolve user
     try:
         if x_user_id:
-            user = await db.users.find_one({"_id": ObjectId(x_user_id)})
+            user_oid = ObjectId(x_user_id)
         else:
-            user = await db.users.find_one()
+            first = await db.users.find_one({}, {"_id": 1}, sort=[("_id", 1)])
+            user_oid = first["_id"] if first else None
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid user_id format")
 
-    if not user:
+    if user_oid is None:
         raise HTTPException(status_code=404, detail="User not found")
 
     # Resolve reward
     try:
-        reward = await db.rewards.find_one({"_id": ObjectId(body.reward_id)})
+        reward = await reward_cache.get(db, ObjectId(body.reward_id))
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid reward_id format")
 
     if not reward:
         raise HTTPException(status_code=404, detail="Reward not found")
 
-    user_points = user.get("wallet", {}).get("total_points", 0)
-    cost = reward.get("cost_in_points", 0)
-    stock = reward.get("stock_remaining", 0)
-    requires_legendary = reward.get("requires_legendary", False)
-    user_legendaries = user.get("wallet", {}).get("legendaries_caught", 0)
-
-    # ── Validation ──
-    if requires_legendary:
-        if user_legendaries <= 0:
-            return RedeemResponse(
-                success=False,
-                message="This reward requires a Legendary Pokémon. You don't have one!",
-                remaining_points=user_points,
-                reward_stock_left=stock,
+    # Replayed request: answer from the stored result, not the write path
+    key = body.idempotency_key
+    if key:
+        reply = _replies.get(key)
+        if reply is not None:
+            return _reply_from(reply, user_oid, reward.id)
+
+    record = {
+        "_id": ObjectId(),
+        "voucher_code": _new_voucher_code(),
+        "user_id": user_oid,
+        "reward_id": reward.id,
+        "item_name": reward.item_name,
+        "status": "pending",
+        "redeemed_at": datetime.now(timezone.utc),
+    }
+    if key:
+        # Reserve the key before any debit so concurrent retries can't both run
+        record["idempotency_key"] = key
+        try:
+            await _insert_redemption(db, record)
+        except DuplicateKeyError:
+            # A reservation left pending past PENDING_TIMEOUT belongs to an attempt
+            # that died or stalled mid-flight; claiming it atomically lets one retry
+            # finish it (APPLIED_FIELD keeps whatever it already debited from repeating)
+            stale = await db.redemptions.find_one_and_update(
+                {
+                    "idempotency_key": key,
+                    "user_id": user_oid,
+                    "reward_id": reward.id,
+                    "status": "pending",
+                    "redeemed_at": {"$lt": record["redeemed_at"] - timedelta(seconds=PENDING_TIMEOUT)},
+                },
+                {"$set": {"redeemed_at": record["redeemed_at"]}},
+                return_document=ReturnDocument.AFTER,
             )
+            if stale is not None:
+                record = stale
+            else:
+                existing = await db.redemptions.find_one({"idempotency_key": key})
+                if existing is None:  # released by a failed attempt just now
+                    raise HTTPException(status_code=409, detail="This redemption is still in progress")
+                if existing["status"] == "issued":
+                    _replies.put(key, existing)
+                return _reply_from(existing, user_oid, reward.id)
+
+    marker = record["_id"] if key else None
+    try:
+        response = await _redeem(db, user_oid, reward, marker)
+    except Exception:
+        if key:
+            # Tagged updates make the undo exact whatever step failed
+            await _undo_redeem(db, user_oid, reward, marker)
+            await db.redemptions.delete_one({"_id": record["_id"], "status": "pending"})
+        raise
+
+    if not response.success:
+        if key:
+            # Failures are not stored: the same key may be retried once affordable
+            await db.redemptions.delete_one({"_id": record["_id"]})
+        return response
+
+    response.voucher_code = record["voucher_code"]
+    record["status"] = "issued"
+    record["reply"] = response.model_dump()
+    try:
+        stored = await _store_issued(db, record, key)
+    except Exception:
+        stored = False
+    if not stored:
+        # Paid and stock taken but no voucher on record: release the key, then undo both
+        if key:
+            try:
+                released = await db.redemptions.delete_one({"_id": record["_id"], "status": "pending"})
+            except PyMongoError:
+                # Left pending and tagged: a retry after PENDING_TIMEOUT completes it
+                raise HTTPException(status_code=503, detail="Could not issue a voucher; retry later")
+            if not released.deleted_count:
+                existing = await db.redemptions.find_one({"_id": record["_id"]})
+                if existing is not None and existing["status"] == "issued":
+                    # A concurrent takeover issued it; this attempt's debits were the same ones
+                    _replies.put(key, existing)
+                    return _reply_from(existing, user_oid, reward.id)
+        await _undo_redeem(db, user_oid, reward, marker)
+        raise HTTPException(
+            status_code=503, detail="Could not issue a voucher; the redemption was refunded"
+        )
+    if key:
+        _replies.put(key, record)
     else:
-        if user_points < cost:
-            return RedeemResponse(
-                success=False,
-                message=f"Insufficient points. You have {user_points} but need {cost}.",
-                remaining_points=user_points,
-                reward_stock_left=stock,
-            )
+        response.voucher_code = record["voucher_code"]  # may have been redrawn
+        record["reply"]["voucher_code"] = record["voucher_code"]
+    _vouchers.put(record["voucher_code"], record)
+    return response
+
+
+def _wallet_debit(reward: RewardRecord) -> tuple[dict, dict]:
+    """(filter guard, $inc) paying for the reward: one Legendary or its points."""
+    if reward.requires_legendary:
+        return {"wallet.legendaries_caught": {"$gt": 0}}, {"wallet.legendaries_caught": -1}
+    return (
+        {"wallet.total_points": {"$gte": reward.cost_in_points}},
+        {"wallet.total_points": -reward.cost_in_points},
+    )
+
+
+def _apply_once(marker: Optional[ObjectId]) -> tuple[dict, dict]:
+    """(filter guard, update) making a debit happen at most once per reservation."""
+    if marker is None:
+        return {}, {}
+    return (
+        {APPLIED_FIELD: {"$ne": marker}},
+        {"$push": {APPLIED_FIELD: {"$each": [marker], "$slice": -APPLIED_KEPT}}},
+    )
+
+
+def _applied(marker: Optional[ObjectId]) -> tuple[dict, dict]:
+    """(filter guard, update) undoing a tagged debit at most once."""
+    if marker is None:
+        return {}, {}
+    return {APPLIED_FIELD: marker}, {"$pull": {APPLIED_FIELD: marker}}
+
+
+async def _refund_payment(
+    db, user_oid: ObjectId, reward: RewardRecord, marker: Optional[ObjectId] = None
+) -> Optional[dict]:
+    """Give back what `_wallet_debit` took; returns the refunded wallet (None if nothing to refund)."""
+    _, wallet_inc = _wallet_debit(reward)
+    guard, untag = _applied(marker)
+    return await db.users.find_one_and_update(
+        {"_id": user_oid, **guard},
+        {"$inc": {k: -v for k, v in wallet_inc.items()}, **untag},
+        projection={"wallet": 1},
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+async def _undo_redeem(
+    db, user_oid: ObjectId, reward: RewardRecord, marker: Optional[ObjectId] = None
+) -> None:
+    """Compensate `_redeem`: refund the payment and put the stock back (only what was taken)."""
+    guard, untag = _applied(marker)
+    try:
+        refunded = await _refund_payment(db, user_oid, reward, marker)
+        restocked = await db.rewards.find_one_and_update(
+            {"_id": reward.id, **guard},
+            {"$inc": {"stock_remaining": 1}, **untag},
+            projection={"stock_remaining": 1},
+            return_document=ReturnDocument.AFTER,
+        )
+    except PyMongoError as exc:
+        print(f"❌ Redemption of {reward.id} by {user_oid} could not be undone: {exc}")
+        return
+    if restocked is not None:
+        reward_cache.set_stock(reward.id, restocked.get("stock_remaining", 0))
+    if refunded is not None:
+        if reward.requires_legendary:
+            await ranking.apply(db, user_oid, legendaries=1)
+        else:
+            await ranking.apply(db, user_oid, points=reward.cost_in_points)
+    response_cache.invalidate(*REDEEM_AFFECTED_ROUTES)
 
-    if stock <= 0:
+
+async def _redeem(
+    db, user_oid: ObjectId, reward: RewardRecord, marker: Optional[ObjectId] = None
+) -> RedeemResponse:
+    """
+    Pay, then take stock (refunding if it ran out); no voucher code yet.
+    Stock is decided by the guarded update on `rewards`, never by the
+    catalog's copy, so a restock made elsewhere is honoured immediately.
+    With a reservation `marker`, a step an earlier attempt already applied
+    for it is found by its tag and not repeated.
+    """
+    wallet_guard, wallet_inc = _wallet_debit(reward)
+    once_guard, tag = _apply_once(marker)
+
+    # 1. Pay: the guard in the filter makes the check and the debit one atomic step
+    updated_user = await db.users.find_one_and_update(
+        {"_id": user_oid, **wallet_guard, **once_guard},
+        {"$inc": wallet_inc, **tag},
+        projection={"wallet": 1},
+        return_document=ReturnDocument.AFTER,
+    )
+    paid_here = updated_user is not None
+    if updated_user is None:
+        user = await db.users.find_one({"_id": user_oid}, {"wallet": 1, APPLIED_FIELD: 1})
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+        if marker is not None and marker in user.get(APPLIED_FIELD, ()):
+            updated_user = user  # paid by the attempt this one took over
+    if updated_user is None:
+        remaining = user.get("wallet", {}).get("total_points", 0)
+        if reward.requires_legendary:
+            message = "This reward requires a Legendary Pokémon. You don't have one!"
+        else:
+            message = f"Insufficient points. You have {remaining} but need {reward.cost_in_points}."
         return RedeemResponse(
             success=False,
-            message=f"'{reward.get('item_name', 'Reward')}' is out of stock!",
-            remaining_points=user_points,
-            reward_stock_left=0,
+            message=message,
+            remaining_points=remaining,
+            reward_stock_left=reward.stock_remaining,
         )
 
-    # ── Atomic operations ──
-    # 1. Decrement stock (only if > 0)
+    # 2. Take stock (only if > 0); if it ran out meanwhile, refund the payment
     stock_result = await db.rewards.find_one_and_update(
-        {"_id": reward["_id"], "stock_remaining": {"$gt": 0}},
-        {"$inc": {"stock_remaining": -1}},
+        {"_id": reward.id, "stock_remaining": {"$gt": 0}, **once_guard},
+        {"$inc": {"stock_remaining": -1}, **tag},
+        projection={"stock_remaining": 1},
         return_document=ReturnDocument.AFTER,
     )
-    if not stock_result:
+    if stock_result is None and marker is not None:
+        stock_result = await db.rewards.find_one(
+            {"_id": reward.id, APPLIED_FIELD: marker}, {"stock_remaining": 1}
+        )  # taken by the attempt this one took over
+    if stock_result is None:
+        reward_cache.set_stock(reward.id, 0)
+        refunded = await _refund_payment(db, user_oid, reward, marker)
+        if not paid_here and ranking.ready:
+            await ranking.refresh_user(db, user_oid)
         return RedeemResponse(
             success=False,
-            message="Race condition: item went out of stock.",
-            remaining_points=user_points,
+            message=f"'{reward.item_name}' is out of stock!",
+            remaining_points=(refunded or {}).get("wallet", {}).get("total_points", 0),
             reward_stock_left=0,
         )
 
-    # 2. Deduct user points (or legendary count)
-    if requires_legendary:
-        await db.users.update_one(
-            {"_id": user["_id"]},
-            {"$inc": {"wallet.legendaries_caught": -1}},
-        )
+    reward_cache.set_stock(reward.id, stock_result.get("stock_remaining", 0))
+    if not paid_here:
+        if ranking.ready:
+            await ranking.refresh_user(db, user_oid)  # whatever the earlier attempt applied
+    elif reward.requires_legendary:
+        await ranking.apply(db, user_oid, legendaries=-1)
     else:
-        await db.users.update_one(
-            {"_id": user["_id"]},
-            {"$inc": {"wallet.total_points": -cost}},
-        )
-
-    # 3. Generate voucher code
-    voucher = f"EF-{secrets.token_hex(4).upper()}"
-
-    updated_user = await db.users.find_one({"_id": user["_id"]})
-    remaining = updated_user.get("wallet", {}).get("total_points", 0) if updated_user else 0
+        await ranking.apply(db, user_oid, points=-reward.cost_in_points)
+    response_cache.invalidate(*REDEEM_AFFECTED_ROUTES)
 
     return RedeemResponse(
         success=True,
-        message=f"Successfully redeemed '{reward.get('item_name')}'! 🎉",
-        remaining_points=remaining,
+        message=f"Successfully redeemed '{reward.item_name}'! 🎉",
+        remaining_points=updated_user.get("wallet", {}).get("total_points", 0),
         reward_stock_left=stock_result.get("stock_remaining", 0),
-        voucher_code=voucher,
+    )
+
+
+# ──────────────────── GET /vouchers/{code} ────────────────────────────
+
+
+@router.get("/vouchers/{code}", response_model=VoucherResponse)
+async def get_voucher(code: str):
+    """Verify a voucher code at a booth (recently issued codes are served from memory)."""
+    code = code.strip().upper()
+    record: Optional[dict] = _vouchers.get(code)
+    if record is None:
+        record = await get_db().redemptions.find_one({"voucher_code": code, "status": "issued"})
+        if record is None:
+            raise HTTPException(status_code=404, detail="Voucher not found")
+        _vouchers.put(code, record)
+
+    return VoucherResponse(
+        voucher_code=record["voucher_code"],
+        item_name=record["item_name"],
+        reward_id=str(record["reward_id"]),
+        user_id=str(record["user_id"]),
+        redeemed_at=record["redeemed_at"],
     )
@@ -0,0 +1,25 @@
+"""
+EventFlow – Test Fixtures
+Handlers run directly against mongomock-motor, an in-memory stand-in for
+MongoDB (`pip install pytest mongomock-motor`; run `pytest` from backend/).
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+
+
+@pytest.fixture
+def db(monkeypatch):
+    """A fresh in-memory database installed as the app's database."""
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    standin = mongomock_motor.AsyncMongoMockClient().get_database("eventflow_test")
+    monkeypatch.setattr(database._store, "db", standin)
+    return standin
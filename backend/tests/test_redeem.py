@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException
+
+from models import RedeemRequest
+from routers import store
+from routers.store import PENDING_TIMEOUT, redeem_reward
+from utils.catalog import reward_cache
+
+COST = 30
+STOCK = 5
+
+
+@pytest.fixture
+def shop(db):
+    user_oid, reward_oid = ObjectId(), ObjectId()
+
+    async def setup():
+        await db.redemptions.create_index("voucher_code", unique=True)
+        await db.redemptions.create_index("idempotency_key", unique=True, sparse=True)
+        await db.users.insert_one(
+            {"_id": user_oid, "name": "Ash", "wallet": {"total_points": 100, "legendaries_caught": 0}, "pokedex": []}
+        )
+        await db.rewards.insert_one(
+            {"_id": reward_oid, "item_name": "Tee", "category": "Merch", "cost_in_points": COST,
+             "requires_legendary": False, "stock_remaining": STOCK}
+        )
+        await reward_cache.refresh(db)
+
+    asyncio.run(setup())
+    return db, user_oid, reward_oid
+
+
+def _redeem(user_oid, reward_oid, key="replayed-key"):
+    return redeem_reward(RedeemRequest(reward_id=str(reward_oid), idempotency_key=key), x_user_id=str(user_oid))
+
+
+async def _balances(db, user_oid, reward_oid) -> tuple[int, int]:
+    user = await db.users.find_one({"_id": user_oid})
+    reward = await db.rewards.find_one({"_id": reward_oid})
+    return user["wallet"]["total_points"], reward["stock_remaining"]
+
+
+async def _age_reservation(db, key: str) -> None:
+    past = datetime.now(timezone.utc) - timedelta(seconds=PENDING_TIMEOUT + 5)
+    await db.redemptions.update_one({"idempotency_key": key}, {"$set": {"redeemed_at": past}})
+
+
+def test_concurrent_replays_debit_once(shop):
+    db, user_oid, reward_oid = shop
+
+    async def run():
+        results = await asyncio.gather(*(_redeem(user_oid, reward_oid) for _ in range(3)), return_exceptions=True)
+        return results, await _balances(db, user_oid, reward_oid)
+
+    results, balances = asyncio.run(run())
+
+    successes = [r for r in results if not isinstance(r, Exception)]
+    assert all(isinstance(r, HTTPException) and r.status_code == 409 for r in results if isinstance(r, Exception))
+    assert len({r.voucher_code for r in successes}) == 1
+    assert balances == (100 - COST, STOCK - 1)
+
+
+def test_takeover_after_a_crash_does_not_debit_again(shop, monkeypatch):
+    db, user_oid, reward_oid = shop
+
+    async def crash(*args, **kwargs):
+        raise asyncio.CancelledError  # the worker dies after paying, before issuing
+
+    async def run():
+        monkeypatch.setattr(store, "_store_issued", crash)
+        with pytest.raises(asyncio.CancelledError):
+            await _redeem(user_oid, reward_oid)
+        monkeypatch.undo()
+        await _age_reservation(db, "replayed-key")
+        response = await _redeem(user_oid, reward_oid)
+        replay = await _redeem(user_oid, reward_oid)
+        return response, replay, await _balances(db, user_oid, reward_oid)
+
+    response, replay, balances = asyncio.run(run())
+
+    assert response.success and replay.voucher_code == response.voucher_code
+    assert balances == (100 - COST, STOCK - 1)
+
+
+def test_takeover_of_a_slow_attempt_does_not_debit_again(shop, monkeypatch):
+    db, user_oid, reward_oid = shop
+    store_issued = store._store_issued
+
+    async def run():
+        stalled, resume = asyncio.Event(), asyncio.Event()
+
+        async def slow_first(*args, **kwargs):
+            monkeypatch.setattr(store, "_store_issued", store_issued)  # only the first attempt stalls
+            await _age_reservation(db, "replayed-key")
+            stalled.set()
+            await resume.wait()
+            return await store_issued(*args, **kwargs)
+
+        monkeypatch.setattr(store, "_store_issued", slow_first)
+        first = asyncio.create_task(_redeem(user_oid, reward_oid))
+        await stalled.wait()
+        second = await _redeem(user_oid, reward_oid)
+        resume.set()
+        return await first, second, await _balances(db, user_oid, reward_oid)
+
+    first, second, balances = asyncio.run(run())
+
+    assert first.success and second.success
+    assert first.voucher_code == second.voucher_code
+    assert balances == (100 - COST, STOCK - 1)
+
+
+def test_key_reused_for_another_reward_conflicts(shop):
+    db, user_oid, reward_oid = shop
+    other_oid = ObjectId()
+
+    async def run():
+        await db.rewards.insert_one(
+            {"_id": other_oid, "item_name": "Mug", "category": "Merch", "cost_in_points": 10,
+             "requires_legendary": False, "stock_remaining": 1}
+        )
+        await _redeem(user_oid, reward_oid)
+        with pytest.raises(HTTPException) as exc:
+            await _redeem(user_oid, other_oid)
+        return exc.value.status_code, await _balances(db, user_oid, reward_oid)
+
+    status, balances = asyncio.run(run())
+
+    assert status == 409
+    assert balances == (100 - COST, STOCK - 1)
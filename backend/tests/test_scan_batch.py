@@ -0,0 +1,55 @@
+from __future__ import annotations
+
+import asyncio
+import uuid
+from datetime import datetime, timezone
+
+from bson import ObjectId
+
+from models import BatchScanItem, BatchScanRequest
+from routers import game
+from routers.game import LOW_TRAFFIC_THRESHOLD, scan_batch
+from utils.rollups import scan_rollups
+
+
+async def _noop(*args, **kwargs) -> None:
+    return None
+
+
+def test_large_batch_at_one_stall_stops_producing_legendaries(db, monkeypatch):
+    # mongomock's bulk upserts lag pymongo's signature; rollups are not under test
+    monkeypatch.setattr(scan_rollups, "record", _noop)
+    sponsor_oid, user_oid = ObjectId(), ObjectId()
+
+    async def run():
+        await db.sponsors.insert_one(
+            {
+                "_id": sponsor_oid,
+                "company_name": "Quiet Stall",
+                "category": "Software",
+                "map_location": {"x_coord": 0, "y_coord": 0},
+                "sponsorship_package_cost": 50_000,
+                "current_pokemon_spawn": {"name": "Pikachu", "type": "Electric", "rarity": "Normal"},
+            }
+        )
+        await db.users.insert_one(
+            {"_id": user_oid, "name": "Ash", "wallet": {"total_points": 0, "legendaries_caught": 0}, "pokedex": []}
+        )
+        now = datetime.now(timezone.utc)
+        body = BatchScanRequest(
+            scans=[
+                BatchScanItem(sponsor_id=str(sponsor_oid), client_timestamp=now, idempotency_key=uuid.uuid4().hex)
+                for _ in range(200)
+            ]
+        )
+        return await scan_batch(body, x_user_id=str(user_oid))
+
+    response = asyncio.run(run())
+
+    rarities = [r.pokemon.rarity for r in response.results]
+    assert response.accepted == 200
+    assert rarities.count("Legendary") == LOW_TRAFFIC_THRESHOLD  # the stall's quiet spell only
+    assert all(r == "Normal" for r in rarities[LOW_TRAFFIC_THRESHOLD:])
+    assert response.points_earned == (
+        LOW_TRAFFIC_THRESHOLD * game.LEGENDARY_POINTS + (200 - LOW_TRAFFIC_THRESHOLD) * game.COMMON_POINTS
+    )
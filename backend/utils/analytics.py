@@ -6,13 +6,18 @@ Uses Decimal for financial precision where appropriate.
 
 from __future__ import annotations
 
-from datetime import datetime
+from datetime import datetime, timezone
 from decimal import Decimal, ROUND_HALF_UP
-from typing import Optional
+from typing import AsyncIterable, Optional
 
+import numpy as np
 from bson import ObjectId
 from motor.motor_asyncio import AsyncIOMotorDatabase
 
+from utils.covisit import covisit_engine
+
+_EPOCH = datetime(1970, 1, 1)
+
 
 def calculate_cpi(sponsorship_cost: float, total_scans: int) -> Optional[float]:
     """
@@ -38,6 +43,20 @@ def calculate_flash_sale_lift(flash_scans: int, total_scans: int) -> Optional[fl
     return float(lift.quantize(Decimal("0.1"), rounding=ROUND_HALF_UP))
 
 
+def format_wait_time(avg_seconds: float) -> str:
+    """Human-readable "Xm Ys" string."""
+    minutes = int(avg_seconds // 60)
+    seconds = int(avg_seconds % 60)
+    return f"{minutes}m {seconds}s"
+
+
+def _epoch_ms(ts: datetime) -> int:
+    """Milliseconds since the epoch (naive datetimes are treated as UTC)."""
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return int(ts.timestamp() * 1000)
+
+
 def calculate_avg_wait_time(timestamps: list[datetime]) -> Optional[str]:
     """
     Average Wait Time = mean time delta between consecutive scans.
@@ -45,15 +64,124 @@ def calculate_avg_wait_time(timestamps: list[datetime]) -> Optional[str]:
     """
     if len(timestamps) < 2:
         return None
-    sorted_ts = sorted(timestamps)
-    diffs = [
-        (sorted_ts[i + 1] - sorted_ts[i]).total_seconds()
-        for i in range(len(sorted_ts) - 1)
+    ms = np.sort(np.fromiter((_epoch_ms(t) for t in timestamps), dtype=np.int64))
+    avg_seconds = float(np.diff(ms).mean()) / 1000
+    return format_wait_time(avg_seconds)
+
+
+# Fixed log-scale histogram of scan-to-scan gaps: 0.1 s … 1 day, ~3.5% per bin
+_WAIT_EDGES = np.geomspace(0.1, 86_400, 400)
+_WAIT_MIDS = np.concatenate(
+    [[0.0], np.sqrt(_WAIT_EDGES[:-1] * _WAIT_EDGES[1:]), [_WAIT_EDGES[-1]]]
+)
+WAIT_CHUNK_SIZE = 10_000
+
+
+class WaitTimeAccumulator:
+    """
+    Streaming scan-to-scan wait statistics over timestamps arriving in sorted
+    order, fed in NumPy chunks of epoch milliseconds. Memory is fixed by the
+    histogram size no matter how many scans are seen: the mean is exact,
+    percentiles are read from the log-scale histogram (~3.5% relative error).
+    Each gap is attributed to the hour-of-day (UTC) of the later scan.
+    """
+
+    def __init__(self):
+        self.samples = 0
+        self.total_seconds = 0.0
+        self._hist = np.zeros(len(_WAIT_MIDS), dtype=np.int64)
+        self._hour_sum = np.zeros(24)
+        self._hour_count = np.zeros(24, dtype=np.int64)
+        self._last_ms: Optional[int] = None
+
+    def update(self, ms: np.ndarray) -> None:
+        """Add a chunk of sorted epoch-ms timestamps (continuing the previous chunk)."""
+        if ms.size == 0:
+            return
+        if self._last_ms is not None:
+            ms = np.concatenate(([self._last_ms], ms))
+        self._last_ms = int(ms[-1])
+        if ms.size < 2:
+            return
+
+        gaps = np.diff(ms) / 1000.0
+        self.samples += gaps.size
+        self.total_seconds += float(gaps.sum())
+        self._hist += np.bincount(
+            np.searchsorted(_WAIT_EDGES, gaps, side="right"), minlength=self._hist.size
+        )
+        hours = (ms[1:] // 3_600_000) % 24
+        self._hour_sum += np.bincount(hours, weights=gaps, minlength=24)
+        self._hour_count += np.bincount(hours, minlength=24)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self.samples:
+            return None
+        rank = np.searchsorted(np.cumsum(self._hist), q / 100 * self.samples, side="left")
+        return round(float(_WAIT_MIDS[min(rank, _WAIT_MIDS.size - 1)]), 1)
+
+    def result(self) -> Optional[dict]:
+        if not self.samples:
+            return None
+        return {
+            "samples": self.samples,
+            "avg_seconds": round(self.total_seconds / self.samples, 1),
+            "p50_seconds": self.percentile(50),
+            "p90_seconds": self.percentile(90),
+            "p99_seconds": self.percentile(99),
+            "hourly": [
+                {
+                    "hour": hour,
+                    "samples": int(self._hour_count[hour]),
+                    "avg_seconds": round(self._hour_sum[hour] / self._hour_count[hour], 1),
+                }
+                for hour in range(24)
+                if self._hour_count[hour]
+            ],
+        }
+
+
+async def stream_wait_time_stats(
+    rows: AsyncIterable[dict], chunk_size: int = WAIT_CHUNK_SIZE
+) -> Optional[dict]:
+    """
+    Single pass over an already-sorted stream of {"ms": <epoch ms>} rows,
+    e.g. a Motor cursor. Rows are copied into a fixed-size buffer and handed
+    to the accumulator one chunk at a time.
+    """
+    acc = WaitTimeAccumulator()
+    buf = np.empty(chunk_size, dtype=np.int64)
+    n = 0
+    async for row in rows:
+        buf[n] = row["ms"]
+        n += 1
+        if n == chunk_size:
+            acc.update(buf)
+            n = 0
+    acc.update(buf[:n])
+    return acc.result()
+
+
+async def calculate_wait_time_stats(
+    sponsor_oid: ObjectId, db: AsyncIOMotorDatabase
+) -> Optional[dict]:
+    """
+    Wait-time stats for a stall over its full, untruncated scan history.
+    Timestamps stream from the (sponsor_id, timestamp) index already sorted
+    and arrive as epoch milliseconds, so Python never materialises them.
+    """
+    pipeline = [
+        {"$match": {"sponsor_id": sponsor_oid}},
+        {"$sort": {"timestamp": 1}},
+        {"$project": {"_id": 0, "ms": {"$subtract": ["$timestamp", _EPOCH]}}},
     ]
-    avg_seconds = sum(diffs) / len(diffs)
-    minutes = int(avg_seconds // 60)
-    seconds = int(avg_seconds % 60)
-    return f"{minutes}m {seconds}s"
+    cursor = db.scanevents.aggregate(pipeline, batchSize=WAIT_CHUNK_SIZE)
+    return await stream_wait_time_stats(cursor)
+
+
+def _pct(part: int, whole: int) -> float:
+    pct = Decimal(str(part)) / Decimal(str(whole)) * Decimal("100")
+    return float(pct.quantize(Decimal("0.1"), rounding=ROUND_HALF_UP))
 
 
 async def calculate_cross_pollination(
@@ -63,27 +191,33 @@ async def calculate_cross_pollination(
     Cross-Pollination: % of users who visited *this* stall AND at least one
     other stall.
 
-    Pipeline:
-    1. Collect distinct student_ids who scanned this sponsor.
-    2. For each of those students, check if they have scans at other sponsors.
+    Served from the in-memory co-visit engine (O(1)). Until it is built,
+    falls back to one aggregation:
+    1. Match every scan by a student who scanned this sponsor.
+    2. Group per student into their set of stalls.
     3. Return (students_with_other_stalls / total_students * 100).
     """
     oid = ObjectId(sponsor_id)
-    scans_col = db.get_collection("scanevents")
 
-    # 1. Unique students at this stall
-    visitor_ids = await scans_col.distinct("student_id", {"sponsor_id": oid})
+    if covisit_engine.ready:
+        visitors = covisit_engine.visitors(oid)
+        if not visitors:
+            return None
+        return _pct(covisit_engine.cross_visitors(oid), visitors)
+
+    scans_col = db.get_collection("scanevents")
+    visitor_ids = await scans_col.distinct(
+        "student_id", {"sponsor_id": oid, "student_id": {"$ne": None}}
+    )
     if not visitor_ids:
         return None
 
-    # 2. How many of those students also visited elsewhere?
-    cross_count = 0
-    for student_id in visitor_ids:
-        other = await scans_col.find_one(
-            {"student_id": student_id, "sponsor_id": {"$ne": oid}}
-        )
-        if other:
-            cross_count += 1
-
-    pct = Decimal(str(cross_count)) / Decimal(str(len(visitor_ids))) * Decimal("100")
-    return float(pct.quantize(Decimal("0.1"), rounding=ROUND_HALF_UP))
+    pipeline = [
+        {"$match": {"student_id": {"$in": visitor_ids}}},
+        {"$group": {"_id": "$student_id", "stalls": {"$addToSet": "$sponsor_id"}}},
+        {"$match": {"stalls.1": {"$exists": True}}},
+        {"$count": "cross"},
+    ]
+    result = await scans_col.aggregate(pipeline).to_list(length=1)
+    cross_count = result[0]["cross"] if result else 0
+    return _pct(cross_count, len(visitor_ids))
@@ -0,0 +1,117 @@
+"""
+EventFlow – TTL Cache with Single-Flight
+Short-lived in-process cache for expensive read paths. Concurrent misses
+for the same key share one computation instead of stampeding MongoDB.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable
+
+
+class TTLCache:
+    """
+    Bounded LRU of (expires_at, value) with per-key request coalescing.
+
+    With `stale_ttl`, an entry past its TTL is still served for up to
+    `stale_ttl` more seconds while one background refresh replaces it
+    (stale-while-revalidate), so callers never wait on a recompute.
+    """
+
+    def __init__(self, ttl: float, max_entries: int = 1024, stale_ttl: float = 0):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._inflight: dict[Hashable, asyncio.Future] = {}
+
+    async def get_or_compute(
+        self, key: Hashable, compute: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        """Return the cached value, or run `compute` once for all concurrent callers."""
+        now = time.monotonic()
+        entry = self._data.get(key)
+        if entry is not None and entry[0] > now:
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+        if entry is not None and entry[0] + self.stale_ttl > now:
+            self._data.move_to_end(key)
+            self.hits += 1
+            if key not in self._inflight:
+                self._start(key, compute).add_done_callback(_log_refresh_error)
+            return entry[1]
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.hits += 1
+            return await asyncio.shield(inflight)
+
+        self.misses += 1
+        # Shielded so one caller disconnecting doesn't cancel the shared work
+        return await asyncio.shield(self._start(key, compute))
+
+    def get(self, key: Hashable) -> Any:
+        """The fresh cached value for `key`, or None (never computes)."""
+        entry = self._data.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """Insert a value produced elsewhere (e.g. by a write path)."""
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def _start(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> asyncio.Future:
+        future = asyncio.ensure_future(compute())
+        self._inflight[key] = future
+        future.add_done_callback(lambda f: self._store(key, f))
+        return future
+
+    def _store(self, key: Hashable, future: asyncio.Future) -> None:
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
+        if future.cancelled() or future.exception() is not None:
+            return
+        self.put(key, future.result())
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def expire(self, key: Hashable | None = None) -> None:
+        """
+        Mark one key (or everything) as past its TTL. Entries stay servable
+        for the stale window, so with `stale_ttl` the next caller gets the old
+        value and triggers a refresh; without it this is `invalidate`.
+        """
+        if not self.stale_ttl:
+            self.invalidate(key)
+            return
+        now = time.monotonic()
+        keys = list(self._data) if key is None else [key] if key in self._data else []
+        for k in keys:
+            expires_at, value = self._data[k]
+            self._data[k] = (min(expires_at, now), value)
+
+    def invalidate(self, key: Hashable | None = None) -> None:
+        """Drop one key, or everything when no key is given."""
+        if key is None:
+            self._data.clear()
+        else:
+            self._data.pop(key, None)
+
+
+def _log_refresh_error(future: asyncio.Future) -> None:
+    if not future.cancelled() and future.exception() is not None:
+        print(f"❌ Background cache refresh failed: {future.exception()}")
@@ -0,0 +1,250 @@
+"""
+EventFlow – Sponsor & Reward Catalog
+Keeps the small, rarely-changing sponsor and reward collections in process
+as compact `__slots__` records keyed by ObjectId, plus each stall's running
+scan total, so the scan, map and store paths need no `find` per request.
+
+The catalog is loaded in the app lifespan and re-diffed against MongoDB
+every CATALOG_REFRESH_SECONDS (picking up edits made outside this
+process); `version` bumps whenever a refresh changes anything. The hot
+fields are kept current differently:
+
+  - a reward's `stock_remaining` is read live by the store (the rewards
+    list projects it per request, redeem's guarded update decides); the
+    cached copy is only written through for display elsewhere;
+  - a stall's `current_pokemon_spawn` is written through by the scan paths,
+    its only writers, as soon as their MongoDB update succeeds. Other
+    processes see it after at most CATALOG_REFRESH_SECONDS.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from contextlib import suppress
+from typing import Generic, Optional, TypeVar
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+CATALOG_REFRESH_SECONDS = 30
+
+
+class SponsorRecord:
+    __slots__ = (
+        "id",
+        "company_name",
+        "category",
+        "map_location",
+        "sponsorship_package_cost",
+        "current_pokemon_spawn",
+    )
+
+    def __init__(self, doc: dict):
+        self.id: ObjectId = doc["_id"]
+        self.update(doc)
+
+    def update(self, doc: dict) -> bool:
+        """Copy fields from a sponsor document; returns whether anything changed."""
+        fields = (
+            doc.get("company_name", "Unknown"),
+            doc.get("category", ""),
+            doc.get("map_location", {"x_coord": 0, "y_coord": 0}),
+            doc.get("sponsorship_package_cost", 0),
+            dict(doc.get("current_pokemon_spawn", {})),
+        )
+        changed = not hasattr(self, "company_name") or fields != self._fields()
+        (
+            self.company_name,
+            self.category,
+            self.map_location,
+            self.sponsorship_package_cost,
+            self.current_pokemon_spawn,
+        ) = fields
+        return changed
+
+    def _fields(self) -> tuple:
+        return (
+            self.company_name,
+            self.category,
+            self.map_location,
+            self.sponsorship_package_cost,
+            self.current_pokemon_spawn,
+        )
+
+
+class RewardRecord:
+    __slots__ = (
+        "id",
+        "item_name",
+        "category",
+        "cost_in_points",
+        "requires_legendary",
+        "stock_remaining",
+    )
+
+    def __init__(self, doc: dict):
+        self.id: ObjectId = doc["_id"]
+        self.update(doc)
+
+    def update(self, doc: dict) -> bool:
+        """Copy fields from a reward document; returns whether anything changed."""
+        fields = (
+            doc.get("item_name", "Unknown"),
+            doc.get("category", ""),
+            doc.get("cost_in_points", 0),
+            doc.get("requires_legendary", False),
+            doc.get("stock_remaining", 0),
+        )
+        changed = not hasattr(self, "item_name") or fields != self._fields()
+        (
+            self.item_name,
+            self.category,
+            self.cost_in_points,
+            self.requires_legendary,
+            self.stock_remaining,
+        ) = fields
+        return changed
+
+    def _fields(self) -> tuple:
+        return (
+            self.item_name,
+            self.category,
+            self.cost_in_points,
+            self.requires_legendary,
+            self.stock_remaining,
+        )
+
+
+R = TypeVar("R", SponsorRecord, RewardRecord)
+
+
+class _CollectionCache(Generic[R]):
+    """Records for one collection keyed by ObjectId; misses fall through to MongoDB."""
+
+    collection: str
+    record_type: type
+
+    def __init__(self):
+        self.ready = False  # True once loaded from the database
+        self.version = 0  # bumped whenever a refresh changes the catalog
+        self._by_id: dict[ObjectId, R] = {}
+
+    async def refresh(self, db: AsyncIOMotorDatabase) -> bool:
+        """
+        Diff every document against the cached records in one query:
+        update changed records in place, add new ones, drop deleted ones.
+        Returns whether anything changed.
+        """
+        docs = await db[self.collection].find().to_list(length=None)
+        changed = False
+        fresh: dict[ObjectId, R] = {}
+        for doc in docs:
+            record = self._by_id.get(doc["_id"])
+            if record is None:
+                record = self.record_type(doc)
+                changed = True
+            elif record.update(doc):
+                changed = True
+            fresh[doc["_id"]] = record
+        if len(fresh) != len(self._by_id):
+            changed = True
+        self._by_id = fresh
+        if changed:
+            self.version += 1
+        self.ready = True
+        return changed
+
+    async def get(self, db: AsyncIOMotorDatabase, oid: ObjectId) -> Optional[R]:
+        record = self._by_id.get(oid)
+        if record is None:
+            doc = await db[self.collection].find_one({"_id": oid})
+            if doc:
+                record = self._by_id[oid] = self.record_type(doc)
+        return record
+
+    async def all(self, db: AsyncIOMotorDatabase) -> list[R]:
+        """Every record (in collection order), loading the catalog first if needed."""
+        if not self.ready:
+            await self.refresh(db)
+        return list(self._by_id.values())
+
+
+class SponsorCache(_CollectionCache[SponsorRecord]):
+    collection = "sponsors"
+    record_type = SponsorRecord
+
+    def set_spawn(self, sponsor_oid: ObjectId, spawn: dict) -> None:
+        """Mirror a `current_pokemon_spawn` write into the cached record."""
+        sponsor = self._by_id.get(sponsor_oid)
+        if sponsor is not None:
+            sponsor.current_pokemon_spawn = {**sponsor.current_pokemon_spawn, **spawn}
+
+
+class RewardCache(_CollectionCache[RewardRecord]):
+    collection = "rewards"
+    record_type = RewardRecord
+
+    def set_stock(self, reward_oid: ObjectId, stock_remaining: int) -> None:
+        """Mirror a `stock_remaining` write into the cached record."""
+        reward = self._by_id.get(reward_oid)
+        if reward is not None:
+            reward.stock_remaining = stock_remaining
+
+
+class CatalogRefresher:
+    """Background task re-diffing both catalogs against MongoDB."""
+
+    def __init__(self, *caches: _CollectionCache, interval: float = CATALOG_REFRESH_SECONDS):
+        self.caches = caches
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self, db: AsyncIOMotorDatabase) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            for cache in self.caches:
+                try:
+                    await cache.refresh(db)
+                except Exception as exc:
+                    print(f"❌ Catalog refresh ({cache.collection}) failed: {exc}")
+
+    def start(self, db: AsyncIOMotorDatabase) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(db))
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+
+class ScanTotals:
+    """Running all-time scan count per sponsor (the scan `visitor_count`)."""
+
+    def __init__(self):
+        self.ready = False  # True once seeded from the database
+        self._totals: dict[ObjectId, int] = {}
+
+    async def rebuild(self, db: AsyncIOMotorDatabase) -> None:
+        """Re-seed every total with one `$group` over `scanevents`."""
+        pipeline = [{"$group": {"_id": "$sponsor_id", "count": {"$sum": 1}}}]
+        rows = await db.scanevents.aggregate(pipeline).to_list(length=None)
+        self._totals = {row["_id"]: row["count"] for row in rows}
+        self.ready = True
+
+    def increment(self, sponsor_oid: ObjectId, n: int = 1) -> int:
+        total = self._totals.get(sponsor_oid, 0) + n
+        self._totals[sponsor_oid] = total
+        return total
+
+    def get(self, sponsor_oid: ObjectId) -> int:
+        return self._totals.get(sponsor_oid, 0)
+
+
+# Process-wide singletons shared by the routers and the lifespan hook
+sponsor_cache = SponsorCache()
+reward_cache = RewardCache()
+catalog_refresher = CatalogRefresher(sponsor_cache, reward_cache)
+scan_totals = ScanTotals()
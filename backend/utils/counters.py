@@ -0,0 +1,98 @@
+"""
+EventFlow – Event Counters
+One `counters` document holding the homepage totals (scans, Legendary
+catches, scans per stall), `$inc`ed by the scan paths alongside the scan
+insert. The homepage reads it instead of counting and grouping over the
+whole `scanevents` collection.
+
+The document is only seeded when missing, so recount it after reseeding
+the database: cd backend && python -m utils.counters rebuild
+"""
+
+from __future__ import annotations
+
+from typing import Iterable, Optional
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+EVENT_STATS_ID = "event_stats"
+
+
+class EventCounters:
+    async def ensure(self, db: AsyncIOMotorDatabase) -> None:
+        """Seed the counters document from `scanevents` if it does not exist yet."""
+        if await db.counters.find_one({"_id": EVENT_STATS_ID}, {"_id": 1}) is None:
+            await self.rebuild(db)
+
+    async def rebuild(self, db: AsyncIOMotorDatabase) -> None:
+        """Recount everything with one `$group` and replace the document."""
+        pipeline = [
+            {
+                "$group": {
+                    "_id": "$sponsor_id",
+                    "count": {"$sum": 1},
+                    "legendary": {
+                        "$sum": {"$cond": [{"$eq": ["$pokemon_caught.rarity", "Legendary"]}, 1, 0]}
+                    },
+                }
+            }
+        ]
+        rows = await db.scanevents.aggregate(pipeline).to_list(length=None)
+        await db.counters.replace_one(
+            {"_id": EVENT_STATS_ID},
+            {
+                "total_scans": sum(r["count"] for r in rows),
+                "legendary_count": sum(r["legendary"] for r in rows),
+                "sponsor_scans": {str(r["_id"]): r["count"] for r in rows if r["_id"]},
+            },
+            upsert=True,
+        )
+
+    async def record(self, db: AsyncIOMotorDatabase, scan_docs: Iterable[dict]) -> None:
+        """`$inc` the totals for a set of newly inserted scan events in one update."""
+        inc: dict[str, int] = {}
+        for doc in scan_docs:
+            inc["total_scans"] = inc.get("total_scans", 0) + 1
+            if doc["pokemon_caught"]["rarity"] == "Legendary":
+                inc["legendary_count"] = inc.get("legendary_count", 0) + 1
+            field = f"sponsor_scans.{doc['sponsor_id']}"
+            inc[field] = inc.get(field, 0) + 1
+        if inc:
+            await db.counters.update_one({"_id": EVENT_STATS_ID}, {"$inc": inc}, upsert=True)
+
+    async def read(self, db: AsyncIOMotorDatabase) -> dict:
+        """Current totals plus the busiest stall id (None before the first scan)."""
+        doc = await db.counters.find_one({"_id": EVENT_STATS_ID}) or {}
+        per_sponsor = doc.get("sponsor_scans", {})
+        top: Optional[ObjectId] = None
+        if per_sponsor:
+            top = ObjectId(max(per_sponsor, key=per_sponsor.get))
+        return {
+            "total_scans": doc.get("total_scans", 0),
+            "legendary_count": doc.get("legendary_count", 0),
+            "top_sponsor_id": top,
+        }
+
+
+# Process-wide singleton shared by the routers and the lifespan hook
+event_counters = EventCounters()
+
+
+if __name__ == "__main__":
+    import asyncio
+    import sys
+
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    from database import DB_NAME, MONGODB_URI
+
+    async def _main() -> None:
+        db = AsyncIOMotorClient(MONGODB_URI).get_database(DB_NAME)
+        if sys.argv[1:] == ["rebuild"]:
+            await event_counters.rebuild(db)
+            print("✅ Rebuilt the homepage counters")
+        else:
+            print("Usage: python -m utils.counters rebuild")
+
+    asyncio.run(_main())
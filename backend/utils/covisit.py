@@ -0,0 +1,119 @@
+"""
+EventFlow – Stall Co-Visit Engine
+Sponsor × sponsor co-visitation matrix: cell [i, j] is the number of
+students who scanned at both stall i and stall j (the diagonal holds each
+stall's unique visitors). Built from `scanevents` in one aggregation pass
+at startup and updated incrementally as scans arrive, so cross-pollination
+and "where else did my visitors go" are in-memory lookups.
+
+NOTE: Anonymous scans (no student_id) are not counted as a visitor.
+"""
+
+from __future__ import annotations
+
+from typing import Optional
+
+import numpy as np
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+
+class CoVisitEngine:
+    def __init__(self):
+        self.ready = False  # True once built from the database
+        self._index: dict[ObjectId, int] = {}  # sponsor → matrix row/column
+        self._sponsors: list[ObjectId] = []  # row/column → sponsor
+        self._matrix = np.zeros((0, 0), dtype=np.int32)
+        self._multi = np.zeros(0, dtype=np.int32)  # visitors who also went elsewhere
+        self._visited: dict[ObjectId, set[int]] = {}  # student → stall indices
+
+    def _slot(self, sponsor_oid: ObjectId) -> int:
+        """Matrix index for a sponsor, growing the matrix for unseen stalls."""
+        idx = self._index.get(sponsor_oid)
+        if idx is None:
+            idx = len(self._sponsors)
+            self._index[sponsor_oid] = idx
+            self._sponsors.append(sponsor_oid)
+            if idx >= self._matrix.shape[0]:
+                grow = max(8, self._matrix.shape[0])
+                self._matrix = np.pad(self._matrix, ((0, grow), (0, grow)))
+                self._multi = np.pad(self._multi, (0, grow))
+        return idx
+
+    async def rebuild(self, db: AsyncIOMotorDatabase) -> None:
+        """
+        One pass: group scans by student into their set of stalls, then build
+        the matrix as Vᵀ·V where V is the student × stall visit indicator.
+        """
+        pipeline = [
+            {"$match": {"student_id": {"$ne": None}}},
+            {"$group": {"_id": "$student_id", "stalls": {"$addToSet": "$sponsor_id"}}},
+        ]
+        rows = await db.scanevents.aggregate(pipeline).to_list(length=None)
+
+        fresh = CoVisitEngine()
+        visited = {}
+        for row in rows:
+            visited[row["_id"]] = {fresh._slot(sp) for sp in row["stalls"]}
+
+        n = fresh._matrix.shape[0]
+        student_idx = np.repeat(
+            np.arange(len(visited)), [len(s) for s in visited.values()]
+        )
+        stall_idx = np.fromiter(
+            (i for s in visited.values() for i in s), dtype=np.int64, count=len(student_idx)
+        )
+        visits = np.zeros((len(visited), n), dtype=np.int32)
+        visits[student_idx, stall_idx] = 1
+
+        fresh._matrix = visits.T @ visits
+        fresh._multi = visits.T @ (visits.sum(axis=1) > 1).astype(np.int32)
+        fresh._visited = visited
+
+        self._index, self._sponsors = fresh._index, fresh._sponsors
+        self._matrix, self._multi, self._visited = fresh._matrix, fresh._multi, visited
+        self.ready = True
+
+    def record(self, student_oid: Optional[ObjectId], sponsor_oid: ObjectId) -> None:
+        """Register a scan; only a student's first visit to a stall changes anything."""
+        if not self.ready or student_oid is None:
+            return
+        k = self._slot(sponsor_oid)
+        stalls = self._visited.setdefault(student_oid, set())
+        if k in stalls:
+            return
+
+        for j in stalls:
+            self._matrix[k, j] += 1
+            self._matrix[j, k] += 1
+        self._matrix[k, k] += 1
+
+        if len(stalls) == 1:
+            # Second distinct stall: the first one now counts as cross-pollinated too
+            self._multi[next(iter(stalls))] += 1
+        if stalls:
+            self._multi[k] += 1
+        stalls.add(k)
+
+    def visitors(self, sponsor_oid: ObjectId) -> int:
+        idx = self._index.get(sponsor_oid)
+        return int(self._matrix[idx, idx]) if idx is not None else 0
+
+    def cross_visitors(self, sponsor_oid: ObjectId) -> int:
+        """Visitors of this stall who also scanned at least one other stall."""
+        idx = self._index.get(sponsor_oid)
+        return int(self._multi[idx]) if idx is not None else 0
+
+    def co_visits(self, sponsor_oid: ObjectId, limit: int = 10) -> list[tuple[ObjectId, int]]:
+        """Other stalls ranked by how many of this stall's visitors also went there."""
+        idx = self._index.get(sponsor_oid)
+        if idx is None:
+            return []
+        row = self._matrix[idx, : len(self._sponsors)].copy()
+        row[idx] = 0
+        top = np.argsort(row)[::-1][:limit]
+        return [(self._sponsors[j], int(row[j])) for j in top if row[j] > 0]
+
+
+# Process-wide singleton shared by the routers and the lifespan hook
+covisit_engine = CoVisitEngine()
@@ -0,0 +1,125 @@
+"""
+EventFlow – In-Process Crowd Counter
+Per-sponsor sliding-window scan counts for crowd density ("Low/Medium/High").
+Fed by the scan path and rebuilt from `scanevents` on startup, so crowd
+lookups are in-process reads instead of `count_documents` round trips.
+
+NOTE: Counts live in the worker process. Run a single uvicorn worker (as
+start.sh does) or each worker will only see the scans it handled itself.
+"""
+
+from __future__ import annotations
+
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+BUCKET_SECONDS = 60  # one ring slot per minute
+MAX_WINDOW_MINUTES = 30  # longest window served (heatmap)
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _bucket_of(ts: datetime) -> int:
+    """Epoch bucket index for a timestamp (naive datetimes are treated as UTC)."""
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return int(ts.timestamp()) // BUCKET_SECONDS
+
+
+class _Ring:
+    """Fixed-size ring of per-bucket counts for one sponsor."""
+
+    __slots__ = ("counts", "buckets")
+
+    def __init__(self, size: int):
+        self.counts = [0] * size
+        self.buckets = [-1] * size  # epoch bucket each slot currently holds
+
+
+class SlidingWindowCounter:
+    """
+    Bucketed ring of per-minute scan counts, one ring per sponsor.
+    A slot is lazily reset when its bucket index rolls over, so there is no
+    background expiry task. Reads sum at most `MAX_WINDOW_MINUTES` slots –
+    constant cost regardless of scan volume.
+    """
+
+    def __init__(self, max_window_minutes: int = MAX_WINDOW_MINUTES):
+        self.size = max_window_minutes
+        self.ready = False  # True once seeded from the database
+        self._rings: dict[ObjectId, _Ring] = {}
+
+    def _add(self, sponsor_id: ObjectId, bucket: int, n: int, now_bucket: int) -> None:
+        if bucket > now_bucket or bucket <= now_bucket - self.size:
+            return  # outside every window we serve
+        ring = self._rings.get(sponsor_id)
+        if ring is None:
+            ring = self._rings[sponsor_id] = _Ring(self.size)
+        slot = bucket % self.size
+        if ring.buckets[slot] != bucket:
+            ring.buckets[slot] = bucket
+            ring.counts[slot] = 0
+        ring.counts[slot] += n
+
+    def record(
+        self, sponsor_id: ObjectId, ts: Optional[datetime] = None, n: int = 1
+    ) -> None:
+        """Register `n` scans at this sponsor (defaults to now)."""
+        now_bucket = _bucket_of(datetime.now(timezone.utc))
+        bucket = _bucket_of(ts) if ts is not None else now_bucket
+        self._add(sponsor_id, bucket, n, now_bucket)
+
+    def count(self, sponsor_id: ObjectId, minutes: int = 10) -> int:
+        """Scans at this sponsor in the last N minutes (clamped to the ring size)."""
+        ring = self._rings.get(sponsor_id)
+        if ring is None:
+            return 0
+        minutes = max(1, min(minutes, self.size))
+        now_bucket = _bucket_of(datetime.now(timezone.utc))
+        oldest = now_bucket - minutes + 1
+        return sum(
+            c for c, b in zip(ring.counts, ring.buckets) if oldest <= b <= now_bucket
+        )
+
+    async def rebuild(self, db: AsyncIOMotorDatabase) -> None:
+        """
+        Re-seed every ring from `scanevents` in a single aggregation:
+        one `$match` on timestamp, grouped by (sponsor, minute bucket).
+        """
+        now = datetime.now(timezone.utc)
+        since = now - timedelta(minutes=self.size)
+        pipeline = [
+            {"$match": {"timestamp": {"$gte": since}}},
+            {
+                "$group": {
+                    "_id": {
+                        "sponsor_id": "$sponsor_id",
+                        "bucket": {
+                            "$floor": {
+                                "$divide": [
+                                    {"$subtract": ["$timestamp", _EPOCH]},
+                                    BUCKET_SECONDS * 1000,
+                                ]
+                            }
+                        },
+                    },
+                    "count": {"$sum": 1},
+                }
+            },
+        ]
+        rows = await db.scanevents.aggregate(pipeline).to_list(length=None)
+
+        # Build into a fresh counter and swap, so readers never see a half-seeded ring
+        fresh = SlidingWindowCounter(self.size)
+        now_bucket = _bucket_of(now)
+        for row in rows:
+            key = row["_id"]
+            fresh._add(key["sponsor_id"], int(key["bucket"]), row["count"], now_bucket)
+        self._rings = fresh._rings
+        self.ready = True
+
+
+# Process-wide singleton shared by the routers and the lifespan hook
+crowd_counter = SlidingWindowCounter()
@@ -0,0 +1,200 @@
+"""
+EventFlow – Per-Route MongoDB Command Metrics
+A pymongo CommandListener registered on the Motor client attributes every
+command to the request that issued it, so `/metrics` can show which route
+costs how many round trips, how much DB time and how many documents.
+
+The ASGI middleware opens a per-request tally in a context variable (Motor
+copies the context into its executor threads, where the listener runs) and
+folds it into the route totals when the request ends. Commands issued
+outside a request (heatmap producer, refresher, write-behind flushes) are
+counted under "background".
+
+Each HTTP response carries the request's own tally (set DB_DEBUG_HEADERS=0
+to turn the headers off):
+
+    X-DB-Calls: 3
+    X-DB-Time-Ms: 4.12
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+from contextvars import ContextVar
+from typing import Optional
+
+from pymongo import monitoring
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+BACKGROUND_ROUTE = "background"
+UNMATCHED_ROUTE = "unmatched"
+
+
+class RequestDBStats:
+    """DB work done on behalf of one request."""
+
+    __slots__ = ("calls", "seconds", "docs", "errors", "commands")
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.docs = 0
+        self.errors = 0
+        self.commands: dict[str, list] = {}  # command name → [calls, seconds]
+
+
+class RouteDBStats(RequestDBStats):
+    """Running totals for one route."""
+
+    __slots__ = ("requests",)
+
+    def __init__(self):
+        super().__init__()
+        self.requests = 0
+
+    def add(self, stats: RequestDBStats) -> None:
+        self.calls += stats.calls
+        self.seconds += stats.seconds
+        self.docs += stats.docs
+        self.errors += stats.errors
+        for name, (calls, seconds) in stats.commands.items():
+            entry = self.commands.setdefault(name, [0, 0.0])
+            entry[0] += calls
+            entry[1] += seconds
+
+    def as_dict(self) -> dict:
+        per_request = self.requests or float("inf")  # no averages for background work
+        return {
+            "requests": self.requests,
+            "db_calls": self.calls,
+            "db_time_ms": round(self.seconds * 1000, 2),
+            "docs_returned": self.docs,
+            "db_errors": self.errors,
+            "avg_db_calls": round(self.calls / per_request, 2),
+            "avg_db_time_ms": round(self.seconds * 1000 / per_request, 3),
+            "commands": {
+                name: {"calls": calls, "time_ms": round(seconds * 1000, 2)}
+                for name, (calls, seconds) in sorted(self.commands.items())
+            },
+        }
+
+
+_request_stats: ContextVar[Optional[RequestDBStats]] = ContextVar(
+    "eventflow_request_db_stats", default=None
+)
+
+
+def current_request_stats() -> Optional[RequestDBStats]:
+    """The DB tally of the request being served, if any."""
+    return _request_stats.get()
+
+
+def _docs_returned(reply: dict) -> int:
+    cursor = reply.get("cursor")
+    if cursor is not None:  # find / aggregate / getMore
+        return len(cursor.get("firstBatch") or cursor.get("nextBatch") or ())
+    if "value" in reply:  # findAndModify
+        return 0 if reply["value"] is None else 1
+    if "values" in reply:  # distinct
+        return len(reply["values"])
+    return 0
+
+
+class DBCommandMetrics(monitoring.CommandListener):
+    """Command listener feeding per-route totals; events arrive on Motor's worker threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes: dict[str, RouteDBStats] = {}
+
+    def _record(self, name: str, seconds: float, docs: int, failed: bool) -> None:
+        stats = _request_stats.get()
+        with self._lock:
+            if stats is None:
+                stats = self._route(BACKGROUND_ROUTE)
+            stats.calls += 1
+            stats.seconds += seconds
+            stats.docs += docs
+            stats.errors += failed
+            entry = stats.commands.setdefault(name, [0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+
+    def _route(self, route: str) -> RouteDBStats:
+        totals = self._routes.get(route)
+        if totals is None:
+            totals = self._routes[route] = RouteDBStats()
+        return totals
+
+    # ── CommandListener ──
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        pass
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        self._record(event.command_name, event.duration_micros / 1e6, _docs_returned(event.reply), False)
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        self._record(event.command_name, event.duration_micros / 1e6, 0, True)
+
+    # ── Request lifecycle ──
+
+    def begin(self) -> tuple[RequestDBStats, object]:
+        stats = RequestDBStats()
+        return stats, _request_stats.set(stats)
+
+    def finish(self, route: str, stats: RequestDBStats, token) -> None:
+        _request_stats.reset(token)
+        with self._lock:
+            totals = self._route(route)
+            totals.requests += 1
+            totals.add(stats)
+
+    def stats(self) -> dict:
+        """Per-route totals, most DB time first."""
+        with self._lock:
+            routes = sorted(self._routes.items(), key=lambda kv: kv[1].seconds, reverse=True)
+            return {route: totals.as_dict() for route, totals in routes}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._routes.clear()
+
+
+def route_of(scope: Scope) -> str:
+    """The matched route template (e.g. /api/sponsor/analytics/{stall_id})."""
+    route = scope.get("route")
+    return getattr(route, "path", None) or UNMATCHED_ROUTE
+
+
+class DBMetricsMiddleware:
+    """Pure ASGI middleware: per-request DB tally, debug headers, per-route fold-in."""
+
+    def __init__(self, app: ASGIApp, headers: Optional[bool] = None):
+        self.app = app
+        self.headers = os.getenv("DB_DEBUG_HEADERS", "1") == "1" if headers is None else headers
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        stats, token = db_metrics.begin()
+
+        async def send_with_headers(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers.append("X-DB-Calls", str(stats.calls))
+                headers.append("X-DB-Time-Ms", f"{stats.seconds * 1000:.2f}")
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_headers if self.headers else send)
+        finally:
+            db_metrics.finish(route_of(scope), stats, token)
+
+
+# Process-wide singleton shared by the Motor client, the middleware and /metrics
+db_metrics = DBCommandMetrics()
@@ -0,0 +1,252 @@
+"""
+EventFlow – Heatmap Broadcast Hub
+A single background producer computes one heatmap frame per tick and fans
+it out to every `/api/game/heatmap` subscriber. Frames are serialised
+once per tick; each connection gets a one-slot queue, so a slow consumer
+only ever skips stale frames instead of blocking the producer.
+
+Two wire formats, negotiated per connection:
+
+  json  (default) – the full heatmap list as a text frame every tick.
+  delta (WebSocket subprotocol `eventflow.heatmap.delta.v1`, or
+         ?protocol=delta) – a JSON text *keyframe* mapping each stall to a
+         small integer index with its static fields and current counts,
+         then binary *delta* frames carrying only the counts that changed:
+
+           header  <B I I H   frame type (1), seq, unix seconds, n changes
+           n ×     <H I       stall index, new scan count
+
+         Every frame has a seq; a client that sees a gap waits for the next
+         keyframe. Keyframes are re-sent every KEYFRAME_EVERY_TICKS ticks,
+         whenever the stall list changes, and in place of any delta a slow
+         subscriber would have missed. Crowd levels are derived client-side
+         from the thresholds in the keyframe.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import struct
+from contextlib import suppress
+from datetime import datetime, timezone
+from typing import Optional, Union
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from utils.serialization import dumps
+from utils.stalls import (
+    HIGH_CROWD_THRESHOLD,
+    MEDIUM_CROWD_THRESHOLD,
+    crowd_level,
+    stall_snapshot,
+)
+
+HEATMAP_INTERVAL_SECONDS = 30
+HEATMAP_WINDOW_MINUTES = 30
+KEYFRAME_EVERY_TICKS = 20  # ~10 minutes at the default interval
+
+DELTA_SUBPROTOCOL = "eventflow.heatmap.delta.v1"
+DELTA_FRAME = 1
+DELTA_HEADER = struct.Struct("<BIIH")  # frame type, seq, unix seconds, changed stalls
+DELTA_ENTRY = struct.Struct("<HI")  # stall index, new count
+
+Frame = Union[str, bytes]
+
+
+def build_heatmap(snapshot: list[dict]) -> list[dict]:
+    """Turn a stall snapshot into heatmap points (x/y, count, crowd level)."""
+    data = []
+    for row in snapshot:
+        sp = row["sponsor"]
+        scan_count = row["counts"][HEATMAP_WINDOW_MINUTES]
+        loc = sp.map_location
+        crowd = crowd_level(scan_count)
+
+        data.append(
+            {
+                "stall_id": str(sp.id),
+                "stall_name": sp.company_name,
+                "x": loc.get("x_coord", 0),
+                "y": loc.get("y_coord", 0),
+                "scan_count": scan_count,
+                "crowd_level": crowd,
+                "legendary_available": crowd == "Low",
+            }
+        )
+    return data
+
+
+def apply_delta(counts: list[int], frame: bytes) -> int:
+    """Reference decoder: apply a binary delta frame to `counts` in place; returns its seq."""
+    kind, seq, _, n = DELTA_HEADER.unpack_from(frame)
+    if kind != DELTA_FRAME:
+        raise ValueError(f"Unknown heatmap frame type {kind}")
+    for i, count in DELTA_ENTRY.iter_unpack(frame[DELTA_HEADER.size:DELTA_HEADER.size + n * DELTA_ENTRY.size]):
+        counts[i] = count
+    return seq
+
+
+class HeatmapHub:
+    """Fan-out of pre-serialised heatmap frames to WebSocket subscribers."""
+
+    def __init__(self, interval: float = HEATMAP_INTERVAL_SECONDS):
+        self.interval = interval
+        self.frames_dropped = 0  # stale frames discarded for slow consumers
+        self._subscribers: set[asyncio.Queue[Frame]] = set()
+        self._delta_subscribers: set[asyncio.Queue[Frame]] = set()
+        self._latest: Optional[str] = None
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+        # Delta protocol state
+        self._seq = 0
+        self._index: dict[ObjectId, int] = {}  # stall → small integer
+        self._counts: list[int] = []  # by index, as of the last tick
+        self._keyframe: Optional[str] = None
+        self._ticks_since_keyframe = 0
+
+        # Payload size of the last tick in each format (bytes)
+        self.last_json_bytes = 0
+        self.last_delta_bytes = 0
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers) + len(self._delta_subscribers)
+
+    def subscribe(self, delta: bool = False) -> asyncio.Queue[Frame]:
+        """Register a connection; it receives the latest frame (or keyframe) immediately."""
+        queue: asyncio.Queue[Frame] = asyncio.Queue(maxsize=1)
+        latest = self._keyframe if delta else self._latest
+        if latest is not None:
+            queue.put_nowait(latest)
+        else:
+            self._wake.set()  # hub was idle – produce a frame now
+        (self._delta_subscribers if delta else self._subscribers).add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue[Frame]) -> None:
+        self._subscribers.discard(queue)
+        self._delta_subscribers.discard(queue)
+
+    def _offer(self, queue: asyncio.Queue[Frame], frame: Frame, on_drop: Frame) -> None:
+        if queue.full():
+            with suppress(asyncio.QueueEmpty):
+                queue.get_nowait()
+                self.frames_dropped += 1
+            frame = on_drop
+        queue.put_nowait(frame)
+
+    def publish(self, frame: str) -> None:
+        """Hand a JSON frame to every subscriber, replacing any unsent stale frame."""
+        self._latest = frame
+        for queue in self._subscribers:
+            self._offer(queue, frame, frame)
+
+    def publish_delta(self, frame: Frame) -> None:
+        """
+        Hand a delta (or keyframe) to every delta subscriber. A subscriber
+        whose previous frame is still unsent gets the keyframe instead, since
+        a skipped delta would leave its counts wrong.
+        """
+        for queue in self._delta_subscribers:
+            self._offer(queue, frame, self._keyframe)
+
+    # ── Delta encoding ──
+
+    def _reset_delta_state(self) -> None:
+        self._keyframe = None
+        self._index = {}
+
+    def _build_keyframe(self, heatmap: list[dict], now: datetime) -> str:
+        return dumps(
+            {
+                "type": "keyframe",
+                "seq": self._seq,
+                "timestamp": now,
+                "thresholds": {"medium": MEDIUM_CROWD_THRESHOLD, "high": HIGH_CROWD_THRESHOLD},
+                "stalls": [
+                    {
+                        "i": i,
+                        "stall_id": row["stall_id"],
+                        "stall_name": row["stall_name"],
+                        "x": row["x"],
+                        "y": row["y"],
+                    }
+                    for i, row in enumerate(heatmap)
+                ],
+                "counts": self._counts,
+            }
+        ).decode()
+
+    def _encode_delta(self, snapshot: list[dict], heatmap: list[dict], now: datetime) -> Frame:
+        """Advance the delta state by one tick; returns the frame to publish."""
+        self._seq += 1
+        ids = [row["sponsor"].id for row in snapshot]
+        counts = [row["scan_count"] for row in heatmap]
+
+        if ids != list(self._index) or self._ticks_since_keyframe + 1 >= KEYFRAME_EVERY_TICKS:
+            self._index = {oid: i for i, oid in enumerate(ids)}
+            self._counts = counts
+            self._ticks_since_keyframe = 0
+            self._keyframe = self._build_keyframe(heatmap, now)
+            return self._keyframe
+
+        changed = [(i, n) for i, (n, old) in enumerate(zip(counts, self._counts)) if n != old]
+        frame = bytearray(DELTA_HEADER.pack(DELTA_FRAME, self._seq, int(now.timestamp()), len(changed)))
+        for i, n in changed:
+            frame += DELTA_ENTRY.pack(i, n)
+        self._counts = counts
+        self._ticks_since_keyframe += 1
+        # Late joiners need the current state, not the last periodic keyframe
+        self._keyframe = self._build_keyframe(heatmap, now)
+        return bytes(frame)
+
+    async def _tick(self, db: AsyncIOMotorDatabase) -> None:
+        snapshot = await stall_snapshot(db)
+        heatmap = build_heatmap(snapshot)
+        now = datetime.now(timezone.utc)
+
+        if self._subscribers:
+            frame = dumps({"heatmap": heatmap, "timestamp": now.isoformat()}).decode()
+            self.last_json_bytes = len(frame.encode())
+            self.publish(frame)
+
+        if self._delta_subscribers:
+            delta = self._encode_delta(snapshot, heatmap, now)
+            self.last_delta_bytes = len(delta.encode()) if isinstance(delta, str) else len(delta)
+            self.publish_delta(delta)
+        else:
+            self._reset_delta_state()  # the next delta subscriber starts from a keyframe
+
+    async def _run(self, db: AsyncIOMotorDatabase) -> None:
+        while True:
+            if self.subscriber_count:
+                try:
+                    await self._tick(db)
+                except Exception as exc:
+                    print(f"❌ Heatmap tick failed: {exc}")
+            else:
+                # Nobody listening – don't serve stale data later
+                self._latest = None
+                self._reset_delta_state()
+
+            self._wake.clear()
+            with suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._wake.wait(), timeout=self.interval)
+
+    def start(self, db: AsyncIOMotorDatabase) -> None:
+        """Launch the producer task (called from the app lifespan)."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(db))
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+
+# Process-wide singleton shared by the game router and the lifespan hook
+heatmap_hub = HeatmapHub()
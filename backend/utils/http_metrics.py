@@ -0,0 +1,310 @@
+"""
+EventFlow – Request Timing Metrics
+Pure ASGI middleware keeping, per (method, route template):
+
+  - a latency histogram over fixed log-scale buckets (1 ms … 10 s),
+  - per-status request counters and an in-flight gauge (kept by the
+    `track_in_flight` app dependency, since only routing knows the route),
+
+plus open WebSocket connections per route (e.g. /api/game/heatmap).
+Everything lives in process memory on the event loop thread; no locks.
+
+Requests slower than SLOW_REQUEST_MS (default 500) are logged as one JSON
+line on the `eventflow.slow` logger with their route, status and DB time
+(from utils.db_metrics, whose middleware must wrap this one).
+
+`render_prometheus` exports these together with the per-route DB command
+totals and heatmap hub gauges in the Prometheus text format
+(`GET /metrics?format=prometheus`, or any scraper's Accept header).
+"""
+
+from __future__ import annotations
+
+import logging
+import math
+import os
+import time
+from bisect import bisect_left
+from typing import Optional
+
+from starlette.requests import HTTPConnection
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from utils.db_metrics import current_request_stats, db_metrics, route_of
+from utils.heatmap import heatmap_hub
+from utils.serialization import dumps
+
+# Upper bounds in seconds: 1-2.5-5 steps per decade; the last bucket is +Inf
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_slow_log = logging.getLogger("eventflow.slow")
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram (bucket i counts LATENCY_BUCKETS[i-1] < t <= LATENCY_BUCKETS[i])."""
+
+    __slots__ = ("counts", "count", "sum")
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-quantile (None past the last bound)."""
+        if not self.count:
+            return None
+        rank = math.ceil(q * self.count)
+        seen = 0
+        for bound, n in zip(LATENCY_BUCKETS, self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return None
+
+
+class RouteHTTPStats:
+    __slots__ = ("latency", "in_flight", "statuses")
+
+    def __init__(self):
+        self.latency = LatencyHistogram()
+        self.in_flight = 0
+        self.statuses: dict[int, int] = {}
+
+
+class RouteWebSocketStats:
+    __slots__ = ("active", "accepted")
+
+    def __init__(self):
+        self.active = 0
+        self.accepted = 0
+
+
+class RequestMetrics:
+    """Per-route latency histograms, in-flight gauges and WebSocket counts."""
+
+    def __init__(self, slow_request_ms: float = 500):
+        self.slow_request_ms = slow_request_ms
+        self._http: dict[tuple[str, str], RouteHTTPStats] = {}
+        self._websockets: dict[str, RouteWebSocketStats] = {}
+
+    @classmethod
+    def from_env(cls) -> "RequestMetrics":
+        return cls(slow_request_ms=float(os.getenv("SLOW_REQUEST_MS", "500")))
+
+    def http_route(self, method: str, route: str) -> RouteHTTPStats:
+        stats = self._http.get((method, route))
+        if stats is None:
+            stats = self._http[(method, route)] = RouteHTTPStats()
+        return stats
+
+    def websocket_route(self, route: str) -> RouteWebSocketStats:
+        stats = self._websockets.get(route)
+        if stats is None:
+            stats = self._websockets[route] = RouteWebSocketStats()
+        return stats
+
+    def finish(self, method: str, route: str, path: str, status: int, seconds: float) -> None:
+        stats = self.http_route(method, route)
+        stats.latency.observe(seconds)
+        stats.statuses[status] = stats.statuses.get(status, 0) + 1
+
+        if seconds * 1000 >= self.slow_request_ms:
+            db = current_request_stats()
+            _slow_log.warning(
+                dumps(
+                    {
+                        "event": "slow_request",
+                        "method": method,
+                        "route": route,
+                        "path": path,
+                        "status": status,
+                        "duration_ms": round(seconds * 1000, 1),
+                        "db_time_ms": round(db.seconds * 1000, 1) if db else None,
+                        "db_calls": db.calls if db else None,
+                    }
+                ).decode()
+            )
+
+    def stats(self) -> dict:
+        def ms(seconds: Optional[float]) -> Optional[float]:
+            return None if seconds is None else round(seconds * 1000, 3)
+
+        return {
+            "slow_request_ms": self.slow_request_ms,
+            "http": {
+                f"{method} {route}": {
+                    "requests": s.latency.count,
+                    "in_flight": s.in_flight,
+                    "statuses": {str(code): n for code, n in sorted(s.statuses.items())},
+                    "avg_ms": round(s.latency.sum * 1000 / s.latency.count, 2) if s.latency.count else None,
+                    "p50_ms": ms(s.latency.quantile(0.50)),
+                    "p95_ms": ms(s.latency.quantile(0.95)),
+                    "p99_ms": ms(s.latency.quantile(0.99)),
+                }
+                for (method, route), s in sorted(self._http.items(), key=lambda kv: kv[0][::-1])
+            },
+            "websockets": {
+                route: {"active": s.active, "accepted": s.accepted}
+                for route, s in sorted(self._websockets.items())
+            },
+        }
+
+    def reset(self) -> None:
+        self._http.clear()
+        self._websockets.clear()
+
+
+class RequestMetricsMiddleware:
+    """Pure ASGI middleware feeding `request_metrics`."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http":
+            await self._http(scope, receive, send)
+        elif scope["type"] == "websocket":
+            await self._websocket(scope, receive, send)
+        else:
+            await self.app(scope, receive, send)
+
+    async def _http(self, scope: Scope, receive: Receive, send: Send) -> None:
+        status = 500  # if the app raises before responding
+        started = time.perf_counter()
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            request_metrics.finish(
+                scope["method"], route_of(scope), scope["path"], status, time.perf_counter() - started
+            )
+
+    async def _websocket(self, scope: Scope, receive: Receive, send: Send) -> None:
+        stats: Optional[RouteWebSocketStats] = None
+
+        async def send_with_accept(message: Message) -> None:
+            nonlocal stats
+            if message["type"] == "websocket.accept" and stats is None:
+                stats = request_metrics.websocket_route(route_of(scope))  # routed by now
+                stats.active += 1
+                stats.accepted += 1
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_accept)
+        finally:
+            if stats is not None:
+                stats.active -= 1
+
+
+async def track_in_flight(connection: HTTPConnection):
+    """
+    App-wide dependency keeping the per-route in-flight gauge. It runs once
+    the request is routed, which the middleware only learns afterwards.
+    """
+    if connection.scope["type"] != "http":
+        yield
+        return
+    stats = request_metrics.http_route(connection.scope["method"], route_of(connection.scope))
+    stats.in_flight += 1
+    try:
+        yield
+    finally:
+        stats.in_flight -= 1
+
+
+# ──────────────────────── Prometheus export ───────────────────────────
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels) -> str:
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def _header(lines: list[str], name: str, kind: str, help_text: str) -> None:
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} {kind}")
+
+
+def render_prometheus() -> str:
+    """All request, WebSocket, DB and heatmap metrics in the Prometheus text format."""
+    lines: list[str] = []
+    http = sorted(request_metrics._http.items())
+
+    name = "eventflow_http_request_duration_seconds"
+    _header(lines, name, "histogram", "HTTP request latency by route.")
+    for (method, route), s in http:
+        cumulative = 0
+        for bound, n in zip(LATENCY_BUCKETS, s.latency.counts):
+            cumulative += n
+            lines.append(f"{name}_bucket{_labels(method=method, route=route, le=bound)} {cumulative}")
+        lines.append(f"{name}_bucket{_labels(method=method, route=route, le='+Inf')} {s.latency.count}")
+        lines.append(f"{name}_sum{_labels(method=method, route=route)} {s.latency.sum:.6f}")
+        lines.append(f"{name}_count{_labels(method=method, route=route)} {s.latency.count}")
+
+    name = "eventflow_http_requests_total"
+    _header(lines, name, "counter", "HTTP requests by route and status.")
+    for (method, route), s in http:
+        for status, n in sorted(s.statuses.items()):
+            lines.append(f"{name}{_labels(method=method, route=route, status=status)} {n}")
+
+    name = "eventflow_http_requests_in_flight"
+    _header(lines, name, "gauge", "HTTP requests currently being served.")
+    for (method, route), s in http:
+        lines.append(f"{name}{_labels(method=method, route=route)} {s.in_flight}")
+
+    websockets = sorted(request_metrics._websockets.items())
+    name = "eventflow_websocket_connections"
+    _header(lines, name, "gauge", "Open WebSocket connections by route.")
+    for route, s in websockets:
+        lines.append(f"{name}{_labels(route=route)} {s.active}")
+    name = "eventflow_websocket_connections_total"
+    _header(lines, name, "counter", "Accepted WebSocket connections by route.")
+    for route, s in websockets:
+        lines.append(f"{name}{_labels(route=route)} {s.accepted}")
+
+    db = db_metrics.stats()
+    for name, kind, help_text, field in (
+        ("eventflow_db_commands_total", "counter", "MongoDB commands by route and command.", "calls"),
+        ("eventflow_db_command_seconds_total", "counter", "MongoDB command time by route and command.", "time_ms"),
+    ):
+        _header(lines, name, kind, help_text)
+        for route, totals in db.items():
+            for command, c in totals["commands"].items():
+                value = c[field] / 1000 if field == "time_ms" else c[field]
+                lines.append(f"{name}{_labels(route=route, command=command)} {value}")
+    for name, help_text, field in (
+        ("eventflow_db_docs_returned_total", "Documents returned by MongoDB by route.", "docs_returned"),
+        ("eventflow_db_command_errors_total", "Failed MongoDB commands by route.", "db_errors"),
+    ):
+        _header(lines, name, "counter", help_text)
+        for route, totals in db.items():
+            lines.append(f"{name}{_labels(route=route)} {totals[field]}")
+
+    _header(lines, "eventflow_heatmap_subscribers", "gauge", "Heatmap hub subscribers.")
+    lines.append(f"eventflow_heatmap_subscribers {heatmap_hub.subscriber_count}")
+    _header(lines, "eventflow_heatmap_frames_dropped_total", "counter", "Stale heatmap frames skipped for slow consumers.")
+    lines.append(f"eventflow_heatmap_frames_dropped_total {heatmap_hub.frames_dropped}")
+
+    return "\n".join(lines) + "\n"
+
+
+# Process-wide singleton shared by the middleware and /metrics
+request_metrics = RequestMetrics.from_env()
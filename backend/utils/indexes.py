@@ -0,0 +1,222 @@
+"""
+EventFlow – Index Spec
+Every index the backend relies on, declared in one place and applied
+idempotently by the app lifespan (creating an index that already exists
+with the same spec is a no-op), so a fresh deployment never runs without
+them.
+
+QUERY_SHAPES lists each query shape the routers and hot-path helpers
+issue. `check` runs `explain` on every one and fails on any COLLSCAN:
+
+    cd backend && python -m utils.indexes check   # apply the spec, then explain
+    cd backend && python -m utils.indexes apply
+
+Startup loads (catalog refresh, leaderboard seed, co-visit rebuild,
+backfills) read whole collections on purpose and are not listed.
+"""
+
+from __future__ import annotations
+
+from datetime import datetime, timezone
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+from utils.leaderboard import USER_PROJECTION
+
+INDEXES: dict[str, list[IndexModel]] = {
+    "users": [
+        # Leaderboard fallback sort and my-rank "users ahead of me" count
+        IndexModel([("wallet.total_points", DESCENDING), ("_id", ASCENDING)]),
+    ],
+    "scanevents": [
+        # Per-stall analytics, wait times, visitor counts
+        IndexModel([("sponsor_id", ASCENDING), ("timestamp", DESCENDING)]),
+        # my-history keyset pagination on (timestamp, _id), newest first
+        IndexModel([("student_id", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)]),
+        # Crowd windows: timestamp-only range match across all stalls
+        IndexModel([("timestamp", DESCENDING)]),
+        # Idempotent offline-scan replay (/scan/batch)
+        IndexModel([("idempotency_key", ASCENDING)], unique=True, sparse=True),
+    ],
+    "redemptions": [
+        IndexModel([("voucher_code", ASCENDING)], unique=True),
+        IndexModel([("idempotency_key", ASCENDING)], unique=True, sparse=True),
+    ],
+    "scan_rollups": [
+        # One bucket document per (sponsor, granularity, bucket start)
+        IndexModel(
+            [("sponsor_id", ASCENDING), ("granularity", ASCENDING), ("bucket", ASCENDING)],
+            unique=True,
+        ),
+        # Compaction: minute buckets older than the horizon
+        IndexModel([("granularity", ASCENDING), ("bucket", ASCENDING)]),
+    ],
+}
+
+
+async def ensure_indexes(db: AsyncIOMotorDatabase) -> list[str]:
+    """Create every index in the spec; returns a message per collection that failed."""
+    failures = []
+    for collection, models in INDEXES.items():
+        try:
+            await db[collection].create_indexes(models)
+        except Exception as exc:
+            failures.append(f"{collection}: {exc}")
+    return failures
+
+
+# ──────────────────────── Query shapes ────────────────────────────────
+
+_OID = ObjectId()
+_NOW = datetime.now(timezone.utc)
+
+# (name, command) – any values work, explain only plans the query
+QUERY_SHAPES: list[tuple[str, dict]] = [
+    ("leaderboard fallback", {
+        "aggregate": "users",
+        "pipeline": [
+            {"$sort": {"wallet.total_points": -1, "_id": 1}},
+            {"$skip": 0},
+            {"$limit": 50},
+            {"$project": USER_PROJECTION},
+        ],
+        "cursor": {},
+    }),
+    ("my-rank users ahead", {
+        "count": "users", "query": {"wallet.total_points": {"$gt": 100}},
+    }),
+    ("first user (demo fallback)", {
+        "find": "users", "filter": {}, "sort": {"_id": 1}, "limit": 1,
+    }),
+    ("redeem wallet guard", {
+        "findAndModify": "users",
+        "query": {"_id": _OID, "wallet.total_points": {"$gte": 50}},
+        "update": {"$inc": {"wallet.total_points": -50}},
+        "new": True,
+    }),
+    ("redeem stock guard", {
+        "findAndModify": "rewards",
+        "query": {"_id": _OID, "stock_remaining": {"$gt": 0}},
+        "update": {"$inc": {"stock_remaining": -1}},
+        "new": True,
+    }),
+    ("my-history page", {
+        "find": "scanevents",
+        "filter": {
+            "student_id": _OID,
+            "$or": [{"timestamp": {"$lt": _NOW}}, {"timestamp": _NOW, "_id": {"$lt": _OID}}],
+        },
+        "sort": {"timestamp": -1, "_id": -1},
+        "limit": 51,
+    }),
+    ("scan visitor count fallback", {
+        "count": "scanevents", "query": {"sponsor_id": _OID},
+    }),
+    ("stall analytics", {
+        "aggregate": "scanevents",
+        "pipeline": [{"$match": {"sponsor_id": _OID}}, {"$group": {"_id": None, "n": {"$sum": 1}}}],
+        "cursor": {},
+    }),
+    ("wait-time stream", {
+        "aggregate": "scanevents",
+        "pipeline": [{"$match": {"sponsor_id": _OID}}, {"$sort": {"timestamp": 1}}],
+        "cursor": {},
+    }),
+    ("cross-pollination visitors", {
+        "distinct": "scanevents", "key": "student_id", "query": {"sponsor_id": _OID},
+    }),
+    ("cross-pollination other stalls", {
+        "aggregate": "scanevents",
+        "pipeline": [
+            {"$match": {"student_id": {"$in": [_OID]}}},
+            {"$group": {"_id": "$student_id", "stalls": {"$addToSet": "$sponsor_id"}}},
+        ],
+        "cursor": {},
+    }),
+    ("crowd window counts", {
+        "aggregate": "scanevents",
+        "pipeline": [
+            {"$match": {"timestamp": {"$gte": _NOW}}},
+            {"$group": {"_id": "$sponsor_id", "n": {"$sum": 1}}},
+        ],
+        "cursor": {},
+    }),
+    ("voucher lookup", {
+        "find": "redemptions", "filter": {"voucher_code": "EF-00000000", "status": "issued"},
+    }),
+    ("redeem idempotency replay", {
+        "find": "redemptions", "filter": {"idempotency_key": "retry-key"},
+    }),
+    ("hourly traffic", {
+        "aggregate": "scan_rollups",
+        "pipeline": [{"$match": {"sponsor_id": _OID}}, {"$group": {"_id": {"$hour": "$bucket"}}}],
+        "cursor": {},
+    }),
+    ("rollup compaction", {
+        "find": "scan_rollups", "filter": {"granularity": "minute", "bucket": {"$lt": _NOW}},
+    }),
+]
+
+
+def _collscans(node) -> bool:
+    """Whether a winning plan (in any explain format) contains a COLLSCAN stage."""
+    if isinstance(node, dict):
+        if node.get("stage") == "COLLSCAN":
+            return True
+        return any(_collscans(v) for v in node.values())
+    if isinstance(node, list):
+        return any(_collscans(v) for v in node)
+    return False
+
+
+def _winning_plans(explain):
+    if isinstance(explain, dict):
+        for key, value in explain.items():
+            if key == "winningPlan":
+                yield value
+            else:
+                yield from _winning_plans(value)
+    elif isinstance(explain, list):
+        for value in explain:
+            yield from _winning_plans(value)
+
+
+async def check_query_shapes(db: AsyncIOMotorDatabase) -> list[str]:
+    """Explain every query shape; returns the names of those that COLLSCAN."""
+    offenders = []
+    for name, command in QUERY_SHAPES:
+        explain = await db.command({"explain": command, "verbosity": "queryPlanner"})
+        if any(_collscans(plan) for plan in _winning_plans(explain)):
+            offenders.append(name)
+    return offenders
+
+
+if __name__ == "__main__":
+    import asyncio
+    import sys
+
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    from database import DB_NAME, MONGODB_URI
+
+    async def _main() -> int:
+        db = AsyncIOMotorClient(MONGODB_URI).get_database(DB_NAME)
+        if sys.argv[1:] not in (["apply"], ["check"]):
+            print("Usage: python -m utils.indexes [apply|check]")
+            return 2
+
+        failures = await ensure_indexes(db)
+        for failure in failures:
+            print(f"❌ Index creation failed – {failure}")
+        if sys.argv[1] == "apply":
+            print("✅ Index spec applied" if not failures else "")
+            return 1 if failures else 0
+
+        offenders = await check_query_shapes(db)
+        for name, _ in QUERY_SHAPES:
+            print(f"{'❌ COLLSCAN' if name in offenders else '✅ indexed '}  {name}")
+        return 1 if offenders or failures else 0
+
+    sys.exit(asyncio.run(_main()))
@@ -0,0 +1,142 @@
+"""
+EventFlow – In-Memory Leaderboard
+Users ranked by wallet points in an order-statistic structure (SortedList),
+seeded from MongoDB at startup and updated by the scan and redeem paths
+after their wallet writes succeed. Pages are O(log n + k) and a single
+user's rank is O(log n), with no `$sort` over `users` per request.
+
+NOTE: Like the crowd counter, this lives in the worker process – run a
+single uvicorn worker or each worker will only see its own updates.
+"""
+
+from __future__ import annotations
+
+from typing import Optional
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from sortedcontainers import SortedList
+
+# Server-side projection: pokemon_count via $size so the pokedex array never ships
+USER_PROJECTION = {
+    "name": 1,
+    "points": {"$ifNull": ["$wallet.total_points", 0]},
+    "legendaries_caught": {"$ifNull": ["$wallet.legendaries_caught", 0]},
+    "pokemon_count": {"$size": {"$ifNull": ["$pokedex", []]}},
+}
+
+
+class _Entry:
+    __slots__ = ("user_id", "name", "points", "pokemon_count", "legendaries_caught")
+
+    def __init__(
+        self,
+        user_id: ObjectId,
+        name: str,
+        points: int,
+        pokemon_count: int,
+        legendaries_caught: int,
+    ):
+        self.user_id = user_id
+        self.name = name
+        self.points = points
+        self.pokemon_count = pokemon_count
+        self.legendaries_caught = legendaries_caught
+
+    @property
+    def key(self) -> tuple[int, ObjectId]:
+        # Highest points first; ties broken by user id for a stable order
+        return (-self.points, self.user_id)
+
+    def as_dict(self, rank: int) -> dict:
+        return {
+            "rank": rank,
+            "user_id": str(self.user_id),
+            "name": self.name,
+            "points": self.points,
+            "pokemon_count": self.pokemon_count,
+            "legendaries_caught": self.legendaries_caught,
+        }
+
+
+def _entry_from_row(row: dict) -> _Entry:
+    return _Entry(
+        user_id=row["_id"],
+        name=row.get("name", "Unknown"),
+        points=row.get("points", 0),
+        pokemon_count=row.get("pokemon_count", 0),
+        legendaries_caught=row.get("legendaries_caught", 0),
+    )
+
+
+class Leaderboard:
+    """Ranked users; `_ranked` holds (-points, user_id) keys in rank order."""
+
+    def __init__(self):
+        self.ready = False  # True once seeded from the database
+        self._entries: dict[ObjectId, _Entry] = {}
+        self._ranked: SortedList = SortedList()
+
+    async def load(self, db: AsyncIOMotorDatabase) -> None:
+        """Seed from every user in one aggregation."""
+        rows = await db.users.aggregate([{"$project": USER_PROJECTION}]).to_list(length=None)
+        entries = {row["_id"]: _entry_from_row(row) for row in rows}
+        self._entries = entries
+        self._ranked = SortedList(e.key for e in entries.values())
+        self.ready = True
+
+    async def refresh_user(self, db: AsyncIOMotorDatabase, user_oid: ObjectId) -> None:
+        """Re-read one user's authoritative totals (e.g. a user created after startup)."""
+        rows = await db.users.aggregate(
+            [{"$match": {"_id": user_oid}}, {"$project": USER_PROJECTION}]
+        ).to_list(length=1)
+        old = self._entries.pop(user_oid, None)
+        if old is not None:
+            self._ranked.remove(old.key)
+        if rows:
+            entry = _entry_from_row(rows[0])
+            self._entries[user_oid] = entry
+            self._ranked.add(entry.key)
+
+    async def apply(
+        self,
+        db: AsyncIOMotorDatabase,
+        user_oid: ObjectId,
+        points: int = 0,
+        legendaries: int = 0,
+        pokemon: int = 0,
+    ) -> None:
+        """Apply a wallet change that has already been written to MongoDB."""
+        if not self.ready:
+            return
+        entry = self._entries.get(user_oid)
+        if entry is None:
+            await self.refresh_user(db, user_oid)  # already includes this change
+            return
+        if points:
+            self._ranked.remove(entry.key)
+            entry.points += points
+            self._ranked.add(entry.key)
+        entry.legendaries_caught += legendaries
+        entry.pokemon_count += pokemon
+
+    def page(self, offset: int = 0, limit: int = 50) -> list[dict]:
+        """Ranked entries [offset, offset + limit)."""
+        return [
+            self._entries[user_id].as_dict(offset + i + 1)
+            for i, (_, user_id) in enumerate(self._ranked.islice(offset, offset + limit))
+        ]
+
+    def rank_of(self, user_oid: ObjectId) -> Optional[dict]:
+        """A single user's entry with its 1-based rank, or None if unknown."""
+        entry = self._entries.get(user_oid)
+        if entry is None:
+            return None
+        return entry.as_dict(self._ranked.index(entry.key) + 1)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+# Process-wide singleton shared by the routers and the lifespan hook
+ranking = Leaderboard()
@@ -0,0 +1,286 @@
+"""
+EventFlow – On-Demand Profiling
+Admin-only profiling of the running server, off unless ADMIN_TOKEN is set
+(the middleware is then not even installed, so it costs nothing).
+
+Single request – send `X-Admin-Token` plus `X-Profile: sample|cprofile`
+(or `?_profile=sample|cprofile`). The response carries `X-Profile-Id`;
+fetch the profile from `GET /api/admin/profiles/{id}` (JSON, or
+`?format=folded` for flame-graph tools such as speedscope):
+
+  sample   – a thread samples the event loop thread's stack every
+             PROFILE_INTERVAL_MS; low overhead, statistical.
+  cprofile – deterministic cProfile of the event loop thread; exact call
+             counts, but slows the request several-fold.
+
+Process-wide – `POST /api/admin/profile?seconds=10` samples the event loop
+for a fixed window and also returns every asyncio task's stack.
+
+Both modes observe the whole event loop thread, so work for other requests
+in flight at the same time shows up too; profile on a quiet instance.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import cProfile
+import io
+import os
+import pstats
+import secrets
+import sys
+import sysconfig
+import threading
+import time
+from collections import Counter, OrderedDict
+from datetime import datetime, timezone
+from typing import Optional
+
+from starlette.datastructures import MutableHeaders
+from starlette.requests import HTTPConnection
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from auth import ADMIN_TOKEN, is_admin
+
+PROFILE_INTERVAL_MS = 2
+MAX_PROFILE_SECONDS = 60
+MAX_STORED_PROFILES = 50
+TOP_FUNCTIONS = 40
+PROFILE_MODES = ("sample", "cprofile")
+
+
+def profiling_enabled() -> bool:
+    return bool(ADMIN_TOKEN)
+
+
+_STDLIB = sysconfig.get_paths()["stdlib"] + os.sep
+
+
+def _short(filename: str) -> str:
+    """Path relative to site-packages / the stdlib / the backend, for readable frames."""
+    for marker in ("site-packages/", "backend/"):
+        i = filename.rfind(marker)
+        if i != -1:
+            return filename[i + len(marker):]
+    if filename.startswith(_STDLIB):
+        return filename[len(_STDLIB):]
+    return filename
+
+
+def _frame_label(code) -> str:
+    return f"{code.co_name} ({_short(code.co_filename)}:{code.co_firstlineno})"
+
+
+# ──────────────────────── Sampling profiler ───────────────────────────
+
+
+class StackSampler:
+    """Samples one thread's Python stack from a background thread."""
+
+    def __init__(self, thread_id: int, interval_ms: float = PROFILE_INTERVAL_MS):
+        self.thread_id = thread_id
+        self.interval = interval_ms / 1000
+        self.samples = 0
+        self._stacks: Counter[tuple[str, ...]] = Counter()
+        self._labels: dict[object, str] = {}  # code object → label, computed once
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="eventflow-profiler", daemon=True)
+
+    def _run(self) -> None:
+        labels = self._labels
+        while not self._done.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                label = labels.get(code)
+                if label is None:
+                    label = labels[code] = _frame_label(code)
+                stack.append(label)
+                frame = frame.f_back
+            del frame
+            if stack:
+                stack.reverse()
+                self._stacks[tuple(stack)] += 1
+                self.samples += 1
+
+    def start(self) -> "StackSampler":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._done.set()
+        self._thread.join()
+
+    def folded(self) -> str:
+        """Collapsed stacks (`root;…;leaf count`), the flame-graph input format."""
+        return "\n".join(f"{';'.join(stack)} {n}" for stack, n in self._stacks.most_common())
+
+    def top(self, limit: int = TOP_FUNCTIONS) -> list[dict]:
+        """Functions by samples on-CPU (self) and on the stack (total)."""
+        own: Counter[str] = Counter()
+        total: Counter[str] = Counter()
+        for stack, n in self._stacks.items():
+            own[stack[-1]] += n
+            for label in set(stack):
+                total[label] += n
+        return [
+            {"function": label, "self": own[label], "total": n}
+            for label, n in total.most_common(limit)
+        ]
+
+    def result(self) -> dict:
+        return {
+            "samples": self.samples,
+            "interval_ms": self.interval * 1000,
+            "top": self.top(),
+            "folded": self.folded(),
+        }
+
+
+def cprofile_result(profiler: cProfile.Profile) -> dict:
+    out = io.StringIO()
+    stats = pstats.Stats(profiler, stream=out)
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(TOP_FUNCTIONS)
+    return {"calls": stats.total_calls, "stats": out.getvalue()}
+
+
+# ──────────────────────── asyncio task stacks ─────────────────────────
+
+
+def task_stacks(limit: int = 20) -> list[dict]:
+    """Every pending task on the running loop with its (await) stack, innermost last."""
+    tasks = []
+    for task in asyncio.all_tasks():
+        coro = task.get_coro()
+        tasks.append(
+            {
+                "name": task.get_name(),
+                "coro": getattr(coro, "__qualname__", repr(coro)),
+                "stack": [
+                    f"{_frame_label(frame.f_code)} line {frame.f_lineno}"
+                    for frame in task.get_stack(limit=limit)
+                ],
+            }
+        )
+    return sorted(tasks, key=lambda t: t["coro"])
+
+
+async def sample_process(seconds: float, interval_ms: float = PROFILE_INTERVAL_MS) -> dict:
+    """Sample the event loop thread for `seconds`, then snapshot task stacks."""
+    started_at = datetime.now(timezone.utc)
+    sampler = StackSampler(threading.get_ident(), interval_ms).start()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        sampler.stop()
+    return profile_store.add(
+        {
+            "kind": "sample",
+            "scope": "process",
+            "started_at": started_at,
+            "duration_ms": round(seconds * 1000),
+            **sampler.result(),
+            "tasks": task_stacks(),
+        }
+    )
+
+
+# ──────────────────────── Storage ─────────────────────────────────────
+
+
+class ProfileStore:
+    """The most recent profiles, by id (oldest evicted first)."""
+
+    def __init__(self, max_entries: int = MAX_STORED_PROFILES):
+        self.max_entries = max_entries
+        self._profiles: OrderedDict[str, dict] = OrderedDict()
+
+    def add(self, profile: dict) -> dict:
+        profile["id"] = secrets.token_hex(6)
+        self._profiles[profile["id"]] = profile
+        while len(self._profiles) > self.max_entries:
+            self._profiles.popitem(last=False)
+        return profile
+
+    def get(self, profile_id: str) -> Optional[dict]:
+        return self._profiles.get(profile_id)
+
+    def list(self) -> list[dict]:
+        keys = ("id", "kind", "scope", "method", "path", "status", "started_at", "duration_ms")
+        return [
+            {k: p[k] for k in keys if k in p}
+            for p in reversed(self._profiles.values())
+        ]
+
+
+# ──────────────────────── Per-request middleware ──────────────────────
+
+
+def _requested_mode(scope: Scope) -> Optional[str]:
+    connection = HTTPConnection(scope)
+    mode = connection.headers.get("x-profile") or connection.query_params.get("_profile")
+    if mode not in PROFILE_MODES or not is_admin(connection.headers.get("x-admin-token")):
+        return None
+    return mode
+
+
+class ProfilingMiddleware:
+    """Profiles requests flagged with X-Profile (admins only); installed only when enabled."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self._busy = False  # one profiled request at a time (cProfile can't nest)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        mode = _requested_mode(scope) if scope["type"] == "http" and not self._busy else None
+        if mode is None:
+            await self.app(scope, receive, send)
+            return
+        self._busy = True
+
+        profile = {
+            "kind": mode,
+            "scope": "request",
+            "method": scope["method"],
+            "path": scope["path"],
+            "started_at": datetime.now(timezone.utc),
+        }
+        started = time.perf_counter()
+        if mode == "sample":
+            profiler = StackSampler(threading.get_ident()).start()
+        else:
+            profiler = cProfile.Profile()
+            profiler.enable()
+
+        def finish(status: int) -> None:
+            nonlocal profiler
+            if profiler is None:
+                return
+            elapsed = time.perf_counter() - started
+            if mode == "sample":
+                profiler.stop()
+                profile.update(profiler.result())
+            else:
+                profiler.disable()
+                profile.update(cprofile_result(profiler))
+            profiler = None
+            self._busy = False
+            profile["status"] = status
+            profile["duration_ms"] = round(elapsed * 1000, 2)
+            profile_store.add(profile)
+
+        async def send_with_profile(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                finish(message["status"])  # the handler's work, not the body transfer
+                MutableHeaders(scope=message).append("X-Profile-Id", profile["id"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_profile)
+        finally:
+            finish(500)
+
+
+# Process-wide singleton shared by the middleware and the admin router
+profile_store = ProfileStore()
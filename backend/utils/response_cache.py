@@ -0,0 +1,91 @@
+"""
+EventFlow – Route Response Cache
+Decorator that caches an async route handler's result per route, keyed by
+its (selected) arguments, with a per-route TTL, bounded LRU and request
+coalescing from TTLCache. Write paths call `invalidate` with the route
+names whose data they change.
+
+    @router.get("/stalls")
+    @response_cache.cached("stalls", ttl=5)
+    async def list_stalls(window: int = Query(...)): ...
+
+NOTE: Cached per worker process; invalidation only reaches the worker
+that handled the write.
+"""
+
+from __future__ import annotations
+
+import functools
+import inspect
+from typing import Any, Awaitable, Callable, Optional
+
+from utils.cache import TTLCache
+
+
+class ResponseCache:
+    def __init__(self):
+        self._routes: dict[str, TTLCache] = {}
+
+    def cached(
+        self,
+        name: str,
+        ttl: float,
+        stale_ttl: float = 0,
+        max_entries: int = 256,
+        vary: Optional[tuple[str, ...]] = None,
+    ) -> Callable:
+        """
+        Cache the decorated coroutine under `name`. `vary` lists the argument
+        names that make up the cache key (default: all of them) – leave out
+        per-caller arguments the result does not depend on.
+        """
+        if name in self._routes:
+            raise ValueError(f"Response cache '{name}' is already registered")
+        cache = TTLCache(ttl=ttl, max_entries=max_entries, stale_ttl=stale_ttl)
+        self._routes[name] = cache
+
+        def decorator(func: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+            signature = inspect.signature(func)
+
+            # functools.wraps keeps the signature FastAPI reads for params
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                bound = signature.bind(*args, **kwargs)
+                bound.apply_defaults()
+                key = tuple(
+                    (arg, value)
+                    for arg, value in bound.arguments.items()
+                    if vary is None or arg in vary
+                )
+                return await cache.get_or_compute(key, lambda: func(*args, **kwargs))
+
+            return wrapper
+
+        return decorator
+
+    def invalidate(self, *names: str) -> None:
+        """Expire every entry of the named routes (stale-while-revalidate routes keep serving)."""
+        for name in names:
+            cache = self._routes.get(name)
+            if cache is not None:
+                cache.expire()
+
+    def stats(self) -> dict:
+        return {
+            name: {
+                "entries": len(cache),
+                "hits": cache.hits,
+                "misses": cache.misses,
+                "ttl": cache.ttl,
+                "stale_ttl": cache.stale_ttl,
+            }
+            for name, cache in self._routes.items()
+        }
+
+
+# Process-wide singleton shared by the routers
+response_cache = ResponseCache()
+
+# Routes whose results change when a scan or a redemption lands
+SCAN_AFFECTED_ROUTES = ("stalls", "notifications", "leaderboard", "stats")
+REDEEM_AFFECTED_ROUTES = ("leaderboard",)
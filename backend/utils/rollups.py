@@ -0,0 +1,282 @@
+"""
+EventFlow – Scan Rollups
+Materialised per-sponsor time buckets in `scan_rollups`, so time-series
+views (hourly traffic, peak hour) never re-aggregate raw `scanevents`.
+
+Each bucket document:
+    {sponsor_id, granularity: "minute" | "hour", bucket: <bucket start, UTC>,
+     count, rarity: {Normal, Legendary}, flash_sale, majors: {<major>: n}}
+
+Minute buckets are maintained with `$inc` upserts from the scan paths and
+compacted into hour buckets once they are COMPACT_AFTER old. Scans that
+arrive later than that (offline replay) go straight to the hour bucket.
+
+Backfill from existing scans with: cd backend && python -m utils.rollups backfill
+"""
+
+from __future__ import annotations
+
+import asyncio
+from contextlib import suppress
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Optional
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+
+COMPACT_AFTER = timedelta(hours=2)
+COMPACT_INTERVAL_SECONDS = 15 * 60
+
+
+def _as_utc(ts: datetime) -> datetime:
+    return ts.replace(tzinfo=timezone.utc) if ts.tzinfo is None else ts.astimezone(timezone.utc)
+
+
+def _field(name: str) -> str:
+    """Majors become field names – strip characters MongoDB reserves."""
+    return name.replace(".", "_").replace("$", "_") or "Unknown"
+
+
+def _bucket_key(ts: datetime, now: datetime) -> tuple[str, datetime]:
+    ts = _as_utc(ts)
+    if now - ts >= COMPACT_AFTER:
+        return "hour", ts.replace(minute=0, second=0, microsecond=0)
+    return "minute", ts.replace(second=0, microsecond=0)
+
+
+class ScanRollups:
+    """Keeps each user's major in process so scan paths can $inc it without a lookup."""
+
+    def __init__(self):
+        self._majors: dict[ObjectId, str] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    async def load_majors(self, db: AsyncIOMotorDatabase) -> None:
+        users = await db.users.find({}, {"demographics.major": 1}).to_list(length=None)
+        self._majors = {
+            u["_id"]: _field(u.get("demographics", {}).get("major") or "Unknown")
+            for u in users
+        }
+
+    async def _major_of(self, db: AsyncIOMotorDatabase, student_oid: Optional[ObjectId]) -> str:
+        if student_oid is None:
+            return "Unknown"
+        major = self._majors.get(student_oid)
+        if major is None:
+            user = await db.users.find_one({"_id": student_oid}, {"demographics.major": 1})
+            major = _field((user or {}).get("demographics", {}).get("major") or "Unknown")
+            self._majors[student_oid] = major
+        return major
+
+    async def record(self, db: AsyncIOMotorDatabase, scan_docs: Iterable[dict]) -> None:
+        """
+        `$inc` the buckets for a set of scan events, coalesced to one upsert
+        per (sponsor, bucket) and written with a single bulk_write.
+        """
+        now = datetime.now(timezone.utc)
+        incs: dict[tuple, dict[str, int]] = {}
+        for doc in scan_docs:
+            granularity, bucket = _bucket_key(doc["timestamp"], now)
+            key = (doc["sponsor_id"], granularity, bucket)
+            inc = incs.setdefault(key, {})
+            major = await self._major_of(db, doc.get("student_id"))
+            rarity = _field(doc["pokemon_caught"]["rarity"])
+            for field in ("count", f"rarity.{rarity}", f"majors.{major}"):
+                inc[field] = inc.get(field, 0) + 1
+            if doc.get("is_flash_sale"):
+                inc["flash_sale"] = inc.get("flash_sale", 0) + 1
+
+        if not incs:
+            return
+        ops = [
+            UpdateOne(
+                {"sponsor_id": sponsor_oid, "granularity": granularity, "bucket": bucket},
+                {"$inc": inc},
+                upsert=True,
+            )
+            for (sponsor_oid, granularity, bucket), inc in incs.items()
+        ]
+        await db.scan_rollups.bulk_write(ops, ordered=False)
+
+    # ── Compaction ──
+
+    async def compact(self, db: AsyncIOMotorDatabase) -> int:
+        """
+        Fold minute buckets older than COMPACT_AFTER into their hour bucket.
+        Hour buckets are `$inc`ed first, then each minute bucket is `$inc`ed
+        down by exactly what was folded and deleted once it reads zero, so
+        a late `$inc` landing on a minute bucket mid-compaction stays in it
+        for the next pass instead of being lost. A crash before the minute
+        buckets are decremented over-counts that hour rather than losing it.
+        Returns the number of minute buckets compacted.
+        """
+        cutoff = datetime.now(timezone.utc) - COMPACT_AFTER
+        minutes = await db.scan_rollups.find(
+            {"granularity": "minute", "bucket": {"$lt": cutoff}}
+        ).to_list(length=None)
+        if not minutes:
+            return 0
+
+        incs: dict[tuple, dict[str, int]] = {}
+        folded: list[tuple[ObjectId, dict[str, int]]] = []
+        for doc in minutes:
+            counts = {"count": doc.get("count", 0), "flash_sale": doc.get("flash_sale", 0)}
+            for group in ("rarity", "majors"):
+                for name, n in doc.get(group, {}).items():
+                    counts[f"{group}.{name}"] = n
+            folded.append((doc["_id"], counts))
+            hour = _as_utc(doc["bucket"]).replace(minute=0)
+            inc = incs.setdefault((doc["sponsor_id"], hour), {})
+            for field, n in counts.items():
+                inc[field] = inc.get(field, 0) + n
+
+        await db.scan_rollups.bulk_write(
+            [
+                UpdateOne(
+                    {"sponsor_id": sponsor_oid, "granularity": "hour", "bucket": hour},
+                    {"$inc": inc},
+                    upsert=True,
+                )
+                for (sponsor_oid, hour), inc in incs.items()
+            ],
+            ordered=False,
+        )
+        await db.scan_rollups.bulk_write(
+            [
+                UpdateOne({"_id": oid}, {"$inc": {field: -n for field, n in counts.items()}})
+                for oid, counts in folded
+            ],
+            ordered=False,
+        )
+        await db.scan_rollups.delete_many(
+            {"granularity": "minute", "bucket": {"$lt": cutoff}, "count": {"$lte": 0}}
+        )
+        return len(minutes)
+
+    async def _run(self, db: AsyncIOMotorDatabase) -> None:
+        while True:
+            try:
+                await self.compact(db)
+            except Exception as exc:
+                print(f"❌ Rollup compaction failed: {exc}")
+            await asyncio.sleep(COMPACT_INTERVAL_SECONDS)
+
+    def start(self, db: AsyncIOMotorDatabase) -> None:
+        """Launch the periodic compactor (called from the app lifespan)."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(db))
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+    # ── Backfill ──
+
+    async def backfill(self, db: AsyncIOMotorDatabase) -> int:
+        """
+        Rebuild every bucket from `scanevents` (idempotent: the collection is
+        replaced, not incremented). Run it with scans paused – live `$inc`s
+        landing mid-backfill are lost. Returns the number of buckets written.
+        """
+        await self.load_majors(db)
+        now = datetime.now(timezone.utc)
+        pipeline = [
+            {
+                "$group": {
+                    "_id": {
+                        "sponsor_id": "$sponsor_id",
+                        "student_id": "$student_id",
+                        "minute": {
+                            "$dateFromParts": {
+                                "year": {"$year": "$timestamp"},
+                                "month": {"$month": "$timestamp"},
+                                "day": {"$dayOfMonth": "$timestamp"},
+                                "hour": {"$hour": "$timestamp"},
+                                "minute": {"$minute": "$timestamp"},
+                            }
+                        },
+                        "rarity": "$pokemon_caught.rarity",
+                        "flash": "$is_flash_sale",
+                    },
+                    "count": {"$sum": 1},
+                }
+            }
+        ]
+        buckets: dict[tuple, dict] = {}
+        async for row in db.scanevents.aggregate(pipeline, allowDiskUse=True):
+            key = row["_id"]
+            granularity, bucket = _bucket_key(key["minute"], now)
+            doc = buckets.setdefault(
+                (key["sponsor_id"], granularity, bucket),
+                {"count": 0, "rarity": {}, "flash_sale": 0, "majors": {}},
+            )
+            n = row["count"]
+            rarity = _field(key.get("rarity") or "Normal")
+            major = self._majors.get(key.get("student_id"), "Unknown")
+            doc["count"] += n
+            doc["rarity"][rarity] = doc["rarity"].get(rarity, 0) + n
+            doc["majors"][major] = doc["majors"].get(major, 0) + n
+            if key.get("flash"):
+                doc["flash_sale"] += n
+
+        await db.scan_rollups.delete_many({})
+        if buckets:
+            await db.scan_rollups.insert_many(
+                [
+                    {"sponsor_id": sponsor_oid, "granularity": granularity, "bucket": bucket, **doc}
+                    for (sponsor_oid, granularity, bucket), doc in buckets.items()
+                ],
+                ordered=False,
+            )
+        return len(buckets)
+
+    async def hourly(self, db: AsyncIOMotorDatabase, sponsor_oid: ObjectId) -> list[dict]:
+        """24 hour-of-day bars (UTC) for a stall, summed over minute + hour buckets."""
+        pipeline = [
+            {"$match": {"sponsor_id": sponsor_oid}},
+            {
+                "$group": {
+                    "_id": {"$hour": "$bucket"},
+                    "count": {"$sum": "$count"},
+                    "legendary": {"$sum": {"$ifNull": ["$rarity.Legendary", 0]}},
+                    "flash_sale": {"$sum": {"$ifNull": ["$flash_sale", 0]}},
+                }
+            },
+        ]
+        rows = {r["_id"]: r for r in await db.scan_rollups.aggregate(pipeline).to_list(length=24)}
+        return [
+            {
+                "hour": hour,
+                "count": rows.get(hour, {}).get("count", 0),
+                "legendary": rows.get(hour, {}).get("legendary", 0),
+                "flash_sale": rows.get(hour, {}).get("flash_sale", 0),
+            }
+            for hour in range(24)
+        ]
+
+
+# Process-wide singleton shared by the routers and the lifespan hook
+scan_rollups = ScanRollups()
+
+
+if __name__ == "__main__":
+    import sys
+
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    from database import DB_NAME, MONGODB_URI
+
+    async def _main() -> None:
+        db = AsyncIOMotorClient(MONGODB_URI).get_database(DB_NAME)
+        if sys.argv[1:] == ["backfill"]:
+            print(f"✅ Backfilled {await scan_rollups.backfill(db)} rollup buckets")
+        elif sys.argv[1:] == ["compact"]:
+            print(f"✅ Compacted {await scan_rollups.compact(db)} minute buckets")
+        else:
+            print("Usage: python -m utils.rollups [backfill|compact]")
+
+    asyncio.run(_main())
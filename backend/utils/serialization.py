@@ -0,0 +1,54 @@
+"""
+EventFlow – BSON-Aware JSON Encoding
+orjson-backed encoder that writes MongoDB documents straight to JSON bytes:
+ObjectId → hex string, datetime → ISO 8601 (orjson-native), Pydantic
+models → their fields. `FastJSONResponse` is the app's default response
+class; hot list endpoints return it directly with raw documents or dicts,
+which skips per-row model construction and `response_model` re-validation.
+
+Run the per-item cost comparison with: cd backend && python -m benchmarks.serialization
+"""
+
+from __future__ import annotations
+
+from typing import Any
+
+import orjson
+from bson import ObjectId
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+_OPTIONS = orjson.OPT_SERIALIZE_NUMPY
+
+
+def _default(obj: Any) -> Any:
+    """Types orjson does not know natively; called only for those."""
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, BaseModel):
+        return obj.model_dump()
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def dumps(obj: Any) -> bytes:
+    """Encode documents, models and plain values to UTF-8 JSON bytes."""
+    return orjson.dumps(obj, default=_default, option=_OPTIONS)
+
+
+def dumps_line(obj: Any) -> bytes:
+    """One NDJSON line."""
+    return orjson.dumps(obj, default=_default, option=_OPTIONS | orjson.OPT_APPEND_NEWLINE)
+
+
+def to_jsonable(doc: Any) -> Any:
+    """A JSON-safe copy of a document (for callers that need a dict, not bytes)."""
+    return orjson.loads(dumps(doc))
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with the BSON-aware orjson encoder."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -0,0 +1,83 @@
+"""
+EventFlow – Stall Snapshot
+One shared view of every stall with its recent scan counts, used by the
+stall map, notifications and the live heatmap. Costs a constant number of
+database round trips no matter how many stalls exist.
+"""
+
+from __future__ import annotations
+
+from datetime import datetime, timedelta, timezone
+from typing import Iterable
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from utils.catalog import sponsor_cache
+from utils.crowd import crowd_counter
+
+SNAPSHOT_WINDOWS = (10, 30)  # minutes – map/notifications and heatmap
+MEDIUM_CROWD_THRESHOLD = 5
+HIGH_CROWD_THRESHOLD = 20
+
+
+def crowd_level(scan_count: int) -> str:
+    """Map a recent scan count to "Low" | "Medium" | "High"."""
+    if scan_count < MEDIUM_CROWD_THRESHOLD:
+        return "Low"
+    if scan_count < HIGH_CROWD_THRESHOLD:
+        return "Medium"
+    return "High"
+
+
+async def _aggregate_counts(
+    db: AsyncIOMotorDatabase, windows: list[int]
+) -> dict[ObjectId, dict[int, int]]:
+    """
+    Per-sponsor counts for every window in one pass: a single `$match` on the
+    widest window, then one conditional `$sum` per window inside `$group`.
+    """
+    now = datetime.now(timezone.utc)
+    since = {w: now - timedelta(minutes=w) for w in windows}
+    pipeline = [
+        {"$match": {"timestamp": {"$gte": since[max(windows)]}}},
+        {
+            "$group": {
+                "_id": "$sponsor_id",
+                **{
+                    f"w{w}": {
+                        "$sum": {"$cond": [{"$gte": ["$timestamp", since[w]]}, 1, 0]}
+                    }
+                    for w in windows
+                },
+            }
+        },
+    ]
+    rows = await db.scanevents.aggregate(pipeline).to_list(length=None)
+    return {row["_id"]: {w: row[f"w{w}"] for w in windows} for row in rows}
+
+
+async def stall_snapshot(
+    db: AsyncIOMotorDatabase, windows: Iterable[int] = SNAPSHOT_WINDOWS
+) -> list[dict]:
+    """
+    Load every sponsor once and attach its scan count for each window.
+
+    Returns a list of {"sponsor": <SponsorRecord>, "counts": {minutes: count}}.
+    Sponsors come from the in-process catalog.
+    Counts come from the in-process crowd counter once it is seeded; until
+    then (e.g. the startup rebuild failed) they fall back to one aggregation.
+    """
+    windows = sorted(set(windows))
+    sponsors = await sponsor_cache.all(db)
+
+    if crowd_counter.ready:
+        counts = {
+            sp.id: {w: crowd_counter.count(sp.id, w) for w in windows}
+            for sp in sponsors
+        }
+    else:
+        counts = await _aggregate_counts(db, windows)
+
+    empty = {w: 0 for w in windows}
+    return [{"sponsor": sp, "counts": counts.get(sp.id, empty)} for sp in sponsors]
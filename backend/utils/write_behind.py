@@ -0,0 +1,231 @@
+"""
+EventFlow – Scan Write-Behind Buffer
+Optional group-commit mode for the scan path. Scan events are queued in
+process and flushed with one `insert_many` every SCAN_FLUSH_INTERVAL_MS or
+SCAN_FLUSH_MAX_DOCS documents; wallet `$inc`s for the same user within a
+flush are coalesced into a single update.
+
+Enable with SCAN_WRITE_BEHIND=1. Trade-off: a scan is acknowledged before
+it is durable, and reads (e.g. /my-history) may lag by one flush window.
+Anything still queued is flushed on shutdown by the lifespan hook.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+from typing import Optional
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from utils.counters import event_counters
+from utils.leaderboard import ranking
+from utils.rollups import scan_rollups
+
+DUPLICATE_KEY_ERROR = 11000
+_STOP = None  # queue sentinel: flush everything before it, then exit
+
+
+class _Pending:
+    __slots__ = ("doc", "enqueued_at")
+
+    def __init__(self, doc: dict):
+        self.doc = doc
+        self.enqueued_at = time.monotonic()
+
+
+class ScanWriteBuffer:
+    """Bounded queue of scan events flushed in groups by a background task."""
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        flush_interval_ms: int = 50,
+        flush_max_docs: int = 500,
+        max_queue: int = 10_000,
+    ):
+        self.enabled = enabled
+        self.flush_interval = flush_interval_ms / 1000
+        self.flush_max_docs = flush_max_docs
+        self.max_queue = max_queue
+        self._queue: Optional[asyncio.Queue[Optional[_Pending]]] = None
+        self._task: Optional[asyncio.Task] = None
+        self._db: Optional[AsyncIOMotorDatabase] = None
+
+        # Metrics
+        self.flushes = 0
+        self.docs_flushed = 0
+        self.flush_errors = 0
+        self.last_flush_size = 0
+        self.max_flush_size = 0
+        self.last_lag_ms = 0.0  # oldest doc in the last flush: enqueue → durable
+        self.max_lag_ms = 0.0
+
+    @classmethod
+    def from_env(cls) -> "ScanWriteBuffer":
+        return cls(
+            enabled=os.getenv("SCAN_WRITE_BEHIND", "0") == "1",
+            flush_interval_ms=int(os.getenv("SCAN_FLUSH_INTERVAL_MS", "50")),
+            flush_max_docs=int(os.getenv("SCAN_FLUSH_MAX_DOCS", "500")),
+            max_queue=int(os.getenv("SCAN_QUEUE_MAX", "10000")),
+        )
+
+    @property
+    def active(self) -> bool:
+        return self.enabled and self._task is not None
+
+    async def submit(self, scan_doc: dict) -> None:
+        """Queue a scan event; waits (backpressure) while the queue is full."""
+        await self._queue.put(_Pending(scan_doc))
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "queue_max": self.max_queue,
+            "flushes": self.flushes,
+            "docs_flushed": self.docs_flushed,
+            "flush_errors": self.flush_errors,
+            "last_flush_size": self.last_flush_size,
+            "max_flush_size": self.max_flush_size,
+            "avg_flush_size": round(self.docs_flushed / self.flushes, 1) if self.flushes else 0,
+            "last_lag_ms": round(self.last_lag_ms, 1),
+            "max_lag_ms": round(self.max_lag_ms, 1),
+        }
+
+    # ── Flushing ──
+
+    async def _collect(self) -> tuple[list[_Pending], bool]:
+        """
+        Wait for one doc, then gather more until the window or size cap is hit.
+        Returns the batch and whether the stop sentinel was reached.
+        """
+        first = await self._queue.get()
+        if first is _STOP:
+            return [], True
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.flush_max_docs:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    async def _flush(self, batch: list[_Pending]) -> None:
+        docs = [p.doc for p in batch]
+        try:
+            await self._db.scanevents.insert_many(docs, ordered=False)
+        except BulkWriteError as exc:
+            # _ids are client-generated, so a duplicate means already written
+            if any(
+                err.get("code") != DUPLICATE_KEY_ERROR
+                for err in exc.details.get("writeErrors", [])
+            ):
+                raise
+
+        # Coalesce wallet/pokedex credit: one update per user per flush
+        credit: dict[ObjectId, dict] = {}
+        for doc in docs:
+            student_oid = doc.get("student_id")
+            if not student_oid:
+                continue
+            entry = credit.setdefault(student_oid, {"points": 0, "legendaries": 0, "ids": []})
+            entry["points"] += doc["points_awarded"]
+            entry["legendaries"] += doc["pokemon_caught"]["rarity"] == "Legendary"
+            entry["ids"].append(doc["_id"])
+
+        if credit:
+            ops = []
+            for student_oid, entry in credit.items():
+                inc = {"wallet.total_points": entry["points"]}
+                if entry["legendaries"]:
+                    inc["wallet.legendaries_caught"] = entry["legendaries"]
+                ops.append(
+                    UpdateOne(
+                        {"_id": student_oid},
+                        {"$inc": inc, "$push": {"pokedex": {"$each": entry["ids"]}}},
+                    )
+                )
+            try:
+                await self._db.users.bulk_write(ops, ordered=False)
+            except Exception as exc:
+                self.flush_errors += 1
+                print(f"❌ Write-behind wallet update failed: {exc}")
+            else:
+                for student_oid, entry in credit.items():
+                    await ranking.apply(
+                        self._db,
+                        student_oid,
+                        points=entry["points"],
+                        legendaries=entry["legendaries"],
+                        pokemon=len(entry["ids"]),
+                    )
+
+        try:
+            await asyncio.gather(
+                scan_rollups.record(self._db, docs),
+                event_counters.record(self._db, docs),
+            )
+        except Exception as exc:
+            self.flush_errors += 1
+            print(f"❌ Write-behind rollup/counter update failed: {exc}")
+
+        lag_ms = (time.monotonic() - batch[0].enqueued_at) * 1000
+        self.flushes += 1
+        self.docs_flushed += len(docs)
+        self.last_flush_size = len(docs)
+        self.max_flush_size = max(self.max_flush_size, len(docs))
+        self.last_lag_ms = lag_ms
+        self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+
+    async def _flush_with_retry(self, batch: list[_Pending], attempts: int = 3) -> None:
+        for attempt in range(1, attempts + 1):
+            try:
+                await self._flush(batch)
+                return
+            except Exception as exc:
+                self.flush_errors += 1
+                print(f"❌ Write-behind flush failed (attempt {attempt}/{attempts}): {exc}")
+                await asyncio.sleep(self.flush_interval * attempt)
+        print(f"❌ Write-behind dropped {len(batch)} scan events after {attempts} attempts")
+
+    async def _run(self) -> None:
+        while True:
+            batch, stopping = await self._collect()
+            if batch:
+                await self._flush_with_retry(batch)
+            if stopping:
+                return
+
+    # ── Lifecycle ──
+
+    def start(self, db: AsyncIOMotorDatabase) -> None:
+        """Launch the flusher task (called from the app lifespan when enabled)."""
+        if not self.enabled or self._task is not None:
+            return
+        self._db = db
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Write out everything still queued, then stop the flusher."""
+        if self._task is None:
+            return
+        task, self._task = self._task, None  # new scans go the direct path from here
+        await self._queue.put(_STOP)
+        await task
+
+
+# Process-wide singleton shared by the game router and the lifespan hook
+scan_buffer = ScanWriteBuffer.from_env()
@@ -1,11 +1,15 @@
 #!/usr/bin/env python3
-"""Quick smoke-test for all EventFlow API endpoints."""
+"""Quick smoke-test for all EventFlow API endpoints.
+
+For load (throughput, latency percentiles, error rates) use the async
+harness instead: cd backend && python -m benchmarks.load
+"""
 import urllib.request
 import json
 import sys
 import os
 
-BASE = "http://localhost:8000"
+BASE = os.getenv("EVENTFLOW_URL", "http://localhost:8000")
 results = {}
 
 def get(path):
@@ -44,7 +48,7 @@ data, err = get("/api/store/rewards")
 results["rewards"] = f"OK – {len(data)} items" if data else f"FAIL – {err}"
 
 # Write results
-out_path = "/home/nikshaan/DevCraft-PR2N/test_results.txt"
+out_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "test_results.txt")
 with open(out_path, "w") as f:
     for k, v in results.items():
         f.write(f"{k:20s} {v}\n")
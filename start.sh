@@ -61,6 +61,10 @@ if [ "$1" = "--seed" ] || [ "$2" = "--seed" ]; then
     echo ""
     echo "🌱 Seeding MongoDB Atlas database..."
     python3 Flow-Data/populate_db.py
+    echo "📊 Backfilling scan rollups..."
+    (cd backend && python3 -m utils.rollups backfill)
+    echo "🔢 Rebuilding homepage counters..."
+    (cd backend && python3 -m utils.counters rebuild)
     echo ""
 fi
 